@@ -0,0 +1,73 @@
+"""Compares dispatching get requests for an example resource through the HTTP server
+with controllers which are constructed per request and with a single controller
+instance, and counts the request, response, path and controller objects each
+request allocates."""
+
+import sys
+
+import harness
+
+from mesh.constants import GET, OK, URLENCODED
+from mesh.standard.mock import MockController, MockStorage
+from mesh.transport.http import HttpRequest, HttpResponse, HttpServer, Path
+from fixtures import Example, primary_bundle
+
+NUMBER = 10000
+
+class Allocations(object):
+    """Counts the instances of hooked classes which are constructed, and their size."""
+
+    def __init__(self):
+        self.counts = {}
+        self.sizes = {}
+
+    def hook(self, label, cls):
+        counts, sizes = self.counts, self.sizes
+        counts.setdefault(label, 0)
+        sizes.setdefault(label, 0)
+
+        def __new__(subclass, *args, **params):
+            instance = object.__new__(subclass)
+            counts[label] += 1
+            sizes[label] += sys.getsizeof(instance)
+            return instance
+        cls.__new__ = staticmethod(__new__)
+
+    def reset(self):
+        for label in self.counts:
+            self.counts[label] = self.sizes[label] = 0
+
+def construct_server(storage, reusable, allocations):
+    def mount_controller(mount):
+        mount.controller = MockController.construct(mount.resource, storage)
+        mount.controller.reusable = reusable
+        allocations.hook('controller', mount.controller)
+        return mount
+
+    return HttpServer([primary_bundle.clone(callback=mount_controller)])
+
+if __name__ == '__main__':
+    allocations = Allocations()
+    for label, cls in (('request', HttpRequest), ('response', HttpResponse), ('path', Path)):
+        allocations.hook(label, cls)
+
+    storage = MockStorage(':memory:')
+    path = '/primary/1.0/example/%d' % storage.save(Example, {'required_field': 'text'})
+
+    for reusable in (None, 'singleton'):
+        server = construct_server(storage, reusable, allocations)
+
+        def dispatch():
+            response = server.dispatch(GET, path, URLENCODED, {}, {}, None)
+            assert response.status == OK, (response.status, response.content)
+
+        dispatch()
+        allocations.reset()
+        for i in range(NUMBER):
+            dispatch()
+
+        harness.measure('get, reusable = %r' % reusable, dispatch, NUMBER)
+        for label in sorted(allocations.counts):
+            print('%-48s %10.2f objects, %6.1f bytes' % ('  %s allocations per request'
+                % label, allocations.counts[label] / float(NUMBER),
+                allocations.sizes[label] / float(NUMBER)))
@@ -0,0 +1,40 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+Each script is run directly from the repository root, as in
+``python benchmarks/routing.py``, and prints one line per measurement.
+"""
+
+import os
+import sys
+from timeit import default_timer, repeat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'tests')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def measure(label, function, number=1000, repetitions=5):
+    """Calls ``function`` ``number`` times in each of ``repetitions`` runs, and
+    prints the best time per call."""
+
+    best = min(repeat(function, number=number, repeat=repetitions)) / number
+    if best >= 0.001:
+        print('%-48s %10.3f ms' % (label, best * 1000))
+    else:
+        print('%-48s %10.3f us' % (label, best * 1000000))
+    return best
+
+def throughput(label, function, size, repetitions=3):
+    """Calls ``function`` once in each of ``repetitions`` runs, and prints the best
+    rate at which it processed ``size`` bytes."""
+
+    best = None
+    for i in range(repetitions):
+        start = default_timer()
+        function()
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    print('%-48s %10.1f MB/s' % (label, size / best / 1048576))
+    return best
@@ -0,0 +1,50 @@
+"""Compares filtered, sorted queries evaluated in SQL against an indexed mock storage
+with the same queries evaluated in Python against a plain one. The number of
+resources can be given as the first argument."""
+
+import sys
+
+import harness
+
+from mesh.constants import OK
+from mesh.standard.mock import MockStorage, mock_bundle
+from mesh.transport.internal import InternalServer
+from fixtures import Example, primary_bundle
+
+ENDPOINT = ('primary/1.0/example', 'query')
+
+# each query has an offset, so that the plain storage evaluates it afresh every
+# time rather than continuing from a cached index
+QUERIES = [
+    ('equality filter', {'query': {'integer_field': 7}, 'offset': 10, 'limit': 50}),
+    ('range filter, sorted', {'query': {'integer_field__gte': 100, 'integer_field__lt': 200},
+        'sort': ['required_field-'], 'offset': 10, 'limit': 50}),
+    ('sorted on two fields', {'sort': ['integer_field', 'required_field-'],
+        'offset': 1000, 'limit': 50}),
+]
+
+def construct_server(count, indexed):
+    storage = MockStorage(':memory:', indexed=indexed)
+    storage.save_many(Example, [{'required_field': 'text%d' % (i % 997),
+        'integer_field': i % 1000, 'text_field': 'x' * 64} for i in range(count)],
+        creating=True)
+    return InternalServer([mock_bundle(primary_bundle, storage)])
+
+def construct_query(server, data):
+    def query():
+        response = server.dispatch(ENDPOINT, {}, None, dict(data))
+        assert response.status == OK, (response.status, response.content)
+        return response.content
+    return query
+
+if __name__ == '__main__':
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 50000)
+    servers = [('python', construct_server(count, False)),
+        ('sql', construct_server(count, True))]
+
+    for label, data in QUERIES:
+        queries = [(name, construct_query(server, data)) for name, server in servers]
+        assert queries[0][1]() == queries[1][1]()
+
+        for name, query in queries:
+            harness.measure('%s, %s' % (label, name), query, 5, 3)
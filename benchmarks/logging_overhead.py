@@ -0,0 +1,52 @@
+"""Measures the per-request cost of logging in the dispatch path, by timing a
+WSGI update request with a large payload with logging at INFO and at VERBOSE.
+The eager rendering which the dispatch path used to do at every level is timed
+separately, for comparison."""
+
+import logging
+import os
+from cStringIO import StringIO
+
+import harness
+
+from mesh.constants import OK
+from mesh.transport.http import HttpServer
+from mesh.util import DEBUG_LEVEL_VERBOSE
+from scheme.util import format_structure
+from fixtures import primary_bundle, storage
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+server = HttpServer([primary_bundle])
+payload = {'sequence_field': range(20000), 'text_field': 'x' * 65536}
+body = json.dumps(payload)
+
+def update():
+    environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/primary/1.0/example/1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'QUERY_STRING': '', 'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': StringIO(body)}
+
+    statuses = []
+    server(environ, lambda status, headers: statuses.append(status))
+    assert statuses[0].startswith('200'), statuses
+
+def render():
+    '%s %s' % (str(body), format_structure(payload, abbreviate=True))
+
+if __name__ == '__main__':
+    storage.reset()
+    response = server.dispatch('POST', '/primary/1.0/example', 'application/json', {}, {},
+        json.dumps({'required_field': 'text'}))
+    assert response.status == OK
+
+    root = logging.getLogger()
+    root.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+    print('payload of %d bytes' % len(body))
+
+    for name, level in (('INFO', logging.INFO), ('VERBOSE', DEBUG_LEVEL_VERBOSE)):
+        root.setLevel(level)
+        harness.measure('update at %s' % name, update, 20)
+    harness.measure('eager rendering of the payload', render, 20)
@@ -0,0 +1,41 @@
+"""Measures filtering and sorting in-memory resources the way MockController does
+for queries it cannot serve from an index. The number of resources can be given
+as the first argument."""
+
+import sys
+
+import harness
+
+from fixtures import ExampleController
+
+FILTERS = [
+    ('equality', {'integer_field': 7}),
+    ('range and null', {'integer_field__gte': 10, 'integer_field__lt': 500,
+        'text_field__null': False}),
+    ('prefix and membership', {'text_field__iprefix': 'text1', 'text_field__null': False,
+        'integer_field__in': [1, 2, 3, 5, 8, 13]}),
+]
+
+SORTS = [
+    ('one field', ['integer_field']),
+    ('two fields', ['integer_field', 'text_field']),
+    ('two fields, mixed', ['integer_field-', 'text_field']),
+]
+
+def construct_resources(count):
+    return [{'id': i, 'integer_field': i % 1000,
+        'text_field': ('Text%d' % (i % 7919)) if i % 10 else None} for i in range(count)]
+
+if __name__ == '__main__':
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 200000)
+    controller, resources = ExampleController(), construct_resources(count)
+
+    for label, query in FILTERS:
+        def evaluate():
+            predicate = controller._compile_query(query)
+            return [resource for resource in resources if predicate(resource)]
+        harness.measure('filter %d, %s' % (count, label), evaluate, 1, 3)
+
+    for label, sorting in SORTS:
+        harness.measure('sort %d, %s' % (count, label),
+            lambda: controller._sort_resources(resources, sorting), 1, 3)
@@ -0,0 +1,69 @@
+"""Measures the throughput of parsing a multipart/mixed upload with a single large
+attachment, which is spooled to a temporary file as it is parsed. The size of
+the attachment, in megabytes, can be given as the first argument."""
+
+import os
+import sys
+
+import harness
+
+from mesh.transport.multipart import parse_multipart_mixed
+
+BOUNDARY = 'a4a6a5d3cc2e4ef0a1b0c1d2e3f4a5b6'
+BLOCK = os.urandom(1048576)
+
+class UploadStream(object):
+    """A file-like object producing the body of an upload of ``size`` bytes without
+    holding it in memory, in reads of at most ``readsize`` bytes as a socket would."""
+
+    def __init__(self, size, readsize=65536):
+        self.pending = ''
+        self.readsize = readsize
+        self.remaining = size
+        self.header = ('--%s\r\nContent-Disposition: inline\r\n'
+            'Content-Type: application/json\r\n\r\n{}\r\n--%s\r\n'
+            'Content-Disposition: attachment; name="file"\r\n\r\n' % (BOUNDARY, BOUNDARY))
+        self.trailer = '\r\n--%s--\r\n' % BOUNDARY
+
+    def read(self, size=-1):
+        if size < 0 or size > self.readsize:
+            size = self.readsize
+        if self.pending:
+            chunk, self.pending = self.pending[:size], self.pending[size:]
+            return chunk
+        if self.header:
+            chunk, self.header = self.header[:size], self.header[size:]
+            return chunk
+        if self.remaining:
+            offset = self.remaining % len(BLOCK)
+            chunk = BLOCK[offset:offset + min(size, self.remaining)]
+            self.remaining -= len(chunk)
+            return chunk
+        chunk, self.trailer = self.trailer[:size], self.trailer[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        line = ''
+        while True:
+            chunk = self.read()
+            if not chunk:
+                return line
+            end = chunk.find('\n')
+            if end >= 0:
+                self.pending = chunk[end + 1:] + self.pending
+                return line + chunk[:end + 1]
+            line += chunk
+
+def construct_parse(size):
+    def parse():
+        payload = parse_multipart_mixed(UploadStream(size),
+            'multipart/mixed; boundary=%s' % BOUNDARY)
+        try:
+            assert payload.files['file'].size == size
+        finally:
+            payload.cleanup()
+    return parse
+
+if __name__ == '__main__':
+    size = int(sys.argv[1] if len(sys.argv) > 1 else 1024) * 1048576
+    harness.throughput('parse %d MB attachment' % (size / 1048576), construct_parse(size), size)
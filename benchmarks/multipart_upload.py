@@ -0,0 +1,81 @@
+"""Measures the throughput of uploading a large attachment through
+Connection._send_multipart_request to a local server which discards the body.
+The size of the attachment, in megabytes, can be given as the first argument."""
+
+import os
+import socket
+import sys
+from httplib import HTTPConnection
+from tempfile import mkstemp
+from threading import Thread
+
+import harness
+
+from mesh.transport.http import Connection
+from mesh.transport.multipart import MultipartEncoder, MultipartPayload
+from scheme.formats import Json
+
+def discard(listener):
+    while True:
+        connection = listener.accept()[0]
+        stream = connection.makefile('rb')
+        try:
+            length = 0
+            while True:
+                line = stream.readline()
+                if line.lower().startswith('content-length:'):
+                    length = int(line.split(':', 1)[1])
+                if line in ('\r\n', ''):
+                    break
+
+            while length > 0:
+                chunk = stream.read(min(length, 1048576))
+                if not chunk:
+                    break
+                length -= len(chunk)
+            connection.sendall('HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        finally:
+            stream.close()
+            connection.close()
+
+def construct_upload(port, filename):
+    client = Connection('http://127.0.0.1:%d' % port)
+
+    def upload():
+        payload = MultipartPayload({'name': 'upload'})
+        payload.attach('file', filename)
+
+        encoder = MultipartEncoder(payload, Json)
+        connection = HTTPConnection('127.0.0.1', port)
+        try:
+            client._send_multipart_request(connection, 'POST', '/upload', encoder,
+                encoder.headers)
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 200
+        finally:
+            connection.close()
+    return upload
+
+if __name__ == '__main__':
+    size = int(sys.argv[1] if len(sys.argv) > 1 else 2048) * 1048576
+
+    handle, filename = mkstemp()
+    try:
+        block = os.urandom(1048576)
+        for i in range(size / len(block)):
+            os.write(handle, block)
+        os.close(handle)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+
+        server = Thread(target=discard, args=(listener,))
+        server.setDaemon(True)
+        server.start()
+
+        upload = construct_upload(listener.getsockname()[1], filename)
+        harness.throughput('upload %d MB attachment' % (size / 1048576), upload, size)
+    finally:
+        os.unlink(filename)
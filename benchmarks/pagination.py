@@ -0,0 +1,48 @@
+"""Compares fetching a deep page of a sorted query through a cursor with fetching
+it through an offset, against a mock storage of example resources. The number of
+resources can be given as the first argument."""
+
+import sys
+
+import harness
+
+from mesh.constants import OK
+from mesh.standard.mock import MockStorage, mock_bundle
+from mesh.transport.internal import InternalServer
+from fixtures import Example, primary_bundle
+
+ENDPOINT = ('primary/1.0/example', 'query')
+LIMIT = 50
+SORTING = ['integer_field-', 'required_field']
+
+def construct_server(count):
+    storage = MockStorage(':memory:')
+    storage.save_many(Example, [{'required_field': 'text%d' % (i % 97),
+        'integer_field': i % 13} for i in range(count)], creating=True)
+    return InternalServer([mock_bundle(primary_bundle, storage)])
+
+def query(server, **params):
+    data = dict(params, sort=SORTING, limit=LIMIT)
+    response = server.dispatch(ENDPOINT, {}, None, data)
+    assert response.status == OK, (response.status, response.content)
+    return response.content
+
+def locate_cursor(server, page):
+    params = {}
+    for i in range(page):
+        params['cursor'] = query(server, **params)['next_cursor']
+    return params['cursor']
+
+if __name__ == '__main__':
+    count = int(sys.argv[1] if len(sys.argv) > 1 else 20000)
+    server = construct_server(count)
+
+    for page in (1, count / LIMIT / 2, count / LIMIT - 1):
+        cursor = locate_cursor(server, page)
+        expected = query(server, offset=page * LIMIT)['resources']
+        assert query(server, cursor=cursor)['resources'] == expected
+
+        harness.measure('page %d of %d, offset' % (page, count / LIMIT),
+            lambda: query(server, offset=page * LIMIT), 10, 3)
+        harness.measure('page %d of %d, cursor' % (page, count / LIMIT),
+            lambda: query(server, cursor=cursor), 10, 3)
@@ -0,0 +1,51 @@
+"""Compares processing each standard request of the example resource through its
+precompiled plans with processing it generically through its schemas."""
+
+import harness
+
+from mesh.constants import OK
+from mesh.transport.base import ServerRequest, ServerResponse
+from fixtures import Example
+
+RESOURCE = {'id': 1, 'required_field': 'text', 'default_field': 1, 'integer_field': 2,
+    'boolean_field': True, 'sequence_field': [1, 2, 3], 'text_field': 'more text'}
+
+CASES = {
+    'create': (None, {'required_field': 'text', 'integer_field': 2}, {'id': 1}),
+    'delete': (1, None, {'id': 1}),
+    'get': (1, None, RESOURCE),
+    'put': (1, {'required_field': 'text', 'integer_field': 2}, {'id': 1}),
+    'query': (None, {'limit': 200}, {'total': 200, 'resources': [RESOURCE] * 200}),
+    'update': (1, {'integer_field': 3}, {'id': 1}),
+}
+
+def construct_controller(content):
+    class Controller(object):
+        def acquire(self, subject):
+            return {'id': subject}
+
+        def dispatch(self, definition, request, response, subject, data):
+            response(OK, content)
+    return Controller
+
+def construct_case(name):
+    subject, data, content = CASES[name]
+    request, controller = Example.requests[name], construct_controller(content)
+
+    def process():
+        response = ServerResponse()
+        request.process(controller, ServerRequest(None, subject=subject, data=data), response)
+        assert response.status == OK, (name, response.status, response.content)
+    return request, process
+
+if __name__ == '__main__':
+    for name in sorted(CASES):
+        request, process = construct_case(name)
+        number = 100 if name == 'query' else 5000
+
+        request.compiled = False
+        try:
+            harness.measure('%s, generic' % name, process, number)
+        finally:
+            del request.compiled
+        harness.measure('%s, compiled' % name, process, number)
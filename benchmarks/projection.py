@@ -0,0 +1,41 @@
+"""Compares the latency and serialized payload size of querying example resources
+with and without a field projection, against a mock storage."""
+
+import harness
+
+from mesh.constants import OK
+from mesh.standard.mock import MockStorage, mock_bundle
+from mesh.transport.internal import InternalServer
+from scheme.formats import Json
+from fixtures import Example, primary_bundle
+
+ENDPOINT = ('primary/1.0/example', 'query')
+
+CASES = [
+    ('all fields, with deferred', {'include': ['deferred_field']}),
+    ('non-deferred fields', {}),
+    ('projected to one field', {'fields': ['required_field']}),
+]
+
+def construct_server(count):
+    storage = MockStorage(':memory:')
+    storage.save_many(Example, [{'required_field': 'text%d' % i, 'integer_field': i,
+        'text_field': 'x' * 512, 'deferred_field': 'y' * 4096, 'sequence_field': range(20),
+        'structure_field': {'required_field': i, 'optional_field': i}}
+        for i in range(count)], creating=True)
+    return InternalServer([mock_bundle(primary_bundle, storage)])
+
+def construct_case(server, params):
+    def query():
+        response = server.dispatch(ENDPOINT, {}, None, dict(params, limit=100))
+        assert response.status == OK, (response.status, response.content)
+        return response.content
+    return query
+
+if __name__ == '__main__':
+    server = construct_server(1000)
+    for label, params in CASES:
+        query = construct_case(server, params)
+        size = len(Json.serialize(query()))
+
+        harness.measure('%s, %d bytes' % (label, size), query, 20, 3)
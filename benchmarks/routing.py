@@ -0,0 +1,25 @@
+"""Compares resolving request paths through the precompiled route table with
+parsing them into a Path and looking up the endpoint group by signature."""
+
+import harness
+
+from mesh.transport.http import HttpServer, Path
+from fixtures import primary_bundle, secondary_bundle
+
+server = HttpServer([primary_bundle, secondary_bundle])
+paths = ['/primary/1.0/example', '/primary/1.0/example/1', '/primary/1.0/example/1!json',
+    '/secondary/1.0/secondary', '/primary/_specification']
+
+def parse():
+    for path in paths:
+        path = Path(server, path)
+        if path.type != 'introspection':
+            server.groups.get(path.signature)
+
+def resolve():
+    for path in paths:
+        server.routes.resolve(path)
+
+if __name__ == '__main__':
+    harness.measure('Path parsing (%d paths)' % len(paths), parse, 10000)
+    harness.measure('route table (%d paths)' % len(paths), resolve, 10000)
@@ -283,6 +283,9 @@ class Bundle(object):
                 contribution = mount.get(version)
                 if contribution:
                     name, contribution = contribution
+                    if isinstance(contribution, tuple):
+                        for request in contribution[0].requests.itervalues():
+                            request.compile()
                     if version not in self.versions:
                         self.versions[version] = {name: contribution}
                     elif name not in self.versions[version]:
@@ -311,14 +314,16 @@ class Specification(object):
         return 'Specification(name=%r)' % self.name
 
     def find(self, path):
-        if isinstance(path, basestring):
-            path = tuple(parse_version(v, True) for v in path.strip('/').split('/'))
-
         try:
             return self.cache[path]
         except KeyError:
             pass
 
+        if isinstance(path, basestring):
+            resource = self.find(tuple(parse_version(v, True) for v in path.strip('/').split('/')))
+            self.cache[path] = resource
+            return resource
+
         if path[0] != self.name:
             raise KeyError(path)
 
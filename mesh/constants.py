@@ -16,6 +16,7 @@ CREATED = 'CREATED'
 ACCEPTED = 'ACCEPTED'
 SUBSET = 'SUBSET'
 PARTIAL = 'PARTIAL'
+NOT_MODIFIED = 'NOT_MODIFIED'
 
 BAD_REQUEST = 'BAD_REQUEST'
 UNAUTHORIZED = 'UNAUTHORIZED'
@@ -33,7 +34,7 @@ BAD_GATEWAY = 'BAD_GATEWAY'
 UNAVAILABLE = 'UNAVAILABLE'
 FAILED_DEPENDENCY = 'FAILED_DEPENDENCY'
 
-STATUS_CODES = (OK, CREATED, ACCEPTED, SUBSET, PARTIAL, BAD_REQUEST, UNAUTHORIZED, FORBIDDEN,
+STATUS_CODES = (OK, CREATED, ACCEPTED, SUBSET, PARTIAL, NOT_MODIFIED, BAD_REQUEST, UNAUTHORIZED, FORBIDDEN,
 	NOT_FOUND, METHOD_NOT_ALLOWED, INVALID, CONFLICT, TIMEOUT, GONE, SERVER_ERROR, UNIMPLEMENTED,
     BAD_GATEWAY, UNAVAILABLE, FAILED_DEPENDENCY)
 VALID_STATUS_CODES = (OK, CREATED, ACCEPTED, SUBSET, PARTIAL)
@@ -6,15 +6,201 @@ from types import ClassType
 
 from mesh.constants import *
 from mesh.exceptions import *
-from mesh.util import LogHelper, pull_class_dict
-from scheme.fields import INCOMING, OUTGOING, Field, Structure
+from mesh.util import LogHelper, deferred, pull_class_dict
+from scheme.fields import INCOMING, OUTGOING, Boolean, Field, Integer, Sequence, Structure
 from scheme.exceptions import *
 from scheme.util import format_structure
 
-__all__ = ('Mediator', 'Request', 'Response', 'validator')
+__all__ = ('Mediator', 'Request', 'Response', 'StreamedSequence', 'validator')
 
 log = LogHelper(__name__)
 
+class ProcessingPlan(object):
+    """A precompiled processing plan for a structural schema.
+
+    Values are processed along a flattened list of prebound field processors,
+    with unconstrained integer and boolean fields passed through untouched and
+    null values of ``ignore_null`` fields dropped, as the schema would.
+    Whenever the plan encounters something it does not handle, including any
+    validation failure, the value is processed generically by the schema itself,
+    so that results and errors are always those of the generic path.
+    """
+
+    PASSTHROUGH_TYPES = ((Boolean, (bool,)), (Integer, (int, long)))
+    CONSTRAINTS = ('constant', 'preprocessor', 'minimum', 'maximum')
+    STRUCTURE_ASPECTS = ('constant', 'preprocessor', 'polymorphic_on', 'key_order',
+        'generate_default')
+    SEQUENCE_ASPECTS = ('constant', 'preprocessor', 'min_length', 'max_length', 'unique')
+
+    def __init__(self, schema):
+        self.defaults = []
+        self.ignored = set()
+        self.required = []
+        self.schema = schema
+
+        self.processors = {}
+        for name, field in schema.structure.iteritems():
+            self.processors[name] = self._compile_field(field)
+            if field.ignore_null:
+                self.ignored.add(name)
+            if field.required:
+                self.required.append(name)
+            if field.default is not None:
+                self.defaults.append(name)
+
+    def __repr__(self):
+        return 'ProcessingPlan(%r)' % self.schema
+
+    @classmethod
+    def compile(cls, schema):
+        """Compiles and returns a plan for ``schema``, or ``None`` if ``schema`` is not
+        a plain structure."""
+
+        if type(schema) is Structure and not cls._has_aspects(schema, cls.STRUCTURE_ASPECTS):
+            return cls(schema)
+
+    def process(self, value, phase, serialized=False):
+        try:
+            return self._process_structure(value, phase, serialized)
+        except (_PlanFallback, StructuralError, ValidationError):
+            return self.schema.process(value, phase, serialized)
+
+    def _process_structure(self, value, phase, serialized):
+        if type(value) is not dict:
+            raise _PlanFallback()
+
+        ignored = self.ignored
+        for name in self.required:
+            if value.get(name) is None and (name not in value or name in ignored):
+                raise _PlanFallback()
+        for name in self.defaults:
+            if value.get(name) is None and (name not in value or name in ignored):
+                raise _PlanFallback()
+
+        processors = self.processors
+        processed = {}
+
+        for name, item in value.iteritems():
+            if item is None and name in ignored:
+                continue
+            try:
+                processor = processors[name]
+            except KeyError:
+                raise _PlanFallback()
+            processed[name] = processor(item, phase, serialized)
+
+        return processed
+
+    @classmethod
+    def _compile_field(cls, field):
+        for fieldtype, types in cls.PASSTHROUGH_TYPES:
+            if type(field) is fieldtype and not cls._has_aspects(field, cls.CONSTRAINTS):
+                return cls._compile_passthrough(field, types)
+
+        if type(field) is Sequence and not cls._has_aspects(field, cls.SEQUENCE_ASPECTS):
+            plan = cls.compile(field.item)
+            if plan:
+                return cls._compile_sequence(field, plan)
+
+        plan = cls.compile(field)
+        if plan:
+            return plan._process_structure
+        return field.process
+
+    @staticmethod
+    def _compile_passthrough(field, types):
+        process = field.process
+        def processor(value, phase, serialized):
+            if type(value) in types:
+                return value
+            return process(value, phase, serialized)
+        return processor
+
+    @staticmethod
+    def _compile_sequence(field, plan):
+        process = field.process
+        process_item = plan._process_structure
+        def processor(value, phase, serialized):
+            if type(value) is not list:
+                return process(value, phase, serialized)
+            return [process_item(item, phase, serialized) for item in value]
+        return processor
+
+    @staticmethod
+    def _has_aspects(field, aspects):
+        for aspect in aspects:
+            if getattr(field, aspect, None):
+                return True
+        return False
+
+class _PlanFallback(Exception):
+    """Raised when a processing plan defers to generic processing."""
+
+class StreamedSequence(object):
+    """A sequence of response items produced lazily by a controller.
+
+    A controller streams a sequence field of its response by assigning it an
+    iterator, such as a generator, rather than a list. Each item is processed
+    against ``field`` only as the sequence is iterated, so constraints on the
+    sequence as a whole are not validated; an item which fails processing is
+    logged and aborts the iteration.
+    """
+
+    def __init__(self, items, field, phase, serialized=False):
+        self.field = field
+        self.items = items
+        self.phase = phase
+        self.serialized = serialized
+
+    def __iter__(self):
+        field, phase, serialized = self.field, self.phase, self.serialized
+        for item in self.items:
+            try:
+                yield field.process(item, phase, serialized)
+            except (StructuralError, ValidationError), exception:
+                log('error', 'streamed item failed schema validation\n%s',
+                    exception.format_errors())
+                raise
+
+    @classmethod
+    def extract(cls, schema, content):
+        """Returns the streamed sequence fields of ``content`` as a dictionary
+        mapping names to ``(items, field)`` pairs, or ``None``."""
+
+        if not (isinstance(content, dict) and isinstance(schema, Structure)):
+            return None
+
+        streams = None
+        for name, value in content.iteritems():
+            if isinstance(value, (basestring, dict, list, tuple)) or not hasattr(value, 'next'):
+                continue
+
+            field = schema.structure.get(name)
+            if isinstance(field, Sequence):
+                if streams is None:
+                    streams = {}
+                streams[name] = (value, field.item)
+
+        return streams
+
+    @classmethod
+    def resolve(cls, content):
+        """Collects any streamed sequences in ``content`` into lists."""
+
+        if isinstance(content, dict):
+            for name, value in content.items():
+                if isinstance(value, StreamedSequence):
+                    content[name] = list(value)
+        return content
+
+    @classmethod
+    def streaming(cls, content):
+        if isinstance(content, dict):
+            for value in content.itervalues():
+                if isinstance(value, StreamedSequence):
+                    return True
+        return False
+
 class Response(object):
     """A response definition for a particular request."""
 
@@ -100,6 +286,8 @@ class Request(object):
     ATTRS = ('batch', 'description', 'endpoint', 'filter', 'specific',
         'subject_required', 'title', 'verbose')
 
+    compiled = True
+
     def __init__(self, resource=None, name=None, endpoint=None, filter=None, schema=None,
             responses=None, specific=False, description=None, title=None, auto_constructed=False,
             batch=False, subject_required=True, validators=None, metadata=None, verbose=False,
@@ -120,6 +308,7 @@ class Request(object):
         self.title = title
         self.validators = validators or []
         self.verbose = verbose
+        self.plans = None
 
         for status, response in self.responses.iteritems():
             if response.status is None:
@@ -155,6 +344,21 @@ class Request(object):
         else:
             return False
 
+    def compile(self):
+        """Compiles processing plans for the request schema and each response schema
+        of this request. Plans are discarded and recompiled whenever this method is
+        called, so it should be called again if any of those schemas are modified."""
+
+        plans = {}
+        if self.schema:
+            plans[None] = ProcessingPlan.compile(self.schema)
+        for status, response in self.responses.iteritems():
+            if response.schema:
+                plans[status] = ProcessingPlan.compile(response.schema)
+
+        self.plans = plans
+        return plans
+
     @classmethod
     def construct(cls, resource, declaration):
         bases = declaration.__bases__
@@ -287,64 +491,37 @@ class Request(object):
         return description
 
     def process(self, controller, request, response, mediators=None):
-        if hasattr(request, 'headers') and request.headers.has_key('REMOTE_ADDR'):
-            message = 'processing request: %s from %s' % (request.description, request.headers['REMOTE_ADDR'])
-        else:
-            message = 'processing request: %s' % (request.description)
-        if self.verbose:
-            message += '\n' + format_structure(request.data, abbreviate=True)
-        log('info', message)
-
-        instance = controller()
-        
-        if mediators:
-            for mediator in mediators:
-                try:
-                    mediator.before_validation(self, request, response)
-                    if response.status:
-                        self._audit_failed_request(instance, request, response)
-                        return response
-                except StructuralError, exception:
-                    error = exception.serialize()
-                    log('info', 'request to %s failed during mediator', str(self))
-                    response(INVALID, error)
-                    self._audit_failed_request(instance, request, response)
-                    return response
-
-
-        try:
-            if not instance.validate_request(request, response):
-                log('info', 'validate_request failed for controller %s', str(type(instance)))
-                self._audit_failed_request(instance, request, response)
-                return response
-        except AttributeError:
-            log('info', 'exception during validate_request for controller %s', str(type(instance)))
-            pass
-
-        subject = None
-        if self.specific:
-            if request.subject is None:
-                response(BAD_REQUEST)
-                self._audit_failed_request(instance, request, response)
-                return response
-            subject = instance.acquire(request.subject)
-            if not subject and self.subject_required:
-                log('info', 'request to %r specified unknown subject %r', str(self),
-                    request.subject)
-                response(GONE)
-                self._audit_failed_request(instance, request, response)
-                return response
-        elif request.subject:
-            log('info', 'request to %r improperly specified subject %r', str(self),
-                request.subject)
-            response(BAD_REQUEST)
-            self._audit_failed_request(instance, request, response)
+        if log.enabled('info'):
+            headers = getattr(request, 'headers', None)
+            if headers and 'REMOTE_ADDR' in headers:
+                message, args = 'processing request: %s from %s', [request.description,
+                    headers['REMOTE_ADDR']]
+            else:
+                message, args = 'processing request: %s', [request.description]
+            if self.verbose:
+                message += '\n%s'
+                args.append(deferred(format_structure, request.data, abbreviate=True))
+            log('info', message, *args)
+
+        instance = self._instantiate(controller)
+        admitted, subject = self._screen_request(instance, request, response, mediators)
+        if not admitted:
             return response
 
+        plans = None
+        if self.compiled:
+            plans = self.plans
+            if plans is None:
+                plans = self.compile()
+
         data = None
         if self.schema:
             try:
-                data = self.schema.process(request.data, INCOMING, request.serialized)
+                plan = plans and plans.get(None)
+                if plan:
+                    data = plan.process(request.data, INCOMING, request.serialized)
+                else:
+                    data = self.schema.process(request.data, INCOMING, request.serialized)
             except StructuralError, exception:
                 error = exception.serialize()
                 log('info', 'request to %s failed schema validation', str(self))
@@ -387,7 +564,7 @@ class Request(object):
 
         if self.verbose and response.content:
             log('debug', 'response for request to %s:\n%s', request.description,
-                format_structure(response.content, abbreviate=True))
+                deferred(format_structure, response.content, abbreviate=True))
 
         definition = self.responses.get(response.status)
         if not definition:
@@ -402,21 +579,47 @@ class Request(object):
                 return response
 
         if definition.schema:
+            content = response.content
+            streams = StreamedSequence.extract(definition.schema, content)
+            if streams:
+                content = dict(content)
+                for name in streams:
+                    content[name] = []
+
             try:
-                response.content = definition.schema.process(response.content, OUTGOING, request.serialized)
+                plan = plans and plans.get(response.status)
+                if plan:
+                    response.content = plan.process(content, OUTGOING, request.serialized)
+                else:
+                    response.content = definition.schema.process(content, OUTGOING,
+                        request.serialized)
             except (StructuralError, ValidationError) as exception:
                 log('error', 'response for %s failed schema validation\n%s\n%s',
-                    str(self), exception.format_errors(), format_structure(response.content))
+                    str(self), exception.format_errors(), deferred(format_structure, response.content))
                 response.content = None
                 response(SERVER_ERROR)
                 self._audit_failed_request(instance, request, response, subject, data)
                 return response
+
+            if streams:
+                for name, (items, field) in streams.iteritems():
+                    response.content[name] = StreamedSequence(items, field, OUTGOING,
+                        request.serialized)
         elif response.content:
             log('error', 'response for %s improperly specified content', str(self))
             response(SERVER_ERROR)
             self._audit_failed_request(instance, request, response, subject, data)
             return response
 
+    def screen(self, controller, request, response, mediators=None):
+        """Subjects ``request`` to the mediators, request validation and subject
+        acquisition which precede its dispatch, without dispatching it. Returns true
+        if ``request`` would be dispatched, and otherwise leaves the failure in
+        ``response``."""
+
+        instance = self._instantiate(controller)
+        return self._screen_request(instance, request, response, mediators)[0]
+
     def validate(self, data):
         if self.batch:
             errors = []
@@ -432,6 +635,58 @@ class Request(object):
         else:
             self._validate_data(data)
 
+    def _instantiate(self, controller):
+        instantiate = getattr(controller, 'instantiate', None)
+        if instantiate:
+            return instantiate()
+        else:
+            return controller()
+
+    def _screen_request(self, instance, request, response, mediators):
+        if mediators:
+            for mediator in mediators:
+                try:
+                    mediator.before_validation(self, request, response)
+                    if response.status:
+                        self._audit_failed_request(instance, request, response)
+                        return False, None
+                except StructuralError, exception:
+                    error = exception.serialize()
+                    log('info', 'request to %s failed during mediator', str(self))
+                    response(INVALID, error)
+                    self._audit_failed_request(instance, request, response)
+                    return False, None
+
+        try:
+            if not instance.validate_request(request, response):
+                log('info', 'validate_request failed for controller %s', str(type(instance)))
+                self._audit_failed_request(instance, request, response)
+                return False, None
+        except AttributeError:
+            log('info', 'exception during validate_request for controller %s', str(type(instance)))
+            pass
+
+        subject = None
+        if self.specific:
+            if request.subject is None:
+                response(BAD_REQUEST)
+                self._audit_failed_request(instance, request, response)
+                return False, None
+            subject = instance.acquire(request.subject)
+            if not subject and self.subject_required:
+                log('info', 'request to %r specified unknown subject %r', str(self),
+                    request.subject)
+                response(GONE)
+                self._audit_failed_request(instance, request, response)
+                return False, None
+        elif request.subject:
+            log('info', 'request to %r improperly specified subject %r', str(self),
+                request.subject)
+            response(BAD_REQUEST)
+            self._audit_failed_request(instance, request, response)
+            return False, None
+        return True, subject
+
     def _validate_data(self, data):
         error = ValidationError(structure={})
         for validator in self.validators:
@@ -461,7 +716,7 @@ class Request(object):
                 reqdata = request.data or {}
             if isinstance(controller, Auditable) and controller.needs_audit(request, subject):
                 try:
-                    log('debug', 'writing audit entry for failed request: %s' % str(self))
+                    log('debug', 'writing audit entry for failed request: %s', self)
                     add_params = {}
                     if request.path :
                         add_params['path'] = request.path.path
@@ -1,5 +1,6 @@
 import re
 from textwrap import dedent
+from threading import local
 from types import ClassType
 
 from mesh.constants import *
@@ -358,7 +359,9 @@ class Resource(object):
 class ControllerMeta(type):
     def __new__(metatype, name, bases, namespace):
         controller = type.__new__(metatype, name, bases, namespace)
-        
+        controller._instance = None
+        controller._instances = local()
+
         resource = controller.resource
         if resource is not None:
             version = controller.version
@@ -417,17 +420,45 @@ class ControllerMeta(type):
         return min(controller.versions.keys())
 
 class Controller(object):
-    """A resource controller."""
+    """A resource controller.
+
+    By default, a new instance of a controller is constructed for each request it
+    processes. A controller which holds no per-request state can instead set
+    ``reusable`` to ``'singleton'``, so that a single instance processes every request,
+    or to ``'thread'``, so that each thread has its own instance.
+    """
 
     __metaclass__ = ControllerMeta
 
     resource = None
+    reusable = None
     version = None
 
     @classmethod
     def __construct__(cls):
         pass
 
+    @classmethod
+    def instantiate(cls):
+        """Returns an instance of this controller to process a request, as
+        determined by ``reusable``."""
+
+        reusable = cls.reusable
+        if reusable == 'singleton':
+            instance = cls._instance
+            if instance is None:
+                instance = cls._instance = cls()
+            return instance
+        elif reusable == 'thread':
+            instance = getattr(cls._instances, 'instance', None)
+            if instance is None:
+                instance = cls._instances.instance = cls()
+            return instance
+        elif not reusable:
+            return cls()
+        else:
+            raise ValueError(reusable)
+
     def acquire(self, subject):
         """Acquires and returns the backend instance for the implemented resource identified
         by ``subject``. The framework treats both ``subject`` and the returned value as
@@ -1,9 +1,62 @@
 from mesh.resource import *
 
-__all__ = ('StandardController',)
+__all__ = ('Projection', 'StandardController')
+
+class Projection(object):
+    """The fields of a resource to be returned by a get or query request, normalized
+    from its ``fields``, ``include`` and ``exclude`` parameters: either the specified
+    fields or all non-deferred fields, plus any included fields, less any excluded
+    fields. The identifier is always projected."""
+
+    def __init__(self, resource, fields=None, include=None, exclude=None):
+        if fields:
+            names = set(fields)
+        else:
+            names = set(name for name, field in resource.schema.iteritems()
+                if not field.deferred)
+
+        if include:
+            names.update(include)
+        if exclude:
+            names.difference_update(exclude)
+
+        names.add(resource.id_field.name)
+        self.fields = frozenset(names)
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __repr__(self):
+        return 'Projection(%s)' % ', '.join(sorted(self.fields))
+
+    def apply(self, resource):
+        fields = self.fields
+        return dict((name, value) for name, value in resource.iteritems() if name in fields)
+
+    @classmethod
+    def construct(cls, resource, data):
+        if not data:
+            return cls(resource)
+        return cls(resource, data.get('fields'), data.get('include'), data.get('exclude'))
 
 class StandardController(Controller):
-    """The standard controller."""
+    """The standard controller.
+
+    For requests named in ``projected_requests``, a :class:`Projection` of the
+    requested fields is assigned to ``request.projection`` before dispatch, so that
+    implementations can load only the fields which will be returned.
+    """
+
+    projected_requests = ('get', 'query')
+
+    def dispatch(self, definition, request, response, subject, data):
+        if definition.name in self.projected_requests:
+            request.projection = Projection.construct(self.resource, data)
+        return super(StandardController, self).dispatch(definition, request, response,
+            subject, data)
 
     def _prune_resource(self, resource, data, _empty=[]):
         if not data:
@@ -1,7 +1,11 @@
 import os
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
 from datetime import date, datetime, time
-from operator import itemgetter
+from operator import contains, eq, ge, gt, le, lt, ne
 from time import mktime, strptime
+from weakref import WeakSet
 
 try:
     import json as _json
@@ -74,32 +78,175 @@ class json(object):
     def _normalize_dict(cls, value):
         return dict((str(k), v) for k, v in value.iteritems())
 
+def iterate_json_array(stream, chunksize=65536):
+    """Iteratively decodes the values of the JSON array read from ``stream``."""
+
+    decoder = _json.JSONDecoder(object_hook=json._decode_obj)
+    buffer, offset, started = '', 0, False
+
+    while True:
+        chunk = stream.read(chunksize)
+        buffer = buffer[offset:] + chunk
+        offset = 0
+
+        while True:
+            while offset < len(buffer) and buffer[offset] in ' \t\r\n,':
+                offset += 1
+            if offset == len(buffer):
+                break
+            elif not started:
+                if buffer[offset] != '[':
+                    raise ValueError('fixtures must be a json array')
+                offset, started = offset + 1, True
+            elif buffer[offset] == ']':
+                return
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, offset)
+                except ValueError:
+                    if not chunk:
+                        raise
+                    break
+                yield value
+                offset = end
+
+        if not chunk:
+            raise ValueError('unterminated json array')
+
+def reading(method):
+    def wrapper(self, *args, **params):
+        with self.read_lock:
+            return method(self, *args, **params)
+    wrapper.__doc__ = method.__doc__
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+def writing(method):
+    def wrapper(self, *args, **params):
+        with self.lock:
+            return method(self, *args, **params)
+    wrapper.__doc__ = method.__doc__
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+class Connection(sqlite3.Connection):
+    """A sqlite connection which, unlike the builtin one, can be weakly referenced."""
+
+class Unlocked(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
 class MockStorage(object):
-    DDL = 'create table if not exists %s (id integer primary key, data text)'
-    DDL_STR = 'create table if not exists %s (id text primary key, data text)'
+    """A sqlite-backed store for mocked resources.
+
+    Each resource is stored as a JSON document. If ``indexed`` is true, scalar fields
+    which are sortable or have operators are additionally stored in indexed columns,
+    and queries which only filter and sort on such fields are evaluated in SQL; see
+    :meth:`supports` and :meth:`select`.
+
+    File-backed stores use write-ahead logging, with the ``synchronous`` level given
+    at construction; bulk writes should use :meth:`save_many`, :meth:`delete_many`
+    or :meth:`load`, which each commit a single transaction.
+
+    Storage can be shared between threads. File-backed stores give each thread its
+    own connection, so reads proceed concurrently while writes are serialized; an
+    in-memory store has a single connection, so all access to it is serialized.
+    Each write increments ``revision``, which keys the indexes cached for queries.
+    """
+
+    DDL = 'create table if not exists %s (id integer primary key, data text%s)'
+    DDL_STR = 'create table if not exists %s (id text primary key, data text%s)'
     DELETE = 'delete from %s where id = ?'
     GET = 'select id, data from %s where id = ?'
-    INSERT = 'insert into %s (data) values (?)'
-    INSERT_WITH_ID = 'insert into %s values (?, ?)'
-    LOAD = 'insert into %s values (?, ?)'
+    INDEX = 'create index if not exists %s_%s on %s ("%s")'
     QUERY = 'select id, data from %s order by id'
-    UPDATE = 'update %s set data = ? where id = ?'
 
-    def __init__(self, path=':memory:', fresh=False, id_type=int):
+    BATCH_SIZE = 1000
+
+    INDEXED_FIELDS = (Boolean, Date, DateTime, Enumeration, Float, Integer, Text, Time)
+    OPERATORS = {
+        'equal': '%s is ?',
+        'iequal': 'lower(%s) is ?',
+        'not': '%s is not ?',
+        'inot': 'lower(%s) is not ?',
+        'prefix': 'substr(%s, 1, length(?)) = ?',
+        'iprefix': 'substr(lower(%s), 1, length(?)) = ?',
+        'suffix': 'substr(%s, length(%s) - length(?) + 1) = ?',
+        'isuffix': 'substr(lower(%s), length(%s) - length(?) + 1) = ?',
+        'contains': 'instr(%s, ?) > 0',
+        'icontains': 'instr(lower(%s), ?) > 0',
+        'gt': '%s > ?',
+        'gte': '%s >= ?',
+        'lt': '(%s < ? or %s is null)',
+        'lte': '(%s <= ? or %s is null)',
+    }
+
+    def __init__(self, path=':memory:', fresh=False, id_type=int, indexed=False,
+            synchronous='normal'):
+        self.columns = {}
+        self.connections = WeakSet()
+        self.generation = 0
+        self.indexed = indexed
+        self.indexes = {}
+        self.local = threading.local()
+        self.lock = threading.RLock()
         self.path = path
+        self.resources = {}
+        self.revision = 0
+        self.shared = None
+        self.synchronous = synchronous
         self.tables = set()
+
+        if path == ':memory:':
+            self.read_lock = self.lock
+        else:
+            self.read_lock = Unlocked()
         if fresh:
             self.reset()
-        else:
-            self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    @property
+    def connection(self):
+        if self.path == ':memory:':
+            if self.shared is None:
+                self.shared = self._connect()
+            return self.shared
+
+        local = self.local
+        if getattr(local, 'generation', None) != self.generation:
+            local.connection = self._connect()
+            local.generation = self.generation
+        return local.connection
+
+    @reading
+    def count(self, name, query=None):
+        if name not in self.tables:
+            return 0
+
+        where, params = self._construct_where(query)
+        sql = 'select count(*) from %s%s' % (name, where)
+        return self.connection.execute(sql, params).fetchone()[0]
 
     def delete(self, name, id):
+        self.delete_many(name, [id])
+
+    @writing
+    def delete_many(self, name, ids):
         if name not in self.tables:
             return
 
-        self.connection.execute(self.DELETE % name, (id,))
-        self.connection.commit()
+        try:
+            self.connection.executemany(self.DELETE % name, [(id,) for id in ids])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self._invalidate()
 
+    @reading
     def get(self, name, id):
         if name not in self.tables:
             return None
@@ -110,20 +257,39 @@ class MockStorage(object):
         except StopIteration:
             return None
 
+    @writing
     def load(self, fixtures, serialized=False):
+        """Loads ``fixtures`` in a single transaction. If ``serialized`` is true,
+        ``fixtures`` is either a JSON document or a file containing one, which is
+        decoded incrementally as it is read."""
+
         if serialized:
-            fixtures = json.decode(fixtures)
+            if hasattr(fixtures, 'read'):
+                fixtures = iterate_json_array(fixtures)
+            else:
+                fixtures = json.decode(fixtures)
 
-        cursor = self.connection.cursor()
+        batches = {}
         try:
             for fixture in fixtures:
                 name = fixture.pop('resource')
                 self._create_table(name, fixture['id'])
-                cursor.execute(self.LOAD % name, (fixture['id'], json.encode(fixture)))
+
+                batch = batches.setdefault(name, [])
+                batch.append(self._construct_row(name, fixture['id'], fixture))
+                if len(batch) >= self.BATCH_SIZE:
+                    self._insert_rows(name, batches.pop(name), True)
+
+            for name, batch in batches.iteritems():
+                self._insert_rows(name, batch, True)
             self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
         finally:
-            cursor.close()
+            self._invalidate()
 
+    @reading
     def query(self, name):
         if name not in self.tables:
             return []
@@ -133,38 +299,259 @@ class MockStorage(object):
             resources.append(self._create_resource(row))
         return resources
 
+    def register(self, resource):
+        """Registers ``resource`` with this storage, creating or adding indexed columns
+        for its table if this storage is indexed."""
+
+        if resource.name not in self.resources:
+            self._register(resource)
+
     def reset(self):
-        if hasattr(self, 'connection'):
-            self.connection.close()
-        self.tables = set()
-        if self.path != ':memory:' and os.path.exists(self.path): 
-            os.unlink(self.path)
-        self.connection = sqlite3.connect(self.path)
+        with self.lock:
+            self.generation += 1
+            for connection in list(self.connections):
+                connection.close()
+
+            self.connections = WeakSet()
+            self.indexes = {}
+            self.revision += 1
+            self.shared = None
+            self.tables = set()
+            if self.path != ':memory:':
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(self.path + suffix):
+                        os.unlink(self.path + suffix)
 
     def save(self, resource, data, creating=False):
-        id = data.get('id', None)
-        data = json.encode(data)
-
-        self._create_table(resource.name, id, resource.id_field.type)
-        if id and not creating:
-            self.connection.execute(self.UPDATE % resource.name, (data, id))
-            self.connection.commit()
-            return id
+        return self.save_many(resource, [data], creating)[0]
+
+    @writing
+    def save_many(self, resource, items, creating=False):
+        """Saves each of ``items`` as ``resource`` in a single transaction, returning
+        the list of their ids. Items with an id are updated unless ``creating`` is
+        true, and are otherwise inserted."""
+
+        items = list(items)
+        self.register(resource)
+
+        name, id_type = resource.name, resource.id_field.type
+        ids, updates, inserts = [], [], []
+        for data in items:
+            id = data.get('id', None)
+            self._create_table(name, id, id_type)
+            if id and not creating:
+                updates.append(self._construct_row(name, id, data))
+            elif not id and id_type != 'uuid':
+                ids.append(None)
+                continue
+            else:
+                id = id or uniqid()
+                inserts.append(self._construct_row(name, id, data))
+            ids.append(id)
 
-        cursor = self.connection.cursor()
         try:
-            if id:
-                cursor.execute(self.INSERT_WITH_ID % resource.name, (id, data))
-            elif resource.id_field.type == 'uuid':
-                id = uniqid()
-                cursor.execute(self.INSERT_WITH_ID % resource.name, (id, data))
-            else:
-                cursor.execute(self.INSERT % resource.name, (data,))
-                id = cursor.lastrowid
+            if updates:
+                self._update_rows(name, updates)
+            if inserts:
+                self._insert_rows(name, inserts, True)
+
+            cursor = self.connection.cursor()
+            try:
+                for i, data in enumerate(items):
+                    if ids[i] is None:
+                        row = self._construct_row(name, None, data)
+                        cursor.execute(self._construct_insert(name, False), row)
+                        ids[i] = cursor.lastrowid
+            finally:
+                cursor.close()
             self.connection.commit()
-            return id
+        except Exception:
+            self.connection.rollback()
+            raise
         finally:
-            cursor.close()
+            self._invalidate()
+        return ids
+
+    @reading
+    def select(self, name, query=None, sorting=None, offset=None, limit=None, after=None):
+        """Returns the resources stored as ``name`` which match ``query``, sorted by
+        ``sorting`` and then by id, evaluated in SQL. If ``after`` is specified, it is
+        the values of the sort fields, ending with the id, of the resource after which
+        the returned resources begin. Only valid if :meth:`supports` returns true for
+        ``query`` and ``sorting``."""
+
+        if name not in self.tables:
+            return []
+
+        where, params = self._construct_where(query)
+        keys = []
+        for token in sorting or ():
+            descending = False
+            if token[-1] in ('+', '-'):
+                descending = (token[-1] == '-')
+                token = token[:-1]
+            keys.append(('"%s"' % token, descending))
+
+        if 'id' not in [token.rstrip('+-') for token in sorting or ()]:
+            keys.append(('id', False))
+
+        if after is not None:
+            clause, values = self._construct_keyset(keys, after)
+            where += (' and ' if where else ' where ') + clause
+            params.extend(values)
+
+        order = ', '.join('%s %s' % (column, 'desc' if descending else 'asc')
+            for column, descending in keys)
+        sql = 'select id, data from %s%s order by %s' % (name, where, order)
+        if limit is not None or offset:
+            sql += ' limit ? offset ?'
+            params.extend([-1 if limit is None else limit, offset or 0])
+
+        return [self._create_resource(row) for row in self.connection.execute(sql, params)]
+
+    def supports(self, name, query=None, sorting=None):
+        """Indicates whether a query for resources stored as ``name`` filtering on
+        ``query`` and sorting on ``sorting`` can be evaluated by :meth:`select`."""
+
+        columns = self.columns.get(name)
+        if columns is None:
+            return False
+
+        for filter, expected in (query or {}).iteritems():
+            attr, operator = filter, 'equal'
+            if '__' in filter:
+                attr, operator = filter.rsplit('__', 1)
+            if attr != 'id' and attr not in columns:
+                return False
+            if operator not in self.OPERATORS and operator not in ('null', 'in', 'notin'):
+                return False
+
+        for token in sorting or ():
+            token = token.rstrip('+-')
+            if token != 'id' and token not in columns:
+                return False
+        return True
+
+    @writing
+    def _register(self, resource):
+        name = resource.name
+        if name in self.resources:
+            return
+
+        if self.indexed:
+            id_field = resource.id_field.name
+            columns = []
+            for field_name, field in sorted(resource.schema.iteritems()):
+                if field_name != id_field and isinstance(field, self.INDEXED_FIELDS):
+                    if getattr(field, 'sortable', False) or getattr(field, 'operators', None):
+                        columns.append(field_name)
+
+            self.columns[name] = tuple(columns)
+            existing = [row[1] for row in
+                self.connection.execute('pragma table_info(%s)' % name)]
+            if existing:
+                self._add_columns(name, [c for c in columns if c not in existing])
+                self.tables.add(name)
+
+        self.resources[name] = resource
+
+    def _add_columns(self, name, columns):
+        if not columns:
+            return
+
+        for column in columns:
+            self.connection.execute('alter table %s add column "%s"' % (name, column))
+            self.connection.execute(self.INDEX % (name, column, name, column))
+
+        assignments = ', '.join('"%s" = ?' % column for column in columns)
+        rows = self.connection.execute('select id, data from %s' % name).fetchall()
+        for row in rows:
+            resource = json.decode(row[1])
+            self.connection.execute('update %s set %s where id = ?' % (name, assignments),
+                [self._column_value(resource.get(column)) for column in columns] + [row[0]])
+        self.connection.commit()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, factory=Connection)
+        if self.path != ':memory:':
+            connection.execute('pragma journal_mode = wal')
+            if self.synchronous:
+                connection.execute('pragma synchronous = %s' % self.synchronous)
+
+        with self.lock:
+            self.connections.add(connection)
+        return connection
+
+    def _invalidate(self):
+        self.revision += 1
+        self.indexes.clear()
+
+    def _column_value(self, value):
+        if isinstance(value, (datetime, date, time)):
+            return json._encode_obj(value)['_']
+        elif isinstance(value, bool):
+            return int(value)
+        else:
+            return value
+
+    def _construct_where(self, query):
+        if not query:
+            return '', []
+
+        clauses, params = [], []
+        for filter, expected in sorted(query.iteritems()):
+            attr, operator = filter, 'equal'
+            if '__' in filter:
+                attr, operator = filter.rsplit('__', 1)
+
+            column = '"%s"' % attr
+            if operator in ('in', 'notin'):
+                values = [self._column_value(value) for value in expected]
+                nulls = None in values
+                values = [value for value in values if value is not None]
+
+                clause = '0'
+                if values:
+                    clause = '%s in (%s)' % (column, ', '.join('?' * len(values)))
+                    params.extend(values)
+                if operator == 'in':
+                    if nulls:
+                        clause = '(%s or %s is null)' % (clause, column)
+                elif nulls:
+                    clause = '(%s is not null and not %s)' % (column, clause)
+                else:
+                    clause = '(%s is null or not %s)' % (column, clause)
+                clauses.append(clause)
+            elif operator == 'null':
+                clauses.append('%s is %snull' % (column, '' if expected else 'not '))
+            else:
+                template = self.OPERATORS[operator]
+                clauses.append(template.replace('%s', column))
+                value = self._column_value(expected)
+                params.extend([value] * template.count('?'))
+
+        return ' where ' + ' and '.join(clauses), params
+
+    def _construct_keyset(self, keys, values):
+        # a resource follows the cursor if it equals it on some leading sort keys and
+        # follows it on the next one; nulls sort first, as they do in python
+        clauses, params = [], []
+        leading, leading_params = [], []
+        for (column, descending), value in zip(keys, values):
+            value = self._column_value(value)
+            if value is None:
+                condition, args = ('0' if descending else '%s is not null' % column), []
+            elif descending:
+                condition, args = '(%s < ? or %s is null)' % (column, column), [value]
+            else:
+                condition, args = '%s > ?' % column, [value]
+
+            clauses.append('(%s)' % ' and '.join(leading + [condition]))
+            params.extend(leading_params + args)
+            leading.append('%s is ?' % column)
+            leading_params.append(value)
+
+        return '(%s)' % ' or '.join(clauses), params
 
     def _create_resource(self, row):
         resource = json.decode(row[1])
@@ -179,10 +566,74 @@ class MockStorage(object):
         if isinstance(id, basestring) or id_type in ('uuid', 'str'):
             ddl = self.DDL_STR
 
-        self.connection.execute(ddl % name)
+        columns = self.columns.get(name, ())
+        self.connection.execute(ddl % (name, ''.join(', "%s"' % c for c in columns)))
+        for column in columns:
+            self.connection.execute(self.INDEX % (name, column, name, column))
         self.tables.add(name)
 
+    def _construct_insert(self, name, with_id):
+        names = ['data'] + ['"%s"' % column for column in self.columns.get(name, ())]
+        if with_id:
+            names.append('id')
+        return 'insert into %s (%s) values (%s)' % (name, ', '.join(names),
+            ', '.join('?' * len(names)))
+
+    def _construct_row(self, name, id, data):
+        row = [json.encode(data)]
+        for column in self.columns.get(name, ()):
+            row.append(self._column_value(data.get(column)))
+        if id is not None:
+            row.append(id)
+        return row
+
+    def _insert_rows(self, name, rows, with_id):
+        self.connection.executemany(self._construct_insert(name, with_id), rows)
+
+    def _update_rows(self, name, rows):
+        assignments = ['data = ?'] + ['"%s" = ?' % c for c in self.columns.get(name, ())]
+        self.connection.executemany('update %s set %s where id = ?'
+            % (name, ', '.join(assignments)), rows)
+
+class Descending(object):
+    """A sort key component which orders its value in descending order."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
 class MockController(StandardController):
+    filters = {
+        'equal': eq,
+        'iequal': lambda value, expected: value.lower() == expected,
+        'not': ne,
+        'inot': lambda value, expected: value.lower() != expected,
+        'prefix': lambda value, expected: value.startswith(expected),
+        'iprefix': lambda value, expected: value.lower().startswith(expected),
+        'suffix': lambda value, expected: value.endswith(expected),
+        'isuffix': lambda value, expected: value.lower().endswith(expected),
+        'contains': contains,
+        'icontains': lambda value, expected: expected in value.lower(),
+        'gt': gt,
+        'gte': ge,
+        'lt': lt,
+        'lte': le,
+        'null': lambda value, expected: (value is None) == bool(expected),
+        'in': lambda value, expected: value in expected,
+        'notin': lambda value, expected: value not in expected,
+    }
+    index_limit = 32
+
     def acquire(self, subject):
         try:
             subject = int(subject)
@@ -203,11 +654,24 @@ class MockController(StandardController):
 
     def query(self, request, response, subject, data):
         data = data or {}
+        if data.get('offset') and data.get('cursor'):
+            raise OperationError(token='invalid-cursor',
+                message='a cursor cannot be combined with an offset')
+
+        projection = self._construct_projection(request, data)
+        storage = self.storage
+        storage.register(self.resource)
+        if storage.supports(self.resource.name, data.get('query'), data.get('sort')):
+            return self._query_storage(data, projection)
+        elif data.get('cursor'):
+            return self._query_index(data, projection)
+
         resources = self.storage.query(self.resource.name)
 
         query = data.get('query')
         if query:
-            resources = [r for r in resources if self._filter_resource(r, query)]
+            predicate = self._compile_query(query)
+            resources = [resource for resource in resources if predicate(resource)]
 
         total = len(resources)
         if data.get('total'):
@@ -225,11 +689,16 @@ class MockController(StandardController):
         if limit is not None:
             resources = resources[:limit]
 
-        resources = [self._prepare_resource(item, data) for item in resources]
-        return {'resources': resources, 'total': total}
+        content = {'total': total,
+            'resources': [self._prepare_resource(item, projection) for item in resources]}
+        if not offset and 0 < len(resources) < total:
+            fields = self._parse_sorting(sorting or [])[0]
+            content['next_cursor'] = self._construct_cursor(sorting or [], fields,
+                resources[-1])
+        return content
 
     def get(self, request, response, subject, data):
-        response(self._prepare_resource(subject, data or {}))
+        response(self._prepare_resource(subject, self._construct_projection(request, data)))
 
     def create(self, request, response, subject, data):
         id = self.storage.save(self.resource, data, creating=True)
@@ -252,103 +721,171 @@ class MockController(StandardController):
         self.storage.delete(self.resource.name, subject['id'])
         response({'id': subject['id']})
 
-    def _filter_resource(self, resource, query):
+    def _construct_cursor(self, sorting, fields, resource):
+        values = [resource.get(field) for field in fields]
+        return urlsafe_b64encode(json.encode([sorting, values]))
+
+    def _construct_index(self, data, fields, key):
+        sorting = data.get('sort') or []
+        query = data.get('query')
+
+        signature = (self.storage.revision, self.resource.name, tuple(sorting),
+            repr(sorted((query or {}).items())))
+        index = self.storage.indexes.get(signature)
+        if index is not None:
+            return index
+
+        resources = self.storage.query(self.resource.name)
+        if query:
+            predicate = self._compile_query(query)
+            resources = [resource for resource in resources if predicate(resource)]
+
+        resources = self._sort_resources(resources, sorting)
+        keys = [key([resource.get(f) for f in fields]) for resource in resources]
+
+        indexes = self.storage.indexes
+        if len(indexes) >= self.index_limit:
+            indexes.clear()
+
+        indexes[signature] = index = (keys, resources)
+        return index
+
+    def _construct_projection(self, request, data):
+        # the projection is assigned by StandardController.dispatch, which is bypassed
+        # when this controller is reached another way
+        projection = getattr(request, 'projection', None)
+        if projection is None:
+            projection = Projection.construct(self.resource, data)
+        return projection
+
+    def _construct_sort_key(self, sorting):
+        fields, descending = self._parse_sorting(sorting)
+
+        def key(values):
+            return tuple([(Descending(v) if d else v) for v, d in zip(values, descending)])
+        return fields, key
+
+    def _compile_query(self, query):
+        """Compiles ``query`` into a predicate which indicates whether a resource
+        matches every filter in it. Null tests are evaluated first, so that they guard
+        the other tests on the same field."""
+
+        tests = []
         for filter, expected in query.iteritems():
+            attr, operator = filter, 'equal'
             if '__' in filter:
                 attr, operator = filter.rsplit('__', 1)
-                value = resource.get(attr)
-                if operator == 'equal':
-                    if value != expected:
-                        return False
-                elif operator == 'iequal':
-                    if value.lower() != expected:
-                        return False
-                elif operator == 'not':
-                    if value == expected:
-                        return False
-                elif operator == 'inot':
-                    if value.lower() == expected:
-                        return False
-                elif operator == 'prefix':
-                    if not value.startswith(expected):
-                        return False
-                elif operator == 'iprefix':
-                    if not value.lower().startswith(expected):
-                        return False
-                elif operator == 'suffix':
-                    if not value.endswith(expected):
-                        return False
-                elif operator == 'isuffix':
-                    if not value.lower().endswith(expected):
-                        return False
-                elif operator == 'contains':
-                    if expected not in value:
-                        return False
-                elif operator == 'icontains':
-                    if expected not in value.lower():
-                        return False
-                elif operator == 'gt':
-                    if value <= expected:
-                        return False
-                elif operator == 'gte':
-                    if value < expected:
-                        return False
-                elif operator == 'lt':
-                    if value >= expected:
-                        return False
-                elif operator == 'lte':
-                    if value > expected:
-                        return False
-                elif operator == 'null':
-                    if (expected and value is not None) or (not expected and value is None):
-                        return False
-                elif operator == 'in':
-                    if value not in expected:
-                        return False
-                elif operator == 'notin':
-                    if value in expected:
-                        return False
-            elif resource.get(filter) != expected:
-                return False
-        else:
+
+            test = self.filters.get(operator)
+            if test is self.filters['null']:
+                tests.insert(0, (attr, test, expected))
+            elif test:
+                tests.append((attr, test, expected))
+
+        def predicate(resource):
+            get = resource.get
+            for attr, test, expected in tests:
+                if not test(get(attr), expected):
+                    return False
             return True
+        return predicate
+
+    def _parse_cursor(self, sorting, fields, cursor):
+        try:
+            cursor_sorting, values = json.decode(urlsafe_b64decode(str(cursor)))
+            if list(cursor_sorting) != list(sorting) or len(values) != len(fields):
+                raise ValueError(cursor)
+        except Exception:
+            raise OperationError(token='invalid-cursor', message='the cursor is invalid')
+        return values
+
+    def _parse_sorting(self, sorting):
+        fields, descending = [], []
+        for token in sorting:
+            if token[-1] in ('+', '-'):
+                descending.append(token[-1] == '-')
+                token = token[:-1]
+            else:
+                descending.append(False)
+            fields.append(token)
 
-    def _prepare_resource(self, subject, data):
-        include = data.get('include') or []
-        exclude = data.get('exclude') or []
+        id_field = self.resource.id_field.name
+        if id_field not in fields:
+            fields.append(id_field)
+            descending.append(False)
+        return fields, descending
 
-        resource = {}
-        for name, value in subject.iteritems():
-            if name not in self.resource.schema:
-                continue
+    def _prepare_resource(self, subject, projection):
+        return projection.apply(subject)
 
-            field = self.resource.schema[name]
-            if field.is_identifier:
-                resource[name] = value
-            elif name not in exclude:
-                if not (field.deferred and name not in include):
-                    resource[name] = value
+    def _query_index(self, data, projection):
+        sorting = data.get('sort') or []
+        fields, key = self._construct_sort_key(sorting)
+        keys, resources = self._construct_index(data, fields, key)
 
-        return resource
+        total = len(resources)
+        if data.get('total'):
+            return {'total': total}
+
+        start = 0
+        cursor = data.get('cursor')
+        if cursor:
+            start = bisect_right(keys, key(self._parse_cursor(sorting, fields, cursor)))
+
+        end = total
+        limit = data.get('limit')
+        if limit is not None:
+            end = min(start + limit, total)
+
+        content = {'total': total,
+            'resources': [self._prepare_resource(item, projection)
+                for item in resources[start:end]]}
+        if start < end < total:
+            content['next_cursor'] = self._construct_cursor(sorting, fields, resources[end - 1])
+        return content
+
+    def _query_storage(self, data, projection):
+        name, query = self.resource.name, data.get('query')
+        total = self.storage.count(name, query)
+        if data.get('total'):
+            return {'total': total}
+
+        sorting = data.get('sort') or []
+        fields = self._parse_sorting(sorting)[0]
+
+        after = None
+        cursor = data.get('cursor')
+        if cursor:
+            after = self._parse_cursor(sorting, fields, cursor)
+
+        # one resource beyond the limit is selected to learn whether any remain
+        offset, limit = data.get('offset') or 0, data.get('limit')
+        resources = self.storage.select(name, query, sorting, offset,
+            None if limit is None else limit + 1, after)
+
+        remaining = limit is not None and len(resources) > limit
+        if remaining:
+            resources = resources[:limit]
+
+        content = {'total': total,
+            'resources': [self._prepare_resource(item, projection) for item in resources]}
+        if not offset and resources and remaining:
+            content['next_cursor'] = self._construct_cursor(sorting, fields, resources[-1])
+        return content
 
     def _sort_resources(self, resources, sorting):
-        comparators = []
-        for field in sorting:
-            delta = 1
-            if field[-1] in ('+', '-'):
-                if field[-1] == '-':
-                    delta = -1
-                field = field[:-1]
-            comparators.append((itemgetter(field), delta))
-
-        def compare(left, right):
-            for getter, delta in comparators:
-                result = cmp(getter(left), getter(right))
-                if result:
-                    return result * delta
-            return 0
+        """Sorts ``resources`` by ``sorting`` and then by id, in a single pass over
+        key tuples when every field ascends, and otherwise in one stable pass per
+        field, starting from the least significant."""
+
+        fields, descending = self._parse_sorting(sorting)
+        if not any(descending):
+            return sorted(resources, key=lambda r: tuple([r.get(f) for f in fields]))
 
-        return sorted(resources, cmp=compare)
+        resources = list(resources)
+        for field, reverse in reversed(zip(fields, descending)):
+            resources.sort(key=lambda r: r.get(field), reverse=reverse)
+        return resources
 
 def mock_bundle(bundle, storage):
     def mock_mount(mount):
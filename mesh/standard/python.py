@@ -1,16 +1,97 @@
+import sys
 from copy import deepcopy
+from threading import Thread
 
 from mesh.binding.python import Model, Query
 
 class ResultSet(list):
-    def __init__(self, status, models, total=None):
+    def __init__(self, status, models, total=None, cursor=None):
         super(ResultSet, self).__init__(models)
+        self.cursor = cursor
         self.status = status
         self.total = total
 
+class ResultIterator(object):
+    """An iterator over the model instances resulting from a query, which are
+    requested a page at a time from ``pages``, an iterator of ``ResultSet`` values.
+    The total for the query is taken from the first page."""
+
+    def __init__(self, pages):
+        self.page = iter(())
+        self.pages = pages
+        self.started = False
+        self._total = None
+
+    def __iter__(self):
+        return self
+
+    @property
+    def total(self):
+        if not self.started:
+            try:
+                self._advance()
+            except StopIteration:
+                self.started = True
+        return self._total
+
+    def next(self):
+        while True:
+            try:
+                return next(self.page)
+            except StopIteration:
+                self._advance()
+
+    def _advance(self):
+        page = next(self.pages)
+        if not self.started:
+            self.started = True
+            self._total = page.total
+        self.page = iter(page)
+
+class PageFetch(Thread):
+    """Fetches the next page from ``pages`` on a background thread."""
+
+    def __init__(self, pages):
+        Thread.__init__(self)
+        self.daemon = True
+        self.error = None
+        self.page = None
+        self.pages = pages
+        self.start()
+
+    def run(self):
+        try:
+            self.page = next(self.pages, None)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.page
+
+def prefetch_pages(pages):
+    """Iterates over ``pages``, fetching each next page on a background thread
+    while the current page is being consumed."""
+
+    fetch = PageFetch(iter(pages))
+    while True:
+        page = fetch.result()
+        if page is None:
+            return
+
+        fetch = PageFetch(fetch.pages)
+        yield page
+
 class Query(Query):
     """A standard resource query."""
 
+    page_size = 1000
+
+    def __iter__(self):
+        return self.iterate()
+
     def clone(self, **params):
         """Constructs and returns a clone of this query, applying all of the specified
         keyword parameters to the clone. As a special case, if any of the specified
@@ -36,6 +117,12 @@ class Query(Query):
         response = self.model._get_client().execute(self.model._resource, 'query', None, params)
         return response.content.get('total')
 
+    def cursor(self, value):
+        """Constructs and returns a clone of this query set to continue after ``value``,
+        a cursor returned as ``ResultSet.cursor`` by a previous execution of this query."""
+
+        return self.clone(cursor=value, offset=None)
+
     def exclude(self, *fields):
         """Constructs and returns a clone of this query set to exclude one or more
         fields from each resulting resource instance, specified as positional arguments."""
@@ -79,6 +166,19 @@ class Query(Query):
             fields.update(self.params['include'])
         return self.clone(include=list(fields))
 
+    def iterate(self, page_size=None, prefetch=False):
+        """Returns a ``ResultIterator`` which lazily iterates over the model instances
+        resulting from this query, requesting them in pages of at most ``page_size``
+        instances, so that only the current page is held in memory. Pages are continued
+        with cursors when the controller supports them, and with offsets otherwise. If
+        ``prefetch`` is true, each next page is requested on a background thread while
+        the current page is consumed."""
+
+        pages = self._paginate(page_size or self.page_size)
+        if prefetch:
+            pages = prefetch_pages(pages)
+        return ResultIterator(pages)
+
     def limit(self, value):
         """Constructs and returns a clone of this query set to limit the number of
         resulting model instances to no more then ``value``."""
@@ -98,6 +198,23 @@ class Query(Query):
     def one(self):
         return self.limit(1)._execute_query()[0]
 
+    def pages(self, size=None):
+        """Lazily iterates over the results of this query one page at a time, yielding
+        a ``ResultSet`` for each page of at most ``size`` model instances; each page is
+        requested using the cursor of the previous page once that page has been consumed.
+        If the controller does not support cursors, only the first page is yielded."""
+
+        query = self.clone(offset=None)
+        if size is not None:
+            query = query.limit(size)
+
+        while True:
+            results = query._execute_query()
+            yield results
+            if not (results and results.cursor):
+                break
+            query = query.cursor(results.cursor)
+
     def set(self, **params):
         return self.clone(**params)
 
@@ -111,6 +228,28 @@ class Query(Query):
             return self
         return self.clone(sort=fields)
 
+    def _paginate(self, page_size):
+        remaining = self.params.get('limit')
+        offset = self.params.get('offset') or 0
+
+        query = self
+        while remaining is None or remaining > 0:
+            size = page_size
+            if remaining is not None:
+                size = min(page_size, remaining)
+                remaining -= size
+
+            results = query.limit(size)._execute_query()
+            yield results
+            if len(results) < size:
+                break
+
+            if results.cursor:
+                query = self.cursor(results.cursor)
+            else:
+                offset += len(results)
+                query = self.offset(offset)
+
     def _execute_query(self):
         model = self.model
         response = model._get_client().execute(model._resource, 'query', None, self.params or None)
@@ -119,11 +258,38 @@ class Query(Query):
         for resource in response.content.get('resources') or []:
             models.append(model(**resource))
 
-        return ResultSet(response.status, models, response.content.get('total'))
+        return ResultSet(response.status, models, response.content.get('total'),
+            response.content.get('next_cursor'))
+
+PROJECTION_PARAMETERS = frozenset(['exclude', 'fields', 'include'])
 
 class Model(Model):
+    """A standard resource model.
+
+    A model class, or a mixin for it, can specify a default projection for its get,
+    refresh and query requests as ``default_projection``, a dictionary of ``fields``,
+    ``include`` or ``exclude`` parameters which is used whenever a request specifies
+    none of them itself.
+    """
+
     query_class = Query
 
+    @classmethod
+    def query(cls, **params):
+        return super(Model, cls).query(**cls._apply_projection(params))
+
+    def refresh(self, **params):
+        return super(Model, self).refresh(**self._apply_projection(params))
+
+    @classmethod
+    def _apply_projection(cls, params):
+        projection = getattr(cls, 'default_projection', None)
+        if projection and not PROJECTION_PARAMETERS.intersection(params):
+            projection = dict(projection)
+            projection.update(params)
+            return projection
+        return params
+
     @classmethod
     def load(cls, identifiers, attrs=None):
         data = {'identifiers': identifiers}
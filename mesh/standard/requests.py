@@ -92,7 +92,9 @@ class OperatorConstructor(object):
 
 def add_query_operator(resource, operator):
     if 'query' in resource.requests:
-        resource.requests['query'].schema.structure['query'].insert(operator)
+        request = resource.requests['query']
+        request.schema.structure['query'].insert(operator)
+        request.plans = None
     else:
         raise TypeError()
 
@@ -106,6 +108,9 @@ def add_schema_field(resource, field):
 
 
     resource.schema[field.name] = field
+    for request in resource.requests.itervalues():
+        request.plans = None
+
     if 'get' in resource.requests:
         request = resource.requests['get']
         request.responses[OK].schema.insert(field)
@@ -238,6 +243,9 @@ def is_returning_supported(resource, declaration):
 def construct_query_request(resource, declaration=None):
     fields = filter_schema_for_response(resource)
     schema = {
+        'cursor': Text(nonnull=True,
+            description='An opaque cursor, as returned in next_cursor by a previous query,'
+            ' after which to continue this query. Cannot be combined with offset.'),
         'fields': construct_fields_field(fields),
         'limit': Integer(minimum=0,
             description='The maximum number of resources to return for this query.'),
@@ -283,6 +291,9 @@ def construct_query_request(resource, declaration=None):
         'total': Integer(nonnull=True, minimum=0,
             description='The total number of resources in the result set for this query.'),
         'resources': Sequence(Structure(fields), nonnull=True),
+        'next_cursor': Text(nonnull=True,
+            description='An opaque cursor for the next page of this query, if the query'
+            ' was limited and further resources remain and the controller supports cursors.'),
     })
 
     valid_responses = [OK]
@@ -152,17 +152,40 @@ class StartWsgiServer(Task):
         'pidfile': Text(),
         'uid': Text(),
         'gid': Text(),
+        'numthreads': Integer(description='minimum number of worker threads', default=10),
+        'maxthreads': Integer(description='maximum number of worker threads', default=-1),
+        'target_wait': Float(description='target queue wait time in seconds for scaling'
+            ' the worker pool'),
+        'cooldown': Float(description='minimum seconds between worker pool changes',
+            default=10),
+        'park': Boolean(description='park idle keep-alive connections outside the worker'
+            ' pool', default=False),
+        'workers': Integer(description='number of worker processes to prefork, if any',
+            default=0),
+        'reuse_port': Boolean(description='bind a socket in each worker process with'
+            ' SO_REUSEPORT rather than sharing one', default=False),
     }
 
     def run(self, runtime):
-        from mesh.transport.wsgiserver import WsgiServer, DaemonizedWsgiServer
+        from mesh.transport.wsgiserver import (WsgiServer, DaemonizedWsgiServer,
+            PreforkSupervisor)
+        params = {'numthreads': self['numthreads'], 'maxthreads': self['maxthreads'],
+            'target_wait': self['target_wait'], 'cooldown': self['cooldown'],
+            'park_connections': self['park']}
+
         if self['detached']:
-            server = DaemonizedWsgiServer(self['hostname'], self['bundle'])
-            runtime.info('serving at %s' % self['hostname'])
+            server = DaemonizedWsgiServer(self['hostname'], self['bundle'], **params)
+        else:
+            server = WsgiServer(self['hostname'], self['bundle'], **params)
+
+        runtime.info('serving at %s' % self['hostname'])
+        if self['workers'] > 0:
+            if self['detached']:
+                server.daemonize(self['pidfile'], self['uid'], self['gid'])
+            PreforkSupervisor(server, self['workers'], self['reuse_port']).serve()
+        elif self['detached']:
             server.serve(self['pidfile'], self['uid'], self['gid'])
         else:
-            server = WsgiServer(self['hostname'], self['bundle'])
-            runtime.info('serving at %s' % self['hostname'])
             server.serve()
 
 class StartMockServer(Task):
@@ -172,16 +195,24 @@ class StartMockServer(Task):
         'bundle': ObjectReference(description='module path of bundle', required=True),
         'fixtures': Path(description='path to fixtures'),
         'hostname': Text(description='hostname', default='127.0.0.1:8080'),
+        'indexed': Boolean(description='evaluate queries against indexed columns',
+            default=False),
         'storage': Text(description='path to storage db', default=':memory:'),
+        'synchronous': Enumeration('off normal full', default='normal'),
     }
 
     def run(self, runtime):
         from mesh.standard.mock import MockStorage, mock_bundle
         from mesh.transport.wsgiserver import WsgiServer
 
-        storage = MockStorage(self['storage'])
+        storage = MockStorage(self['storage'], indexed=self['indexed'],
+            synchronous=self['synchronous'])
         if self['fixtures']:
-            storage.load(self['fixtures'].bytes(), True)
+            openfile = open(self['fixtures'], 'rb')
+            try:
+                storage.load(openfile, True)
+            finally:
+                openfile.close()
 
         bundle = mock_bundle(self['bundle'], storage)
         server = WsgiServer(self['hostname'], bundle)
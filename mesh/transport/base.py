@@ -5,13 +5,56 @@ from mesh.util import subclass_registry
 from scheme.fields import Field
 from scheme import formats
 
-__all__ = ('STANDARD_FORMATS', 'Client', 'Server', 'ServerRequest', 'ServerResponse', 'Transport')
+__all__ = ('STANDARD_FORMATS', 'Client', 'NdJson', 'Server', 'ServerRequest', 'ServerResponse',
+    'Transport')
 
 STANDARD_FORMATS = (formats.Csv, formats.Json, formats.UrlEncoded, formats.Xml)
 
+class NdJson(formats.Json):
+    """Newline-delimited JSON. A response with a streamed sequence is serialized
+    as a line holding the rest of its content, which names the streamed field
+    under ``_stream``, followed by a line for each item. If an item fails once the
+    response is under way, the stream instead ends with an ``{"_error": status}``
+    record, which :meth:`unserialize` raises as the corresponding request error."""
+
+    mimetype = 'application/x-ndjson'
+    name = 'ndjson'
+
+    ERROR = '_error'
+    STREAM = '_stream'
+
+    @classmethod
+    def serialize(cls, value, **params):
+        return formats.Json.serialize(value, **params) + '\n'
+
+    @classmethod
+    def unserialize(cls, value, **params):
+        lines = []
+        for line in value.splitlines():
+            if line.strip():
+                line = formats.Json.unserialize(line, **params)
+                if isinstance(line, dict) and line.keys() == [cls.ERROR]:
+                    status = line[cls.ERROR]
+                    raise RequestError.construct(status) or ServerError()
+                lines.append(line)
+
+        if not lines:
+            return None
+
+        content = lines[0]
+        if isinstance(content, dict) and cls.STREAM in content:
+            content[content.pop(cls.STREAM)] = lines[1:]
+            return content
+        elif len(lines) == 1:
+            return content
+        else:
+            return lines
+
 class ServerRequest(object):
     """An API request."""
 
+    __slots__ = ('context', 'data', 'endpoint', 'serialized', 'subject', '__dict__')
+
     def __init__(self, endpoint=None, context=None, subject=None, data=None, serialized=False):
         self.context = context
         self.data = data
@@ -29,6 +72,8 @@ class ServerRequest(object):
 class ServerResponse(object):
     """An API response."""
 
+    __slots__ = ('content', 'headers', 'mimetype', 'status', '__dict__')
+
     def __init__(self, status=None, content=None, mimetype=None, headers=None):
         self.content = content
         self.headers = headers or {}
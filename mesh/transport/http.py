@@ -1,21 +1,30 @@
 import errno
 import re
+import select
 import socket
 from cgi import parse_header
-from httplib import HTTPConnection, HTTPSConnection
+from collections import OrderedDict, deque
+from hashlib import md5
+from itertools import chain
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from time import time
 from urlparse import urlparse
 
 from scheme import formats
+from scheme.exceptions import StructuralError, ValidationError
 from scheme.fields import INCOMING, OUTGOING
 
-from mesh.bundle import Specification
+from mesh.bundle import Specification, format_version
 from mesh.constants import *
 from mesh.exceptions import *
+from mesh.request import StreamedSequence
 from mesh.transport.base import *
 from mesh.transport.multipart import MultipartPayload, MultipartEncoder, parse_multipart_mixed
 from mesh.util import LogHelper
 
-__all__ = ('HttpClient', 'HttpProxy', 'HttpRequest', 'HttpResponse', 'HttpServer')
+__all__ = ('HttpClient', 'HttpProxy', 'HttpRequest', 'HttpResponse', 'HttpServer', 'ResponseCache')
 
 log = LogHelper(__name__)
 
@@ -25,6 +34,7 @@ STATUS_CODES = {
     ACCEPTED: 202,
     SUBSET: 203,
     PARTIAL: 206,
+    NOT_MODIFIED: 304,
     BAD_REQUEST: 400,
     UNAUTHORIZED: 401,
     FORBIDDEN: 403,
@@ -49,6 +59,7 @@ STATUS_LINES = {
     ACCEPTED: '202 Accepted',
     SUBSET: '203 Subset',
     PARTIAL: '206 Partial',
+    NOT_MODIFIED: '304 Not Modified',
     BAD_REQUEST: '400 Bad Request',
     UNAUTHORIZED: '401 Unauthorized',
     FORBIDDEN: '403 Forbidden',
@@ -86,8 +97,116 @@ INTROSPECTION_PATH_EXPR = r"""(?x)^%s
     (?:[!](?P<format>\w+))?
     /?$"""
 
+class ConnectionPool(object):
+    """A thread-safe pool of persistent HTTP connections to a single host.
+
+    :param implementation: The ``httplib`` connection class used to open new
+        connections.
+
+    :param str host: The host (and optional port) to connect to.
+
+    :param timeout: Optional, default is ``None``; the socket timeout for new
+        connections.
+
+    :param int maxsize: Optional, default is ``10``; the maximum number of idle
+        connections retained by this pool.
+
+    :param int idle_timeout: Optional, default is ``60``; the number of seconds an
+        idle connection is retained before it is evicted.
+    """
+
+    def __init__(self, implementation, host, timeout=None, maxsize=10, idle_timeout=60):
+        self.connections = deque()
+        self.host = host
+        self.idle_timeout = idle_timeout
+        self.implementation = implementation
+        self.lock = Lock()
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'retries': 0}
+
+    def __repr__(self):
+        return 'ConnectionPool(host=%r, idle=%d)' % (self.host, len(self.connections))
+
+    def acquire(self):
+        """Acquires a connection from this pool, returning a two-tuple containing the
+        connection and a ``bool`` indicating whether it is a reused connection."""
+
+        evicted = []
+        try:
+            with self.lock:
+                threshold = time() - self.idle_timeout
+                connections = self.connections
+                while connections and connections[0][1] < threshold:
+                    evicted.append(connections.popleft()[0])
+                    self.stats['evictions'] += 1
+
+                while connections:
+                    connection = connections.pop()[0]
+                    if self._is_stale(connection):
+                        evicted.append(connection)
+                        self.stats['evictions'] += 1
+                        continue
+                    self.stats['hits'] += 1
+                    return connection, True
+
+                self.stats['misses'] += 1
+        finally:
+            for connection in evicted:
+                connection.close()
+
+        return self.create(), False
+
+    def clear(self):
+        """Closes and discards all idle connections in this pool."""
+
+        with self.lock:
+            connections = [connection for connection, released in self.connections]
+            self.connections.clear()
+
+        for connection in connections:
+            connection.close()
+
+    def create(self):
+        return self.implementation(self.host, timeout=self.timeout)
+
+    def _is_stale(self, connection):
+        # An idle connection should have nothing to read; if it does, the server has
+        # most likely closed it, and a request sent on it would fail.
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (select.error, socket.error, ValueError):
+            return True
+
+    def record(self, counter):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def release(self, connection):
+        """Returns ``connection`` to this pool, closing it if the pool is full."""
+
+        with self.lock:
+            if len(self.connections) < self.maxsize:
+                self.connections.append((connection, time()))
+                return
+            self.stats['evictions'] += 1
+
+        connection.close()
+
 class Connection(object):
-    def __init__(self, url, timeout=None):
+    """An HTTP connection to the service at ``url``.
+
+    A request which fails on a reused keep-alive connection is retried once on a
+    new connection if it failed before it was fully sent, or if its method is
+    idempotent; requests which time out are never retried.
+    """
+
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, url, timeout=None, pool_size=10, idle_timeout=60):
         self.scheme, self.host, self.path = urlparse(url)[:3]
         self.path = self.path.rstrip('/')
         self.timeout = timeout
@@ -99,8 +218,13 @@ class Connection(object):
         else:
             raise ValueError(url)
 
+        self.pool = None
+        if pool_size:
+            self.pool = ConnectionPool(self.implementation, self.host, timeout,
+                pool_size, idle_timeout)
+
     def request(self, method, url=None, body=None, headers=None,
-            mimetype=None, serialize=False):
+            mimetype=None, serialize=False, timeout=None):
 
         if url:
             if url[0] != '/':
@@ -127,12 +251,170 @@ class Connection(object):
         if 'Content-Type' not in headers and mimetype:
             headers['Content-Type'] = mimetype
 
-        connection = self.implementation(self.host, timeout=self.timeout)
+        pool = self.pool
+        if pool:
+            connection, reused = pool.acquire()
+        else:
+            connection, reused = self.implementation(self.host, timeout=self.timeout), False
+
+        if timeout is not None:
+            self._set_timeout(connection, timeout)
+
+        sent = False
+        try:
+            self._send_request(connection, method, url, body, headers, multipart)
+            sent = True
+            response = self._receive_response(connection, url)
+        except ConnectionTimedOut:
+            connection.close()
+            raise
+        except (ConnectionFailed, HTTPException):
+            connection.close()
+            if not reused or multipart or (sent and method not in self.IDEMPOTENT_METHODS):
+                raise
+
+            pool.record('retries')
+            connection = pool.create()
+            if timeout is not None:
+                self._set_timeout(connection, timeout)
+            try:
+                response = self._perform_request(connection, method, url, body, headers, multipart)
+            except Exception:
+                connection.close()
+                raise
+
+        try:
+            content = response.read() or None
+        except Exception:
+            connection.close()
+            raise
+
+        if pool and not response.will_close:
+            if timeout is not None:
+                self._set_timeout(connection, self.timeout)
+            pool.release(connection)
+        else:
+            connection.close()
+
+        headers = dict((key.title(), value) for key, value in response.getheaders())
+        mimetype = response.getheader('Content-Type', None)
+        return HttpResponse(STATUS_CODES[response.status], content, mimetype, headers)
+
+    def stream(self, method, url=None, body=None, headers=None, length=None, chunksize=65536):
+        """Issues a request without buffering either body, returning a
+        :class:`StreamingResponse`. If specified, ``body`` must be a file-like object;
+        it is sent with a ``Content-Length`` of ``length`` if specified, and with chunked
+        transfer encoding otherwise."""
+
+        if url:
+            if url[0] != '/':
+                url = '/' + url
+        else:
+            url = ''
+        url = (self.path + url).replace(' ', '%20')
+
+        pool = self.pool
+        if pool and body is None:
+            connection, reused = pool.acquire()
+        elif pool:
+            connection, reused = pool.create(), False
+        else:
+            connection, reused = self.implementation(self.host, timeout=self.timeout), False
+
+        sent = False
+        try:
+            self._send_streaming_request(connection, method, url, body, headers or {},
+                length, chunksize)
+            sent = True
+            response = self._receive_response(connection, url)
+        except ConnectionTimedOut:
+            connection.close()
+            raise
+        except (ConnectionFailed, HTTPException):
+            connection.close()
+            if not reused or (sent and method not in self.IDEMPOTENT_METHODS):
+                raise
+
+            pool.record('retries')
+            connection = pool.create()
+            try:
+                response = self._perform_streaming_request(connection, method, url, body,
+                    headers or {}, length, chunksize)
+            except Exception:
+                connection.close()
+                raise
+
+        return StreamingResponse(connection, response, pool, chunksize)
+
+    def _perform_streaming_request(self, connection, method, url, body, headers, length,
+            chunksize):
+
+        self._send_streaming_request(connection, method, url, body, headers, length,
+            chunksize)
+        return self._receive_response(connection, url)
+
+    def _send_streaming_request(self, connection, method, url, body, headers, length,
+            chunksize):
+
+        try:
+            connection.putrequest(method, url)
+            for header, value in headers.iteritems():
+                connection.putheader(header, value)
+
+            if body is not None:
+                if length is None:
+                    connection.putheader('Transfer-Encoding', 'chunked')
+                else:
+                    connection.putheader('Content-Length', str(length))
+            connection.endheaders()
+
+            if body is not None:
+                self._send_streaming_body(connection, body, length, chunksize)
+        except socket.timeout:
+            raise ConnectionTimedOut(url)
+        except socket.error, exception:
+            if exception.errno in (errno.EACCES, errno.EPERM, errno.ECONNREFUSED):
+                raise ConnectionRefused(url)
+            elif exception.errno == errno.ETIMEDOUT:
+                raise ConnectionTimedOut(url)
+            else:
+                raise ConnectionFailed(url)
+
+    def _send_streaming_body(self, connection, body, length, chunksize):
+        if length is None:
+            while True:
+                chunk = body.read(chunksize)
+                if not chunk:
+                    break
+                connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+            connection.send('0\r\n\r\n')
+            return
+
+        remaining = length
+        while remaining > 0:
+            chunk = body.read(min(chunksize, remaining))
+            if not chunk:
+                raise ValueError('request body shorter than content length')
+            connection.send(chunk)
+            remaining -= len(chunk)
+
+    def _set_timeout(self, connection, timeout):
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+    def _perform_request(self, connection, method, url, body, headers, multipart):
+        self._send_request(connection, method, url, body, headers, multipart)
+        return self._receive_response(connection, url)
+
+    def _send_request(self, connection, method, url, body, headers, multipart):
         try:
             if multipart:
                 self._send_multipart_request(connection, method, url, body, headers)
             else:
                 connection.request(method, url, body, headers)
+        except socket.timeout:
+            raise ConnectionTimedOut(url)
         except socket.error, exception:
             if exception.errno in (errno.EACCES, errno.EPERM, errno.ECONNREFUSED):
                 raise ConnectionRefused(url)
@@ -140,40 +422,80 @@ class Connection(object):
                 raise ConnectionTimedOut(url)
             else:
                 raise ConnectionFailed(url)
-        except socket.timeout:
-            raise ConnectionTimedOut(url)
 
+    def _receive_response(self, connection, url):
         try:
-            response = connection.getresponse()
-        except socket.error, exception:
-            raise ConnectionFailed(url)
+            return connection.getresponse()
         except socket.timeout:
             raise ConnectionTimedOut(url)
-
-        headers = dict((key.title(), value) for key, value in response.getheaders())
-        content = response.read() or None
-
-        mimetype = response.getheader('Content-Type', None)
-        return HttpResponse(STATUS_CODES[response.status], content, mimetype, headers)
+        except socket.error, exception:
+            if exception.errno == errno.ETIMEDOUT:
+                raise ConnectionTimedOut(url)
+            raise ConnectionFailed(url)
 
     def _send_multipart_request(self, connection, method, url, body, headers):
-        connection.connect()
+        if connection.sock is None:
+            connection.connect()
         connection.putrequest(method, url)
 
         for header, value in headers.iteritems():
             connection.putheader(header, value)
 
         connection.endheaders()
+        for chunk in body.iterate(2097152):
+            connection.send(chunk)
+
+class StreamingResponse(object):
+    """A WSGI iterable which streams the body of an upstream response in chunks
+    of at most ``chunksize`` bytes, releasing the upstream connection when closed."""
+
+    HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-authenticate',
+        'proxy-authorization', 'te', 'trailers', 'transfer-encoding', 'upgrade')
+
+    def __init__(self, connection, response, pool=None, chunksize=65536):
+        self.chunksize = chunksize
+        self.completed = False
+        self.connection = connection
+        self.pool = pool
+        self.response = response
+
+    def __iter__(self):
+        read, chunksize = self.response.read, self.chunksize
         while True:
-            chunk = body.next_chunk(2097152)
-            if chunk:
-                connection.send(chunk)
-            else:
+            chunk = read(chunksize)
+            if not chunk:
                 break
+            yield chunk
+        self.completed = True
+
+    @property
+    def headers(self):
+        return [(name.title(), value) for name, value in self.response.getheaders()
+            if name.lower() not in self.HOP_BY_HOP_HEADERS]
+
+    @property
+    def status_line(self):
+        return '%d %s' % (self.response.status, self.response.reason)
+
+    def close(self):
+        connection = self.connection
+        if connection is None:
+            return
+
+        self.connection = None
+        if self.completed and self.pool and not self.response.will_close:
+            self.pool.release(connection)
+        else:
+            connection.close()
 
 class HttpRequest(ServerRequest):
     """An HTTP API request."""
 
+    __slots__ = ('accept', 'format', 'headers', 'method', 'mimetype', 'path')
+
+    accept_headers = {}
+    accept_headers_limit = 256
+
     def __init__(self, method=None, path=None, mimetype=None, headers=None,
         context=None, serialized=True, **params):
 
@@ -206,13 +528,29 @@ class HttpRequest(ServerRequest):
         if not header:
             return
 
-        mimetype = header.split(';', 1)[0]
-        if mimetype in formats.Format.formats:
-            return parse_header(header)
+        try:
+            accept = self.accept_headers[header]
+        except KeyError:
+            accept = None
+            mimetype = header.split(';', 1)[0]
+            if mimetype in formats.Format.formats:
+                accept = parse_header(header)
+
+            accept_headers = self.accept_headers
+            if len(accept_headers) >= self.accept_headers_limit:
+                accept_headers.clear()
+            accept_headers[header] = accept
+
+        # the cached params are shared by every request with the same header, so each
+        # request receives its own copy of them
+        if accept:
+            return (accept[0], dict(accept[1]))
 
 class HttpResponse(ServerResponse):
     """An HTTP response."""
 
+    __slots__ = ()
+
     @property
     def status_code(self):
         return STATUS_CODES[self.status]
@@ -233,12 +571,15 @@ class HttpResponse(ServerResponse):
                 for chunk in self.content:
                     content_length += len(chunk)
                 headers['Content-Length'] = str(content_length)
-            else:
+            elif self.content is None or isinstance(self.content, basestring):
                 headers['Content-Length'] = str(len(self.content or ''))
 
 class Path(object):
     """An HTTP path."""
 
+    __slots__ = ('bundle', 'format', 'path', 'preamble', 'request', 'resource', 'signature',
+        'subject', 'subresource', 'subsubject', 'type', '__dict__')
+
     def __init__(self, server, path):
         self.path = path
 
@@ -256,16 +597,39 @@ class Path(object):
     def __str__(self):
         return self.path
 
+    def __eq__(self, other):
+        return isinstance(other, Path) and self.attrs == other.attrs
+
+    def __ne__(self, other):
+        return not self == other
+
     def __repr__(self):
         tokens = []
-        for attr, value in sorted(self.__dict__.iteritems()):
+        for attr, value in sorted(self.attrs.iteritems()):
             tokens.append('%s=%r' % (attr, value))
         return 'Path(%s)' % ', '.join(tokens)
 
+    @property
+    def attrs(self):
+        attrs = dict(self.__dict__)
+        for attr in self.__slots__:
+            if attr != '__dict__' and hasattr(self, attr):
+                attrs[attr] = getattr(self, attr)
+        return attrs
+
+    @classmethod
+    def construct(cls, path, **attrs):
+        instance = cls.__new__(cls)
+        instance.path = path
+        for attr, value in attrs.iteritems():
+            setattr(instance, attr, value)
+        return instance
+
     def _parse_format(self, server, path, match):
-        self.format = match.group('format')
-        if self.format is not None and self.format not in server.formats:
+        format = match.group('format')
+        if format is not None and format not in server.formats:
             raise ValueError(path)
+        return format
 
     def _parse_introspection_path(self, server, path, match):
         self.type = 'introspection'
@@ -301,46 +665,408 @@ class Path(object):
             tokens.append('id')
         self.signature = (self.preamble, '/'.join(tokens))
 
+class RouteTable(object):
+    """A precompiled route table for an HTTP server.
+
+    Request paths are resolved by splitting them into segments and looking up
+    the bundle preamble and endpoint signature directly, instead of matching
+    them against ``PATH_EXPR``. Paths which cannot be resolved here are left to
+    :class:`Path`, so that unusual but valid paths are handled as before.
+    """
+
+    SUBJECT_EXPR = re.compile(r'^[-.:;\w]+$')
+
+    def __init__(self, path_prefix, bundles, formats):
+        self.bundles = bundles
+        self.formats = formats
+        self.path_prefix = path_prefix
+        self.preambles = {}
+        self.routes = {}
+        self.sizes = []
+
+    def add(self, preamble, path, groups):
+        key = tuple(format_version(token) for token in preamble)
+        if key not in self.preambles:
+            self.preambles[key] = preamble
+            self.sizes = sorted(set(self.sizes) | set([len(key)]), reverse=True)
+
+        self.routes[(key, path)] = ((preamble, path), groups)
+
+    def resolve(self, path):
+        candidate = path
+        if self.path_prefix:
+            if not candidate.startswith(self.path_prefix):
+                return None
+            candidate = candidate[len(self.path_prefix):]
+
+        if candidate[-1:] == '/':
+            candidate = candidate[:-1]
+        if candidate[:1] != '/':
+            return None
+
+        segments = candidate[1:].split('/')
+        format = None
+
+        last = segments[-1]
+        if '!' in last:
+            last, format = last.split('!', 1)
+            if format not in self.formats:
+                return None
+            segments[-1] = last
+
+        total = len(segments)
+        if total == 2 and segments[1][:1] == '_':
+            if segments[0] in self.bundles:
+                return Path.construct(path, type='introspection', bundle=segments[0],
+                    request=segments[1][1:], format=format), None
+            return None
+
+        for size in self.sizes:
+            remaining = total - size
+            if remaining < 1 or remaining > 4:
+                continue
+
+            key = tuple(segments[:size])
+            if key not in self.preambles:
+                continue
+
+            subject = subresource = subsubject = None
+            resource = segments[size]
+            signature = resource
+
+            if remaining > 1:
+                subject = segments[size + 1]
+                if not self.SUBJECT_EXPR.match(subject):
+                    return None
+                signature += '/id'
+            if remaining > 2:
+                subresource = segments[size + 2]
+                signature += '/' + subresource
+            if remaining > 3:
+                subsubject = segments[size + 3]
+                if not self.SUBJECT_EXPR.match(subsubject):
+                    return None
+                signature += '/id'
+
+            route = self.routes.get((key, signature))
+            if not route:
+                return None
+
+            signature, groups = route
+            return Path.construct(path, type='request', format=format, preamble=signature[0],
+                resource=resource, subject=subject, subresource=subresource,
+                subsubject=subsubject, signature=signature), groups
+
+class ResponseCache(object):
+    """A size-bounded LRU cache of serialized ``GET`` responses for an HTTP server.
+
+    :param int maxsize: Optional, default is ``1024``; the maximum number of
+        responses retained by this cache.
+
+    :param int ttl: Optional, default is ``60``; the number of seconds a cached
+        response remains valid.
+
+    :param resources: Optional, default is ``None``; if specified, a list of
+        names of the resources whose responses should be cached, or a
+        space-delimited ``str`` of them. If omitted, ``get`` and ``query``
+        responses for all resources are cached.
+
+    :param identity_headers: Optional, default is ``None``; a list of the WSGI
+        environ keys of the request headers which identify the caller, such as
+        ``HTTP_AUTHORIZATION`` and ``HTTP_COOKIE``, or a space-delimited ``str``
+        of them.
+
+    :param identity_keys: Optional, default is ``None``; a list of the keys of
+        the request context which identify the caller, or a space-delimited
+        ``str`` of them.
+
+    Responses are cached separately for each caller, as identified by the values
+    of the identity headers and context keys, and a cached response is only
+    served once the request has passed its mediators, request validation and
+    subject acquisition. A cache with neither identity headers nor identity keys
+    caches nothing.
+
+    Each invalidation advances the generation of the invalidated tag; a response
+    is only stored by :meth:`put` if its tag has not been invalidated since the
+    generation obtained from :meth:`generation` before the response was dispatched.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, resources=None, identity_headers=None,
+            identity_keys=None):
+
+        if isinstance(resources, basestring):
+            resources = resources.split(' ')
+        if isinstance(identity_headers, basestring):
+            identity_headers = identity_headers.split(' ')
+        if isinstance(identity_keys, basestring):
+            identity_keys = identity_keys.split(' ')
+
+        self.identity_headers = tuple(identity_headers or ())
+        self.identity_keys = tuple(identity_keys or ())
+        if not (self.identity_headers or self.identity_keys):
+            log('warning', 'response cache has no identity headers or keys and will'
+                ' cache nothing')
+
+        self.cleared = 0
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = Lock()
+        self.maxsize = maxsize
+        self.resources = set(resources) if resources else None
+        self.tags = {}
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def covers(self, resource):
+        if not (self.identity_headers or self.identity_keys):
+            return False
+        return self.resources is None or resource.name in self.resources
+
+    def identify(self, request):
+        """Returns the values of the identity headers and keys of ``request``."""
+
+        headers, context = request.headers or {}, request.context or {}
+        return (tuple([headers.get(name) for name in self.identity_headers]),
+            tuple([context.get(key) for key in self.identity_keys]))
+
+    def generation(self, tag):
+        """Returns the current generation of ``tag``, to be passed to :meth:`put`."""
+
+        with self.lock:
+            return (self.cleared, self.generations.get(tag, 0))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry and entry[0] > time():
+                self.entries[key] = entry
+                self.stats['hits'] += 1
+                return entry
+            elif entry:
+                self._discard(key, entry)
+            self.stats['misses'] += 1
+
+    def invalidate(self, tag=None):
+        """Discards all cached responses for the resource identified by ``tag``, a
+        two-tuple of the bundle names of the preamble and the resource name, or all
+        cached responses if ``tag`` is not specified."""
+
+        with self.lock:
+            if tag is None:
+                self.cleared += 1
+                self.entries.clear()
+                self.tags.clear()
+                self.stats['invalidations'] += 1
+                return
+
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+            keys = self.tags.pop(tag, None)
+            if keys:
+                for key in keys:
+                    self.entries.pop(key, None)
+                self.stats['invalidations'] += 1
+
+    def put(self, key, tag, response, generation=None):
+        """Caches ``response`` under ``key``, returning its etag, unless ``tag`` has been
+        invalidated since ``generation`` was obtained."""
+
+        content = response.content
+        if not (isinstance(content, list) and all(isinstance(c, str) for c in content)):
+            return
+
+        etag = '"%s"' % md5(''.join(content)).hexdigest()
+        entry = (time() + self.ttl, etag, tag, content, response.mimetype)
+
+        with self.lock:
+            if generation is not None and generation != (self.cleared,
+                    self.generations.get(tag, 0)):
+                return
+
+            previous = self.entries.pop(key, None)
+            if previous:
+                self._discard(key, previous)
+
+            self.entries[key] = entry
+            self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._discard(*self.entries.popitem(last=False))
+                self.stats['evictions'] += 1
+
+        return etag
+
+    def _discard(self, key, entry):
+        keys = self.tags.get(entry[2])
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self.tags[entry[2]]
+
 class EndpointGroup(object):
-    """An HTTP endpoint group."""
+    """An HTTP endpoint group.
+
+    Filtered requests are indexed on the values of their filter attributes, so that
+    a request is claimed with a dictionary lookup for each distinct set of filter
+    attributes. Since the first filtered request to claim a request is dispatched,
+    two filters which could both claim the same request are ambiguous, and are
+    rejected when attached.
+    """
 
     def __init__(self, signature, method, resource, controller, mediators):
         self.controller = controller
         self.default_request = None
+        self.filter_index = {}
+        self.filter_keys = []
         self.filtered_requests = []
         self.mediators = mediators
         self.method = method
         self.resource = resource
         self.signature = signature
+        self.unindexed_requests = []
 
     def attach(self, request):
         if request.filter is not None:
-            self.filtered_requests.append(request)
+            self._attach_filtered_request(request)
         elif self.default_request is None:
             self.default_request = request
         else:
             raise SpecificationError(request)
 
-    def dispatch(self, request, response):
-        definition = self.default_request
-        for filtered_request in self.filtered_requests:
-            if filtered_request.claim(request.data):
-                definition = filtered_request
-                break
+    def claim(self, data):
+        """Returns the filtered request which claims ``data``, if any."""
+
+        if isinstance(data, dict):
+            shape, item = dict, data
+        elif isinstance(data, list):
+            shape, item = list, (data[0] if data and data[0] else None)
+        else:
+            return None
+
+        index = self.filter_index
+        for key in self.filter_keys:
+            if key[0] is not shape:
+                continue
+
+            attrs = key[1]
+            if attrs:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    candidate = index[key].get(tuple([item.get(attr) for attr in attrs]))
+                except TypeError:
+                    continue
+            else:
+                candidate = index[key].get(())
+
+            if candidate:
+                return candidate
+
+        for filtered_request in self.unindexed_requests:
+            if filtered_request.claim(data):
+                return filtered_request
 
+    def dispatch(self, request, response):
+        definition = self._resolve_definition(request)
         if not definition:
             return response(BAD_REQUEST)
 
         definition.process(self.controller, request, response, self.mediators)
 
+    def screen(self, request, response):
+        """Indicates whether ``request`` passes the mediators, request validation and
+        subject acquisition of the request which would process it, without dispatching
+        it."""
+
+        definition = self._resolve_definition(request)
+        if not definition:
+            response(BAD_REQUEST)
+            return False
+
+        return definition.screen(self.controller, request, response, self.mediators)
+
+    def _attach_filtered_request(self, request):
+        shape, filter = self._normalize_filter(request.filter)
+        for other in self.filtered_requests:
+            other_shape, other_filter = self._normalize_filter(other.filter)
+            if other_shape is shape and filter is not None and other_filter is not None:
+                for attr in set(filter) & set(other_filter):
+                    if filter[attr] != other_filter[attr]:
+                        break
+                else:
+                    raise SpecificationError('request %s has a filter which is ambiguous'
+                        ' with request %s' % (request, other))
+
+        self.filtered_requests.append(request)
+        if filter is None:
+            self.unindexed_requests.append(request)
+            return
+
+        attrs = tuple(sorted(filter))
+        values = tuple([filter[attr] for attr in attrs])
+        try:
+            hash(values)
+        except TypeError:
+            self.unindexed_requests.append(request)
+            return
+
+        key = (shape, attrs)
+        if key not in self.filter_index:
+            self.filter_index[key] = {}
+            self.filter_keys.append(key)
+        self.filter_index[key][values] = request
+
+    def _resolve_definition(self, request):
+        definition = None
+        if self.filtered_requests:
+            definition = self.claim(request.data)
+        return definition or self.default_request
+
+    def _normalize_filter(self, filter):
+        shape = type(filter)
+        if isinstance(filter, list):
+            shape = list
+            if filter and filter[0]:
+                filter = filter[0]
+            else:
+                return list, {}
+        elif isinstance(filter, dict):
+            shape = dict
+
+        if isinstance(filter, dict):
+            return shape, filter
+        else:
+            return shape, None
+
+class ClosingContent(object):
+    """A WSGI response body which calls ``callback`` when the server closes it."""
+
+    def __init__(self, content, callback):
+        if isinstance(content, basestring):
+            content = [content]
+
+        self.callback = callback
+        self.content = content
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        try:
+            close = getattr(self.content, 'close', None)
+            if close:
+                close()
+        finally:
+            self.callback()
+
 class WsgiServer(Server):
     def __init__(self, default_format=None, available_formats=None, mediators=None,
-            context_key=None):
+            context_key=None, spool_threshold=65536):
 
         super(WsgiServer, self).__init__(default_format or formats.Json, available_formats, mediators)
         self.context_key = context_key
+        self.spool_threshold = spool_threshold
 
     def __call__(self, environ, start_response):
+        cleanup = None
         try:
             method = environ['REQUEST_METHOD']
             mimetype = environ.get('CONTENT_TYPE')
@@ -352,6 +1078,9 @@ class WsgiServer(Server):
                 start_response('400 Bad Request', [])
                 return ''
 
+            if isinstance(data, MultipartPayload):
+                cleanup = data.cleanup
+
             context = {}
             if self.context_key and self.context_key in environ:
                 context = environ[self.context_key]
@@ -359,16 +1088,26 @@ class WsgiServer(Server):
             path_info = environ['PATH_INFO']
             response = self.dispatch(method, path_info, mimetype, context, environ, data)
 
-            log('verbose', 'for: %s request %s:%s data=%s \t\tresponse status:%s, content=%s'
-                % (environ['REMOTE_ADDR'], method, path_info, str(data), response.status, response.content))
+            log('verbose', 'for: %s request %s:%s data=%s \t\tresponse status:%s, content=%s',
+                environ.get('REMOTE_ADDR'), method, path_info, data, response.status,
+                response.content)
 
             response.apply_standard_headers()
             start_response(response.status_line, response.headers.items())
-            return response.content or ''
+
+            # streamed content may still read the attachments of the request, so they
+            # are only removed once the server closes the response body
+            content = response.content or ''
+            if cleanup:
+                content, cleanup = ClosingContent(content, cleanup), None
+            return content
         except Exception, exception:
             log('exception', 'exception raised during wsgi dispatch')
             start_response('500 Internal Server Error', [])
             return ''
+        finally:
+            if cleanup:
+                cleanup()
 
     def _parse_request_data(self, environ, method, mimetype):
         if method == GET:
@@ -378,7 +1117,7 @@ class WsgiServer(Server):
 
         input = environ['wsgi.input']
         if mimetype and 'multipart/mixed' in mimetype:
-            return parse_multipart_mixed(input, mimetype)
+            return parse_multipart_mixed(input, mimetype, spool_threshold=self.spool_threshold)
         else:
             return input.read()
 
@@ -392,17 +1131,27 @@ class HttpServer(WsgiServer):
         'Access-Control-Max-Age': '2592000',
     }
 
+    stream_chunksize = 65536
+
     def __init__(self, bundles, path_prefix=None, default_format=None,
-            available_formats=None, mediators=None, context_key=None):
+            available_formats=None, mediators=None, context_key=None, batch_workers=0,
+            cache=None, spool_threshold=65536):
 
         super(HttpServer, self).__init__(default_format, available_formats,
-            mediators, context_key)
+            mediators, context_key, spool_threshold)
+
+        self.cache = cache
+
+        self.batch_lock = Lock()
+        self.batch_pool = None
+        self.batch_workers = batch_workers
 
         if path_prefix:
             path_prefix = '/' + path_prefix.strip('/')
         else:
             path_prefix = ''
 
+        self.path_prefix = path_prefix
         self.path_expr = re.compile(PATH_EXPR % path_prefix)
         self.introspection_path_expr = re.compile(INTROSPECTION_PATH_EXPR % path_prefix)
 
@@ -418,6 +1167,7 @@ class HttpServer(WsgiServer):
 
     def configure_endpoints(self):
         self.groups = {}
+        self.routes = RouteTable(self.path_prefix, self.bundles, self.formats)
         for name, bundle in self.bundles.iteritems():
             for version, candidates in bundle.versions.iteritems():
                 preamble = [name, version]
@@ -433,6 +1183,9 @@ class HttpServer(WsgiServer):
                         for request in resource.requests.itervalues():
                             self._construct_endpoint(preamble, resource, controller, request)
 
+        for signature, groups in self.groups.iteritems():
+            self.routes.add(signature[0], signature[1], groups)
+
     def dispatch(self, method, path, mimetype, context, headers, data):
         response = HttpResponse()
         if method == OPTIONS:
@@ -450,9 +1203,10 @@ class HttpServer(WsgiServer):
         if mimetype not in self.formats:
             mimetype = URLENCODED
 
-        try:
-            path = Path(self, path)
-        except Exception:
+        route = self._resolve_path(path)
+        if route:
+            path, groups = route
+        else:
             log('info', 'no path found for %s', path)
             return response(NOT_FOUND)
 
@@ -460,10 +1214,11 @@ class HttpServer(WsgiServer):
         request.format = self._identify_response_format(request)
 
         if path.type == 'introspection':
+            if path.request == 'batch':
+                return self._dispatch_batch(request, response, data)
             return self._dispatch_introspection(request, response)
 
-        if path.signature in self.groups:
-            groups = self.groups[path.signature]
+        if groups:
             if method in groups:
                 group = groups[method]
             else:
@@ -486,12 +1241,19 @@ class HttpServer(WsgiServer):
                     log('exception', 'failed to parse data for %r', request)
                     return response(BAD_REQUEST)
 
+        cache = self.cache
+        if cache and method == GET and cache.covers(group.resource):
+            return self._dispatch_cached_request(request, response, group, data)
+
         try:
             group.dispatch(request, response)
         except Exception:
             log('exception', 'exception raised during dispatch of %r', request)
             return response(SERVER_ERROR)
 
+        if cache and method != GET and response.ok:
+            cache.invalidate(self._identify_cache_tag(path, group))
+
         if response.content:
             self._prepare_response_content(request, response)
 
@@ -518,6 +1280,128 @@ class HttpServer(WsgiServer):
 
         group.attach(request)
 
+    def _dispatch_cached_request(self, request, response, group, data):
+        path, headers = request.path, request.headers or {}
+        context = request.context
+        if context:
+            context = repr(sorted(context.iteritems()))
+
+        key = (path.signature, path.subject, path.subsubject, path.format, data,
+            headers.get('HTTP_ACCEPT'), context, self.cache.identify(request))
+
+        tag = self._identify_cache_tag(path, group)
+        entry = self.cache.get(key)
+        if entry:
+            if not group.screen(request, response):
+                return response
+            etag, content, mimetype = entry[1], entry[3], entry[4]
+        else:
+            generation = self.cache.generation(tag)
+            try:
+                group.dispatch(request, response)
+            except Exception:
+                log('exception', 'exception raised during dispatch of %r', request)
+                return response(SERVER_ERROR)
+
+            if response.content:
+                self._prepare_response_content(request, response)
+            if response.status != OK:
+                return response
+
+            etag = self.cache.put(key, tag, response, generation)
+            if not etag:
+                return response
+            content, mimetype = response.content, response.mimetype
+
+        response.headers['ETag'] = etag
+        if self._match_etag(headers.get('HTTP_IF_NONE_MATCH'), etag):
+            response.content = None
+            return response(NOT_MODIFIED)
+
+        response.mimetype = mimetype
+        return response(OK, content)
+
+    def _identify_cache_tag(self, path, group):
+        # cached responses are tagged without the versions of the preamble, so that a
+        # write through one version of a resource invalidates reads through the others
+        return (path.preamble[::2], group.resource.name)
+
+    def _match_etag(self, header, etag):
+        if not header:
+            return False
+
+        for candidate in header.split(','):
+            candidate = candidate.strip()
+            if candidate == '*' or candidate == etag or candidate == 'W/' + etag:
+                return True
+        return False
+
+    def _acquire_batch_pool(self):
+        # The pool is created on first use rather than on construction, since its
+        # threads would not survive the server being forked into worker processes.
+        pool = self.batch_pool
+        if pool is None:
+            with self.batch_lock:
+                pool = self.batch_pool
+                if pool is None:
+                    pool = self.batch_pool = ThreadPool(self.batch_workers)
+        return pool
+
+    def _dispatch_batch(self, request, response, data):
+        if request.method != POST:
+            return response(METHOD_NOT_ALLOWED)
+
+        try:
+            batch = self.formats[request.mimetype].unserialize(data)
+            operations = batch['operations']
+            if not isinstance(operations, list):
+                raise ValueError(operations)
+        except Exception:
+            log('exception', 'failed to parse batch for %r', request)
+            return response(BAD_REQUEST)
+
+        dispatch = lambda operation: self._dispatch_operation(request, operation)
+        if batch.get('parallel') and self.batch_workers and len(operations) > 1:
+            results = self._acquire_batch_pool().map(dispatch, operations)
+        else:
+            results = [dispatch(operation) for operation in operations]
+
+        response(OK, results)
+        self._prepare_response_content(request, response)
+        return response
+
+    def _dispatch_operation(self, request, operation):
+        response = HttpResponse()
+        try:
+            method, path = operation['method'], operation['path']
+        except Exception:
+            return {'status': STATUS_CODES[BAD_REQUEST], 'content': None}
+
+        route = self._resolve_path(self.path_prefix + path)
+        if not route or route[0].type != 'request' or route[0].preamble[0] != request.path.bundle:
+            return {'status': STATUS_CODES[NOT_FOUND], 'content': None}
+
+        path, groups = route
+        if not groups:
+            response(NOT_FOUND)
+        elif method not in groups:
+            response(METHOD_NOT_ALLOWED)
+        else:
+            subrequest = HttpRequest(method, path, request.mimetype, request.headers,
+                request.context, subject=path.subject, data=operation.get('data'))
+            subrequest.format = request.format
+            try:
+                groups[method].dispatch(subrequest, response)
+            except Exception:
+                log('exception', 'exception raised during dispatch of %r', subrequest)
+                response(SERVER_ERROR)
+
+            if self.cache and method != GET and response.ok:
+                self.cache.invalidate((path.preamble, groups[method].resource.name))
+
+        return {'status': STATUS_CODES[response.status],
+            'content': StreamedSequence.resolve(response.content)}
+
     def _dispatch_introspection(self, request, response):
         if request.method != GET:
             return response(METHOD_NOT_ALLOWED)
@@ -537,6 +1421,21 @@ class HttpServer(WsgiServer):
             self.descriptions[name] = self.bundles[name].describe()
             return self.descriptions[name]
 
+    def _resolve_path(self, path):
+        route = self.routes.resolve(path)
+        if route:
+            return route
+
+        try:
+            path = Path(self, path)
+        except Exception:
+            return None
+
+        if path.type == 'request':
+            return path, self.groups.get(path.signature)
+        else:
+            return path, None
+
     def _identify_response_format(self, request):
         if request.accept:
             return (self.formats[request.accept[0]], request.accept[1])
@@ -549,6 +1448,23 @@ class HttpServer(WsgiServer):
 
     def _prepare_response_content(self, request, response):
         format, params = request.format
+        if StreamedSequence.streaming(response.content):
+            # The first chunk is produced here, before the status is sent, so that items
+            # which fail within it still result in an error response; a JSON body which
+            # fails later is aborted, leaving the client with an incomplete response.
+            try:
+                if issubclass(format, formats.Json):
+                    chunks = _coalesce_chunks(_serialize_streamed_content(format,
+                        params or {}, response.content), self.stream_chunksize)
+                    response.content = chain([next(chunks, '')], chunks)
+                    response.mimetype = format.mimetype
+                    return
+                StreamedSequence.resolve(response.content)
+            except (StructuralError, ValidationError):
+                response.content = None
+                response(SERVER_ERROR)
+                return
+
         if params:
             response.content = format.serialize(response.content, **params)
         else:
@@ -558,20 +1474,71 @@ class HttpServer(WsgiServer):
         if not isinstance(response.content, list):
             response.content = [response.content]
 
+def _serialize_streamed_content(format, params, content):
+    serialize = formats.Json.serialize
+    envelope, streams = {}, []
+    for name, value in sorted(content.iteritems()):
+        if isinstance(value, StreamedSequence):
+            streams.append((name, value))
+        else:
+            envelope[name] = value
+
+    if issubclass(format, NdJson):
+        # The status has been sent by the time items are processed, so a failure
+        # is reported with an error record rather than by cutting the body off.
+        try:
+            (name, stream), others = streams[0], streams[1:]
+            for other, sequence in others:
+                envelope[other] = list(sequence)
+
+            envelope[NdJson.STREAM] = name
+            yield serialize(envelope, **params) + '\n'
+            for item in stream:
+                yield serialize(item, **params) + '\n'
+        except (StructuralError, ValidationError):
+            yield serialize({NdJson.ERROR: SERVER_ERROR}) + '\n'
+        return
+
+    opening = serialize(envelope, **params)
+    yield opening[:opening.rindex('}')]
+
+    separator = ', ' if envelope else ''
+    for name, stream in streams:
+        yield '%s%s: [' % (separator, serialize(name))
+        delimiter = ''
+        for item in stream:
+            yield delimiter + serialize(item, **params)
+            delimiter = ', '
+        yield ']'
+        separator = ', '
+    yield '}'
+
+def _coalesce_chunks(parts, chunksize):
+    chunk, length = [], 0
+    for part in parts:
+        chunk.append(part)
+        length += len(part)
+        if length >= chunksize:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
 class HttpClient(Client):
     """An HTTP API client."""
 
     DEFAULT_HEADER_PREFIX = 'X-MESH-'
 
     def __init__(self, url, specification=None, context=None, format=formats.Json, formats=None,
-            context_header_prefix=None, timeout=None, bundle=None, echo=False):
+            context_header_prefix=None, timeout=None, bundle=None, echo=False, pool_size=10,
+            idle_timeout=60, concurrency=8):
 
         super(HttpClient, self).__init__(context=context, format=format,
                 formats=formats)
         if '//' not in url:
             url = 'http://' + url
 
-        self.connection = Connection(url, timeout)
+        self.connection = Connection(url, timeout, pool_size, idle_timeout)
         self.context_header_prefix = context_header_prefix or self.DEFAULT_HEADER_PREFIX
 
         if specification:
@@ -584,8 +1551,12 @@ class HttpClient(Client):
         else:
             raise ValueError(specification)
 
+        self.concurrency = concurrency
         self.echo = echo
+        self.executor = None
+        self.executor_lock = Lock()
         self.paths = {}
+        self.prepared = {}
         self.url = url.rstrip('/')
 
     @property
@@ -604,10 +1575,72 @@ class HttpClient(Client):
 
         return headers
 
-    def execute(self, resource, request, subject=None, data=None, format=None, context=None):
+    def execute(self, resource, request, subject=None, data=None, format=None, context=None,
+            timeout=None):
+
         request, method, path, mimetype, data, headers = self._prepare_request(resource, request,
             subject, data, format, context)
+        return self._execute_request(request, method, path, data, headers, timeout)
 
+    def gather(self, operations, timeout=None, return_exceptions=False):
+        """Executes multiple requests concurrently, on a pool of at most ``concurrency``
+        worker threads shared by this client, and returns their responses in order.
+        Each operation is a tuple of ``(resource, request, subject, data)``, where
+        ``subject`` and ``data`` are optional.
+
+        :param timeout: Optional, default is ``None``; if specified, the socket
+            timeout for each individual request.
+
+        :param boolean return_exceptions: Optional, default is ``False``; if ``True``,
+            an exception raised by an operation is returned in place of its response,
+            rather than being raised once all operations have completed.
+        """
+
+        def execute(operation):
+            resource, request, subject, data = (tuple(operation) + (None, None))[:4]
+            try:
+                return self.execute(resource, request, subject, data, timeout=timeout), None
+            except Exception, exception:
+                return None, exception
+
+        operations = list(operations)
+        if len(operations) > 1 and self.concurrency > 1:
+            results = self._get_executor().map(execute, operations)
+        else:
+            results = [execute(operation) for operation in operations]
+
+        responses = []
+        for response, exception in results:
+            if exception is None:
+                responses.append(response)
+            elif return_exceptions:
+                responses.append(exception)
+            else:
+                raise exception
+        return responses
+
+    def prepare_request(self, resource, request):
+        """Returns a :class:`PreparedRequest` for ``request`` on ``resource``, which can
+        be called repeatedly to execute that request without resolving it again.
+        Prepared requests are cached by this client."""
+
+        if isinstance(resource, dict):
+            key = (resource['id'], request)
+        else:
+            key = (resource, request)
+
+        try:
+            return self.prepared[key]
+        except KeyError:
+            pass
+
+        if not isinstance(resource, dict):
+            resource = self.specification.find(resource)
+
+        prepared = self.prepared[key] = PreparedRequest(self, resource['requests'][request])
+        return prepared
+
+    def _execute_request(self, request, method, path, data, headers, timeout=None):
         if self.echo:
             description = 'REQUEST: %s %s' % (method, path)
             if data:
@@ -615,7 +1648,7 @@ class HttpClient(Client):
             print(description)
 
         try:
-            response = self.connection.request(method, path, data, headers)
+            response = self.connection.request(method, path, data, headers, timeout=timeout)
         except socket.timeout:
             raise TimeoutError()
 
@@ -643,6 +1676,52 @@ class HttpClient(Client):
         else:
             raise RequestError.construct(response.status, response.content)
 
+    def execute_many(self, operations, format=None, context=None, parallel=False):
+        """Executes multiple requests in a single round trip through the batch endpoint
+        of the server. Each operation is a tuple of ``(resource, request, subject, data)``,
+        where ``subject`` and ``data`` are optional. Returns a list containing a response
+        for each operation, in order; unlike :meth:`execute`, failed operations do not
+        raise, and should be identified using ``response.ok``."""
+
+        format = format or self.format
+        requests, batch = [], []
+
+        for operation in operations:
+            resource, request, subject, data = (tuple(operation) + (None, None))[:4]
+            prepared = self.prepare_request(resource, request)
+
+            entry = {'method': prepared.method, 'path': prepared.get_path(subject, format)}
+            if data is not None:
+                entry['data'] = prepared.schema.process(data, OUTGOING, True)
+
+            requests.append(prepared.request)
+            batch.append(entry)
+
+        headers = self.construct_headers(context)
+        headers['Content-Type'] = format.mimetype
+
+        try:
+            response = self.connection.request(POST, '%s/_batch' % self.bundle,
+                format.serialize({'operations': batch, 'parallel': parallel}), headers)
+        except socket.timeout:
+            raise TimeoutError()
+
+        if not response.ok:
+            raise RequestError.construct(response.status, response.content)
+
+        responses = []
+        results = self.formats[response.mimetype].unserialize(response.content)
+        for request, result in zip(requests, results):
+            status = STATUS_CODES[result['status']]
+            content = result.get('content')
+            if content is not None and status in request['responses']:
+                schema = request['responses'][status]['schema']
+                if schema:
+                    content = schema.process(content, INCOMING, True)
+            responses.append(HttpResponse(status, content))
+
+        return responses
+
     def ping(self):
         try:
             response = self.connection.request('GET', self.bundle)
@@ -673,22 +1752,67 @@ class HttpClient(Client):
         return Specification(self.format.unserialize(response.content))
 
     def _prepare_request(self, resource, request, subject=None, data=None, format=None, context=None):
-        if not isinstance(resource, dict):
-            resource = self.specification.find(resource)
-        request = resource['requests'][request]
+        prepared = self.prepare_request(resource, request)
+        return (prepared.request,) + prepared.prepare(subject, data, format, context)
 
-        format = format or self.format
-        headers = self.construct_headers(context)
-        method, path = request['endpoint']
+    def _get_executor(self):
+        with self.executor_lock:
+            if not self.executor:
+                self.executor = ThreadPool(self.concurrency)
+            return self.executor
+
+    def _provide_binding(self):
+        return self.specification
+
+    def _get_path(self, path):
+        try:
+            return self.paths[path]
+        except KeyError:
+            template = '%s!%%s' % re.sub(r'\/id(?=\/|$)', '/%s', path)
+            self.paths[path] = template
+            return template
+
+class PreparedRequest(object):
+    """A request prepared by an :class:`HttpClient` for a particular resource, with
+    its endpoint, path template, schema and responses resolved in advance. Calling
+    a prepared request executes it, taking the same ``subject``, ``data``, ``format``
+    and ``context`` arguments as :meth:`HttpClient.execute`."""
+
+    def __init__(self, client, request):
+        self.client = client
+        self.method = request['endpoint'][0]
+        self.path = client._get_path(request['path'])
+        self.request = request
+        self.responses = request['responses']
+        self.schema = request['schema']
+
+    def __call__(self, subject=None, data=None, format=None, context=None, timeout=None):
+        method, path, mimetype, data, headers = self.prepare(subject, data, format, context)
+        return self.client._execute_request(self.request, method, path, data, headers, timeout)
+
+    def __repr__(self):
+        return 'PreparedRequest(%s %s)' % (self.method, self.path)
+
+    def get_path(self, subject=None, format=None):
+        format = format or self.client.format
+        if subject:
+            return self.path % (subject, format.name)
+        else:
+            return self.path % format.name
+
+    def prepare(self, subject=None, data=None, format=None, context=None):
+        format = format or self.client.format
+        headers = self.client.construct_headers(context)
+        method = self.method
 
         mimetype = None
         if data is not None:
             if isinstance(data, MultipartPayload):
-                data.payload = request['schema'].process(data.payload, OUTGOING, True)
+                data.payload = self.schema.process(data.payload, OUTGOING, True)
                 data = MultipartEncoder(data, format)
                 headers.update(data.headers)
             else:
-                data = request['schema'].process(data, OUTGOING, True)
+                data = self.schema.process(data, OUTGOING, True)
                 if method == GET:
                     data = formats.UrlEncoded.serialize(data)
                     mimetype = formats.UrlEncoded.mimetype
@@ -696,27 +1820,15 @@ class HttpClient(Client):
                     data = format.serialize(data)
                     mimetype = format.mimetype
 
-        path = self._get_path(request['path'])
         if subject:
-            path = path % (subject, format.name)
+            path = self.path % (subject, format.name)
         else:
-            path = path % format.name
+            path = self.path % format.name
 
         if mimetype:
             headers['Content-Type'] = mimetype
 
-        return request, method, path, mimetype, data, headers
-
-    def _provide_binding(self):
-        return self.specification
-
-    def _get_path(self, path):
-        try:
-            return self.paths[path]
-        except KeyError:
-            template = '%s!%%s' % re.sub(r'\/id(?=\/|$)', '/%s', path)
-            self.paths[path] = template
-            return template
+        return method, path, mimetype, data, headers
 
 class HttpProxy(WsgiServer):
     """An HTTP proxy."""
@@ -728,15 +1840,68 @@ class HttpProxy(WsgiServer):
     }
 
     def __init__(self, url, context=None, default_format=None, available_formats=None,
-            mediators=None, context_key=None, context_header_prefix=None, timeout=None):
+            mediators=None, context_key=None, context_header_prefix=None, timeout=None,
+            pool_size=10, idle_timeout=60, streaming=False, chunksize=65536):
 
         super(HttpProxy, self).__init__(default_format, available_formats, mediators, context_key)
         self.context_header_prefix = context_header_prefix or HttpClient.DEFAULT_HEADER_PREFIX
-        self.connection = Connection(url, timeout)
+        self.connection = Connection(url, timeout, pool_size, idle_timeout)
+        self.chunksize = chunksize
         self.context = context or {}
+        self.streaming = streaming
         self.url = url
 
+    def __call__(self, environ, start_response):
+        if not self.streaming:
+            return super(HttpProxy, self).__call__(environ, start_response)
+
+        try:
+            method = environ['REQUEST_METHOD']
+            path = environ['PATH_INFO']
+            if environ.get('QUERY_STRING'):
+                path = '%s?%s' % (path, environ['QUERY_STRING'])
+
+            context = {}
+            if self.context_key and self.context_key in environ:
+                context = environ[self.context_key]
+
+            headers = self._construct_request_headers(context, environ,
+                environ.get('CONTENT_TYPE'))
+
+            body = length = None
+            if environ.get('CONTENT_LENGTH'):
+                length = int(environ['CONTENT_LENGTH'])
+                if length:
+                    body = environ['wsgi.input']
+            elif 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+                body = environ['wsgi.input']
+
+            log('debug', 'streaming wsgi request %s:%s to %s', method, path, self.url)
+            try:
+                response = self.connection.stream(method, path, body, headers, length,
+                    self.chunksize)
+            except (ConnectionFailed, HTTPException):
+                log('exception', 'exception raised during streaming proxy request')
+                start_response(STATUS_LINES[BAD_GATEWAY], [])
+                return ''
+
+            start_response(response.status_line, response.headers)
+            return response
+        except Exception, exception:
+            log('exception', 'exception raised during wsgi dispatch')
+            start_response('500 Internal Server Error', [])
+            return ''
+
     def dispatch(self, method, path, mimetype, context, headers, data):
+        request_headers = self._construct_request_headers(context, headers, mimetype)
+        log('debug', 'proxying wsgi request %s:%s to %s', method, path, self.url)
+
+        try:
+            return self.connection.request(method, path, data, request_headers)
+        except socket.error:
+            raise TimeoutError()
+
+    def _construct_request_headers(self, context, headers, mimetype):
         if self.context:
             additional = self.context
             if callable(additional):
@@ -754,12 +1919,7 @@ class HttpProxy(WsgiServer):
             if incoming_name in headers:
                 request_headers[outgoing_name] = headers[incoming_name]
 
-        log('debug', 'proxying wsgi request %s:%s to %s' % (method, path, self.url))
-
-        try:
-            return self.connection.request(method, path, data, request_headers)
-        except socket.error:
-            raise TimeoutError()
+        return request_headers
 
 class HttpTransport(Transport):
     name = 'http'
@@ -1,6 +1,7 @@
 from mesh.bundle import Specification, format_version
 from mesh.constants import *
 from mesh.exceptions import *
+from mesh.request import StreamedSequence
 from mesh.transport.base import *
 from scheme.formats import *
 
@@ -60,6 +61,7 @@ class InternalServer(Server):
         except Exception, exception:
             import traceback;traceback.print_exc()
 
+        StreamedSequence.resolve(response.content)
         if format:
             response.mimetype = format.mimetype
             if response.content:
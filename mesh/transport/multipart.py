@@ -1,4 +1,6 @@
 import os
+from collections import deque
+from cStringIO import StringIO
 from cgi import parse_header
 from tempfile import mkstemp
 
@@ -14,9 +16,47 @@ except ImportError:
 NEWLINE = '\r\n'
 
 class MultipartFile(object):
-    def __init__(self, name, filename):
+    """A file attached to a multipart payload, either stored at ``filename`` or
+    held in memory as ``content``. Temporary files are removed by :meth:`cleanup`;
+    accessing ``filename`` for an in-memory file writes it to a temporary file."""
+
+    def __init__(self, name, filename=None, content=None, temporary=False):
+        self.content = content
         self.name = name
-        self.filename = filename
+        self.temporary = temporary
+        self._filename = filename
+
+    @property
+    def filename(self):
+        if self._filename is None and self.content is not None:
+            handle, self._filename = mkstemp()
+            try:
+                _write(handle, self.content)
+            finally:
+                os.close(handle)
+            self.temporary = True
+        return self._filename
+
+    @property
+    def size(self):
+        if self.content is not None:
+            return len(self.content)
+        else:
+            return os.stat(self._filename).st_size
+
+    def cleanup(self):
+        if self.temporary and self._filename:
+            try:
+                os.unlink(self._filename)
+            except OSError:
+                pass
+            self._filename = None
+
+    def open(self):
+        if self.content is not None:
+            return StringIO(self.content)
+        else:
+            return open(self._filename, 'rb')
 
 class MultipartPayload(object):
     def __init__(self, payload=None, mimetype=None):
@@ -24,10 +64,14 @@ class MultipartPayload(object):
         self.mimetype = mimetype
         self.payload = payload
 
-    def attach(self, name, filename):
-        self.files[name] = MultipartFile(name, filename)
+    def attach(self, name, filename=None, content=None):
+        self.files[name] = MultipartFile(name, filename, content)
         return self
 
+    def cleanup(self):
+        for multipart_file in self.files.itervalues():
+            multipart_file.cleanup()
+
     def serialize(self, format):
         return format.serialize(self.payload)
 
@@ -45,70 +89,116 @@ def noisy(function):
     return wrapped
 
 class BufferedStream(object):
+    """A buffered reader for multipart streams.
+
+    Unconsumed data is held in a single ``bytearray`` and consumed by advancing
+    an offset, so reads never copy the remainder of the buffer; consumed data is
+    discarded in bulk once it makes up at least half of the buffer. Boundary
+    searches use ``bytearray.find``, and data being written elsewhere is passed
+    on as ``memoryview`` slices of the buffer.
+    """
+
     def __init__(self, stream):
-        self.buffer = ''
+        self.buffer = bytearray()
+        self.offset = 0
         self.stream = stream
 
     def chomp(self, size):
-        buffer = self.buffer
-        if not buffer and not self.stream:
+        if not self._fill(size):
             raise ValueError()
+        self.offset += size
 
-        length = len(buffer)
-        if length < size:
-            chunk = self.stream.read(size - length)
-            if chunk:
-                buffer += chunk
+    def pipe(self, write, chunksize, boundary):
+        """Passes all data preceding ``boundary`` to ``write``, as ``memoryview``
+        slices of at most ``chunksize`` bytes which are only valid for the duration
+        of the call, leaving ``boundary`` itself unconsumed."""
+
+        length = len(boundary)
+        while True:
+            self._fill(chunksize + length)
+            buffer, offset = self.buffer, self.offset
+
+            found = buffer.find(boundary, offset, offset + chunksize + length)
+            if found >= 0:
+                end = found
             else:
-                raise ValueError()
+                end = max(offset, min(offset + chunksize, len(buffer) - length))
 
-        self.buffer = buffer[size:]
+            if end > offset:
+                write(memoryview(buffer)[offset:end])
+                self.offset = end
+            if found >= 0 or end == offset:
+                return
 
     def read(self, chunksize, boundary=None):
-        buffer = self.buffer
-        if not buffer and not self.stream:
-            return ''
-
-        length = len(buffer)
-        if self.stream and length < chunksize:
-            chunk = self.stream.read(chunksize - length)
-            if chunk:
-                buffer += chunk
-            else:
-                self.stream = None
+        if boundary:
+            self._fill(chunksize + len(boundary))
+        else:
+            self._fill(chunksize)
 
+        buffer, offset = self.buffer, self.offset
         if boundary:
-            offset = buffer.find(boundary)
-            if offset >= 0:
-                self.buffer = buffer[offset:]
-                buffer = buffer[:offset]
-            else:
-                length = len(boundary)
-                self.buffer = buffer[-length:]
-                buffer = buffer[:-length]
+            end = buffer.find(boundary, offset, offset + chunksize + len(boundary))
+            if end < 0:
+                end = max(offset, min(offset + chunksize, len(buffer) - len(boundary)))
         else:
-            self.buffer = ''
+            end = min(offset + chunksize, len(buffer))
 
-        return buffer
+        self.offset = end
+        return memoryview(buffer)[offset:end].tobytes()
 
     def readline(self):
-        buffer = self.buffer
-        if not buffer:
+        buffer, offset = self.buffer, self.offset
+        if offset >= len(buffer):
             if self.stream:
                 return self.stream.readline()
             else:
                 return ''
 
-        offset = buffer.find(NEWLINE)
-        if offset >= 0:
-            offset += 2
-            self.buffer = buffer[offset:]
-            return buffer[:offset]
+        end = buffer.find(NEWLINE, offset)
+        if end >= 0:
+            end += 2
+            self.offset = end
+            return str(buffer[offset:end])
+
+        line = str(buffer[offset:])
+        self._reset()
+        if self.stream:
+            line += self.stream.readline()
+        return line
+
+    def _fill(self, size):
+        buffer = self.buffer
+        while self.stream and len(buffer) - self.offset < size:
+            if self.offset and self.offset * 2 >= len(buffer):
+                self._compact()
+                buffer = self.buffer
+
+            chunk = self.stream.read(size - (len(buffer) - self.offset))
+            if chunk:
+                buffer += chunk
+            else:
+                self.stream = None
+
+        return len(buffer) - self.offset >= size
+
+    def _compact(self):
+        if self.offset >= len(self.buffer):
+            self._reset()
+        else:
+            del self.buffer[:self.offset]
+            self.offset = 0
+
+    def _reset(self):
+        self.buffer = bytearray()
+        self.offset = 0
 
-        self.buffer = ''
-        return buffer + self.stream.readline()
+def parse_multipart_mixed(stream, mimetype, chunksize=1024*1024, spool_threshold=65536):
+    """Parses a ``multipart/mixed`` request body from ``stream``. Attachments of
+    at most ``spool_threshold`` bytes are held in memory, while larger attachments
+    are spooled to temporary files, which are removed if parsing fails and are
+    otherwise the responsibility of the caller."""
 
-def parse_multipart_mixed(stream, mimetype, chunksize=1024*1024):
     mimetype, params = parse_header(mimetype)
     if 'boundary' in params:
         boundary = '--' + params['boundary']
@@ -118,6 +208,15 @@ def parse_multipart_mixed(stream, mimetype, chunksize=1024*1024):
     stream = BufferedStream(stream)
     payload = MultipartPayload()
 
+    try:
+        _parse_parts(stream, payload, chunksize, boundary, spool_threshold)
+    except Exception:
+        payload.cleanup()
+        raise
+
+    return payload
+
+def _parse_parts(stream, payload, chunksize, boundary, spool_threshold):
     while True:
         delimiter = stream.readline()
         if delimiter:
@@ -143,8 +242,8 @@ def parse_multipart_mixed(stream, mimetype, chunksize=1024*1024):
             elif disposition == 'attachment':
                 if 'name' in params:
                     name = params['name']
-                    filename = _parse_attachment_data(stream, chunksize, boundary)
-                    payload.files[name] = MultipartFile(name, filename)
+                    payload.files[name] = _parse_attachment_data(stream, name, chunksize,
+                        boundary, spool_threshold)
                 else:
                     raise ValueError('missing attachment name')
             else:
@@ -152,24 +251,22 @@ def parse_multipart_mixed(stream, mimetype, chunksize=1024*1024):
         else:
             raise ValueError(headers)
 
-    return payload
-
-def _parse_attachment_data(stream, chunksize, boundary):
-    boundary = NEWLINE + boundary
-    handle, filename = mkstemp()
-
+def _parse_attachment_data(stream, name, chunksize, boundary, spool_threshold):
+    spool = _Spool(spool_threshold)
     try:
-        while True:
-            chunk = stream.read(chunksize, boundary)
-            if chunk:
-                os.write(handle, chunk)
-            else:
-                break
-    finally:
-        os.close(handle)
-
-    stream.chomp(2)
-    return filename
+        try:
+            stream.pipe(spool.write, chunksize, NEWLINE + boundary)
+        finally:
+            spool.close()
+        stream.chomp(2)
+    except Exception:
+        spool.discard()
+        raise
+
+    if spool.filename:
+        return MultipartFile(name, spool.filename, temporary=True)
+    else:
+        return MultipartFile(name, content=''.join(spool.chunks))
 
 def _parse_content_headers(stream):
     headers = {}
@@ -221,15 +318,52 @@ def _parse_inline_data(stream, chunksize, boundary):
     stream.chomp(2)
     return ''.join(data)
 
+class _Spool(object):
+    def __init__(self, threshold):
+        self.chunks = []
+        self.filename = None
+        self.handle = None
+        self.length = 0
+        self.threshold = threshold
+
+    def close(self):
+        if self.handle is not None:
+            os.close(self.handle)
+            self.handle = None
+
+    def discard(self):
+        self.close()
+        if self.filename:
+            os.unlink(self.filename)
+            self.filename = None
+
+    def write(self, data):
+        if self.handle is None and self.filename is None:
+            self.length += len(data)
+            if self.length <= self.threshold:
+                self.chunks.append(data.tobytes())
+                return
+
+            self.handle, self.filename = mkstemp()
+            for chunk in self.chunks:
+                _write(self.handle, chunk)
+            self.chunks = []
+
+        _write(self.handle, data)
+
+def _write(handle, data):
+    while data:
+        data = data[os.write(handle, data):]
+
 class MultipartEncoder(object):
     def __init__(self, payload, format):
         boundary = generate_boundary()
         self.boundary = '--' + boundary
 
         data = payload.serialize(format)
-        self.segments = ['%s\r\nContent-Disposition: inline\r\n'
+        self.segments = deque(['%s\r\nContent-Disposition: inline\r\n'
             'Content-Type: %s\r\n\r\n%s'
-            % (self.boundary, format.mimetype, data)]
+            % (self.boundary, format.mimetype, data)])
 
         for name, file in payload.files.iteritems():
             self.segments.append('\r\n%s\r\nContent-Disposition: attachment; name="%s"\r\n\r\n'
@@ -241,37 +375,57 @@ class MultipartEncoder(object):
         length = 0
         for segment in self.segments:
             if isinstance(segment, MultipartFile):
-                length += os.stat(segment.filename).st_size
+                length += segment.size
             else:
                 length += len(segment)
 
-        self.openfile = None
+        self.chunks = None
         self.headers = {
             'Content-Type': 'multipart/mixed; boundary=%s' % boundary,
             'Content-Length': str(length),
         }
 
-    def next_chunk(self, chunksize, chunk=''):
-        if self.openfile:
-            data = self.openfile.read(chunksize - len(chunk))
-            if data:
-                chunk += data
-            else:
-                self.openfile.close()
-                self.openfile = None
-
-        if len(chunk) >= chunksize:
-            return chunk
-        if not self.segments:
-            return chunk
-
-        segment = self.segments.pop(0)
-        if isinstance(segment, basestring):
-            chunk += segment
-            if len(chunk) >= chunksize:
-                return chunk
-            else:
-                return self.next_chunk(chunksize, chunk)
-        
-        self.openfile = open(segment.filename)
-        return self.next_chunk(chunksize, chunk)
+    def iterate(self, chunksize=2097152):
+        """Iteratively yields the encoded body, consuming this encoder. Boundaries
+        and headers are yielded as strings, and attachment content as ``memoryview``
+        slices of a single reused buffer, each of which is only valid until the next
+        item is requested."""
+
+        segments = self.segments
+        buffer = view = None
+
+        while segments:
+            segment = segments.popleft()
+            if isinstance(segment, basestring):
+                yield segment
+                continue
+            elif segment.content is not None:
+                yield segment.content
+                continue
+
+            if buffer is None:
+                buffer = bytearray(chunksize)
+                view = memoryview(buffer)
+
+            with open(segment.filename, 'rb') as openfile:
+                while True:
+                    size = openfile.readinto(buffer)
+                    if size:
+                        yield view[:size]
+                    else:
+                        break
+
+    def next_chunk(self, chunksize):
+        if self.chunks is None:
+            self.chunks = self.iterate(chunksize)
+
+        chunk, length = [], 0
+        for data in self.chunks:
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            chunk.append(data)
+            length += len(data)
+            if length >= chunksize:
+                break
+
+        return ''.join(chunk)
@@ -84,6 +84,7 @@ except:
     import Queue as queue
 import re
 import rfc822
+import select
 import socket
 import sys
 if 'win' in sys.platform and not hasattr(socket, 'IPPROTO_IPV6'):
@@ -160,6 +161,9 @@ def plat_specific_errors(*errnames):
 
 socket_error_eintr = plat_specific_errors("EINTR", "WSAEINTR")
 
+# Python 2 does not define SO_REUSEPORT; 15 is its value on Linux.
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
 socket_errors_to_ignore = plat_specific_errors(
     "EPIPE",
     "EBADF", "WSAEBADF",
@@ -984,6 +988,14 @@ class CP_fileobject(socket._fileobject):
             self._wbuf = []
             self.sendall(buffer)
 
+    def has_buffered_input(self):
+        """Return True if data read from the socket is waiting in the buffer."""
+        rbuf = self._rbuf
+        if isinstance(rbuf, basestring):
+            return bool(rbuf)
+        rbuf.seek(0, 2)
+        return rbuf.tell() > 0
+
     def recv(self, size):
         while True:
             try:
@@ -1270,6 +1282,10 @@ class HTTPConnection(object):
     wbufsize = DEFAULT_BUFFER_SIZE
     RequestHandlerClass = HTTPRequest
 
+    parked = False
+    """Set by communicate() when the connection was left open to be parked
+    on the server's ConnectionSelector until its next request arrives."""
+
     def __init__(self, server, sock, makefile=CP_fileobject):
         self.server = server
         self.socket = sock
@@ -1302,6 +1318,13 @@ class HTTPConnection(object):
                 req.respond()
                 if req.close_connection:
                     return
+
+                # Rather than block this worker until the client sends its
+                # next request, park the connection if nothing is buffered.
+                if (self.server.selector is not None and
+                        not self.rfile.has_buffered_input()):
+                    self.parked = True
+                    return
         except socket.error:
             e = sys.exc_info()[1]
             errnum = e.args[0]
@@ -1433,25 +1456,39 @@ class WorkerThread(threading.Thread):
         self.server.stats['Worker Threads'][self.getName()] = self.stats
         try:
             self.ready = True
+            record_wait = getattr(self.server.requests, 'record_wait', None)
             while True:
                 conn = self.server.requests.get()
                 if conn is _SHUTDOWNREQUEST:
                     return
 
                 self.conn = conn
+                if record_wait is not None:
+                    record_wait(conn)
                 if self.server.stats['Enabled']:
                     self.start_time = time.time()
                 try:
                     conn.communicate()
                 finally:
-                    conn.close()
+                    parked, conn.parked = conn.parked, False
+                    if not parked:
+                        conn.close()
                     if self.server.stats['Enabled']:
                         self.requests_seen += self.conn.requests_seen
                         self.bytes_read += self.conn.rfile.bytes_read
                         self.bytes_written += self.conn.wfile.bytes_written
                         self.work_time += time.time() - self.start_time
                         self.start_time = None
+                        if parked:
+                            conn.requests_seen = 0
+                            conn.rfile.bytes_read = conn.wfile.bytes_written = 0
                     self.conn = None
+                    if parked:
+                        selector = self.server.selector
+                        if selector is not None:
+                            selector.park(conn)
+                        else:
+                            conn.close()
         except (KeyboardInterrupt, SystemExit):
             exc = sys.exc_info()[1]
             self.server.interrupt = exc
@@ -1461,17 +1498,33 @@ class ThreadPool(object):
     """A Request Queue for an HTTPServer which pools threads.
 
     ThreadPool objects must provide min, get(), put(obj), start()
-    and stop(timeout) attributes.
+    and stop(timeout) attributes; record_wait(conn) and scale() are
+    optional, and only called if present.
+
+    If target_wait is set, scale() grows the pool (not above max) while
+    connections wait longer than target_wait seconds on average in the
+    queue, and shrinks it (not below min) while they wait less than a
+    quarter of that with threads idle; it changes the pool at most once
+    every cooldown seconds.
     """
 
-    def __init__(self, server, min=10, max=-1):
+    def __init__(self, server, min=10, max=-1, target_wait=None, cooldown=10):
         self.server = server
         self.min = min
         self.max = max
+        self.target_wait = target_wait
+        self.cooldown = cooldown
         self._threads = []
         self._queue = queue.Queue()
         self.get = self._queue.get
 
+        self.wait_count = 0
+        self.wait_time = 0
+        self._wait_lock = threading.Lock()
+        self._window_count = 0
+        self._window_time = 0
+        self._scaled_at = 0
+
     def start(self):
         """Start the pool of threads."""
         for i in range(self.min):
@@ -1488,11 +1541,59 @@ class ThreadPool(object):
         return len([t for t in self._threads if t.conn is None])
     idle = property(_get_idle, doc=_get_idle.__doc__)
 
+    def _get_busy(self):
+        """Number of worker threads which are handling a connection. Read-only."""
+        return len([t for t in self._threads if t.conn is not None])
+    busy = property(_get_busy, doc=_get_busy.__doc__)
+
     def put(self, obj):
+        if obj is not _SHUTDOWNREQUEST:
+            obj.queued_at = time.time()
         self._queue.put(obj)
-        if obj is _SHUTDOWNREQUEST:
+
+    def record_wait(self, conn):
+        """Record the time conn spent in the queue."""
+        queued_at = getattr(conn, 'queued_at', None)
+        if queued_at is None:
+            return
+
+        wait = time.time() - queued_at
+        self._wait_lock.acquire()
+        try:
+            self.wait_count += 1
+            self.wait_time += wait
+            self._window_count += 1
+            self._window_time += wait
+        finally:
+            self._wait_lock.release()
+
+    def scale(self):
+        """Grow or shrink the pool toward target_wait, if it is set."""
+        target = self.target_wait
+        now = time.time()
+        if not target or now - self._scaled_at < self.cooldown:
             return
 
+        self._wait_lock.acquire()
+        try:
+            count, total = self._window_count, self._window_time
+            self._window_count = self._window_time = 0
+        finally:
+            self._wait_lock.release()
+
+        self._threads = [t for t in self._threads if t.isAlive()]
+        wait = count and (total / count) or 0
+        queued = self.qsize
+        idle = self.idle
+
+        if wait > target or (queued and not idle):
+            if self.max <= 0 or len(self._threads) < self.max:
+                self.grow(max(1, queued, len(self._threads) // 4))
+                self._scaled_at = now
+        elif wait < target / 4 and idle and len(self._threads) > self.min:
+            self.shrink(max(1, idle // 2))
+            self._scaled_at = now
+
     def grow(self, amount):
         """Spawn new worker threads (not above self.max)."""
         for i in range(amount):
@@ -1507,7 +1608,7 @@ class ThreadPool(object):
         """Kill off worker threads (not below self.min)."""
         # Grow/shrink the pool if necessary.
         # Remove any dead threads from our list
-        for t in self._threads:
+        for t in list(self._threads):
             if not t.isAlive():
                 self._threads.remove(t)
                 amount -= 1
@@ -1562,6 +1663,152 @@ class ThreadPool(object):
     qsize = property(_get_qsize)
 
 
+class ConnectionSelector(threading.Thread):
+    """Thread which parks idle connections until they become readable.
+
+    Connections handed to park() are watched with epoll (or poll, where
+    epoll is unavailable); once a connection has data to read it is put on
+    the server's ThreadPool, so that idle keep-alive connections do not
+    occupy worker threads. Connections left idle for longer than the
+    server's timeout are closed, as a worker would have done.
+    """
+
+    def __init__(self, server):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.setName("CP Server Selector")
+        self.server = server
+        self.ready = False
+
+        self._stopping = False
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = os.pipe()
+        for fd in self._wakeup:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._scale = 1
+        else:
+            self._poller = select.poll()
+            self._scale = 1000
+        self._poller.register(self._wakeup[0], select.POLLIN)
+
+    def _get_parked(self):
+        """Number of connections which are parked. Read-only."""
+        return len(self._connections) + len(self._pending)
+    parked = property(_get_parked, doc=_get_parked.__doc__)
+
+    def park(self, conn):
+        """Watch conn until it has data to read."""
+        self._lock.acquire()
+        try:
+            if self._stopping:
+                conn.close()
+                return
+            self._pending.append(conn)
+        finally:
+            self._lock.release()
+        self._wake()
+
+    def run(self):
+        self.ready = True
+        wakeup = self._wakeup[0]
+        try:
+            while not self._stopping:
+                try:
+                    events = self._poller.poll(self._scale)
+                except (IOError, select.error):
+                    if sys.exc_info()[1].args[0] not in socket_error_eintr:
+                        raise
+                    continue
+
+                now = time.time()
+                for fd, event in events:
+                    if fd == wakeup:
+                        os.read(fd, 4096)
+                        continue
+
+                    conn = self._release(fd)
+                    if conn is not None:
+                        self.server.requests.put(conn[0])
+
+                self._register_pending(now)
+                self._expire(now)
+        finally:
+            self._lock.acquire()
+            try:
+                self._stopping = True
+                pending, self._pending = self._pending, []
+            finally:
+                self._lock.release()
+
+            for fd in list(self._connections):
+                self._release(fd)[0].close()
+            for conn in pending:
+                conn.close()
+
+            self._lock.acquire()
+            try:
+                for fd in self._wakeup:
+                    os.close(fd)
+                self._wakeup = None
+            finally:
+                self._lock.release()
+            self._poller.close()
+
+    def stop(self, timeout=5):
+        self._stopping = True
+        if self.isAlive():
+            self._wake()
+            if self is not threading.currentThread():
+                self.join(timeout)
+
+    def _expire(self, now):
+        timeout = self.server.timeout
+        for fd, (conn, parked_at) in self._connections.items():
+            if now - parked_at > timeout:
+                self._release(fd)
+                conn.close()
+
+    def _register_pending(self, now):
+        self._lock.acquire()
+        try:
+            pending, self._pending = self._pending, []
+        finally:
+            self._lock.release()
+
+        for conn in pending:
+            try:
+                fd = conn.socket.fileno()
+                self._poller.register(fd, select.POLLIN)
+            except (IOError, OSError, ValueError, socket.error):
+                conn.close()
+                continue
+            self._connections[fd] = (conn, now)
+
+    def _release(self, fd):
+        conn = self._connections.pop(fd, None)
+        if conn is not None:
+            try:
+                self._poller.unregister(fd)
+            except (IOError, OSError, ValueError):
+                pass
+        return conn
+
+    def _wake(self):
+        self._lock.acquire()
+        try:
+            if self._wakeup is not None:
+                os.write(self._wakeup[1], 'x')
+        except OSError:
+            pass
+        finally:
+            self._lock.release()
+
+
 
 try:
     import fcntl
@@ -1667,6 +1914,21 @@ class HTTPServer(object):
     nodelay = True
     """If True (the default since 3.1), sets the TCP_NODELAY socket option."""
 
+    park_connections = False
+    """If True, connections waiting for a request are parked on a
+    ConnectionSelector instead of occupying a worker thread. Ignored when
+    an ssl_adapter is set, since SSL sockets may buffer decrypted data."""
+
+    selector = None
+    """The ConnectionSelector parking idle connections, while one runs."""
+
+    reuse_port = False
+    """If True, sets the SO_REUSEPORT socket option, so that several
+    processes can each bind their own socket to the same address."""
+
+    socket = None
+    """The listening socket, once bound. start() binds one if it is None."""
+
     ConnectionClass = HTTPConnection
     """The class to use for handling HTTP connections."""
 
@@ -1698,8 +1960,14 @@ class HTTPServer(object):
             'Accepts': 0,
             'Accepts/sec': lambda s: s['Accepts'] / self.runtime(),
             'Queue': lambda s: getattr(self.requests, "qsize", None),
+            'Queue Waits': lambda s: getattr(self.requests, "wait_count", None),
+            'Queue Wait Time': lambda s: getattr(self.requests, "wait_time", None),
+            'Queue Wait Average': lambda s: (getattr(self.requests, "wait_time", 0) /
+                                             (getattr(self.requests, "wait_count", 0) or 1)),
             'Threads': lambda s: len(getattr(self.requests, "_threads", [])),
+            'Threads Busy': lambda s: getattr(self.requests, "busy", None),
             'Threads Idle': lambda s: getattr(self.requests, "idle", None),
+            'Connections Parked': lambda s: getattr(self.selector, "parked", None),
             'Socket Errors': 0,
             'Requests': lambda s: (not s['Enabled']) and -1 or sum([w['Requests'](w) for w
                                        in s['Worker Threads'].values()], 0),
@@ -1789,6 +2057,38 @@ class HTTPServer(object):
                     self.ssl_certificate, self.ssl_private_key,
                     getattr(self, 'ssl_certificate_chain', None))
 
+        if self.socket is None:
+            self.listen()
+            if self.post_bind_callback:
+                self.post_bind_callback()
+
+        # Create worker threads
+        self.requests.start()
+
+        if self.park_connections and self.ssl_adapter is None:
+            self.selector = ConnectionSelector(self)
+            self.selector.start()
+
+        self.ready = True
+        self._start_time = time.time()
+        while self.ready:
+            try:
+                self.tick()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
+                               traceback=True)
+
+            if self.interrupt:
+                while self.interrupt is True:
+                    # Wait for self.stop() to complete. See _set_interrupt.
+                    time.sleep(0.1)
+                if self.interrupt:
+                    raise self.interrupt
+
+    def listen(self):
+        """Create, bind and listen on the server socket."""
         # Select the appropriate socket
         if isinstance(self.bind_addr, basestring):
             # AF_UNIX socket
@@ -1836,30 +2136,6 @@ class HTTPServer(object):
         self.socket.settimeout(1)
         self.socket.listen(self.request_queue_size)
 
-        if self.post_bind_callback:
-            self.post_bind_callback()
-
-        # Create worker threads
-        self.requests.start()
-
-        self.ready = True
-        self._start_time = time.time()
-        while self.ready:
-            try:
-                self.tick()
-            except (KeyboardInterrupt, SystemExit):
-                raise
-            except:
-                self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
-                               traceback=True)
-
-            if self.interrupt:
-                while self.interrupt is True:
-                    # Wait for self.stop() to complete. See _set_interrupt.
-                    time.sleep(0.1)
-                if self.interrupt:
-                    raise self.interrupt
-
     def error_log(self, msg="", level=20, traceback=False):
         # Override this in subclasses as desired
         sys.stderr.write(msg + '\n')
@@ -1874,6 +2150,8 @@ class HTTPServer(object):
         self.socket = socket.socket(family, type, proto)
         prevent_socket_inheritance(self.socket)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         if self.nodelay and not isinstance(self.bind_addr, str):
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
@@ -1953,7 +2231,10 @@ class HTTPServer(object):
 
             conn.ssl_env = ssl_env
 
-            self.requests.put(conn)
+            if self.selector is not None:
+                self.selector.park(conn)
+            else:
+                self.requests.put(conn)
         except socket.timeout:
             # The only reason for the timeout in start() is so we can
             # notice keyboard interrupts on Win32, which don't interrupt
@@ -2031,6 +2312,9 @@ class HTTPServer(object):
                 sock.close()
             self.socket = None
 
+        selector, self.selector = self.selector, None
+        if selector is not None:
+            selector.stop(self.shutdown_timeout)
         self.requests.stop(self.shutdown_timeout)
 
 
@@ -2348,9 +2632,186 @@ try:
 except ImportError:
     pass
 
+class PreforkSupervisor(object):
+    """Runs an HTTPServer in ``workers`` forked processes.
+
+    The listening socket is bound once in the supervising process and inherited
+    by each worker, unless ``reuse_port`` is true, in which case each worker binds
+    its own socket with SO_REUSEPORT and the kernel balances connections between
+    them. Workers which exit unexpectedly are restarted, waiting ``restart_delay``
+    seconds first if they die soon after starting. SIGHUP replaces the workers
+    with fresh ones, letting the old ones finish their requests; SIGTERM and
+    SIGINT stop them, killing any which outlive ``stop_timeout`` seconds.
+    """
+
+    def __init__(self, server, workers, reuse_port=False, restart_delay=1,
+        stop_timeout=10):
+
+        self.server = server
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.children = {}
+        self.retiring = set()
+        self.reloading = False
+        self.running = False
+
+    def serve(self):
+        server = self.server
+        server.reuse_port = self.reuse_port
+        if not self.reuse_port and server.socket is None:
+            server.listen()
+
+        if server.post_bind_callback:
+            server.post_bind_callback()
+            server.post_bind_callback = None
+
+        signals.signal(signals.SIGTERM, self.stop)
+        signals.signal(signals.SIGINT, self.stop)
+        signals.signal(signals.SIGHUP, self.reload)
+
+        self.running = True
+        try:
+            for i in range(self.workers):
+                self._spawn()
+            while self.running:
+                if self.reloading:
+                    self._replace()
+                self._reap()
+        finally:
+            self._shutdown()
+
+    def reload(self, *args):
+        self.reloading = True
+
+    def stop(self, *args):
+        self.running = False
+
+    def _replace(self):
+        self.reloading = False
+        server = self.server
+
+        retiring = list(self.children)
+        self.retiring.update(retiring)
+        for i in range(self.workers):
+            self._spawn()
+
+        server.error_log('replacing workers %s' % retiring, level=logging.INFO)
+        self._signal(retiring, signals.SIGTERM)
+
+    def _reap(self):
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError, error:
+            if error.errno == errno.ECHILD:
+                time.sleep(self.restart_delay)
+            elif error.errno != errno.EINTR:
+                raise
+            return
+
+        if not pid:
+            time.sleep(0.5)
+            return
+
+        started = self.children.pop(pid, None)
+        if pid in self.retiring:
+            self.retiring.discard(pid)
+            return
+        if started is None or not self.running:
+            return
+
+        self.server.error_log('worker %d exited with status %d' % (pid, status),
+            level=logging.WARNING)
+        if time.time() - started < self.restart_delay:
+            time.sleep(self.restart_delay)
+        if self.running:
+            self._spawn()
+
+    def _shutdown(self):
+        self._signal(self.children, signals.SIGTERM)
+        deadline = time.time() + self.stop_timeout
+        while self.children and time.time() < deadline:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, error:
+                if error.errno == errno.ECHILD:
+                    self.children.clear()
+                    break
+                if error.errno != errno.EINTR:
+                    raise
+                continue
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+
+        self._signal(self.children, signals.SIGKILL)
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.children.clear()
+
+        sock, self.server.socket = self.server.socket, None
+        if sock is not None:
+            sock.close()
+
+    def _signal(self, pids, signum):
+        for pid in list(pids):
+            try:
+                os.kill(pid, signum)
+            except OSError, error:
+                if error.errno != errno.ESRCH:
+                    raise
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.time()
+            return pid
+
+        server = self.server
+        status = 0
+        try:
+            try:
+                def handler(*args):
+                    server.ready = False
+
+                signals.signal(signals.SIGHUP, signals.SIG_IGN)
+                signals.signal(signals.SIGINT, signals.SIG_IGN)
+                signals.signal(signals.SIGTERM, handler)
+
+                server.start()
+
+                # The socket is shared, so don't touch it to wake up accept()
+                # as stop() would: another worker might accept the connection.
+                sock, server.socket = server.socket, None
+                if sock is not None:
+                    sock.close()
+                server.stop()
+            except:
+                server.error_log('worker %d failed' % os.getpid(), level=logging.ERROR,
+                    traceback=True)
+                status = 1
+        finally:
+            os._exit(status)
+
 class WsgiServer(CherryPyWSGIServer):
+    """A WSGI server for mesh bundles.
+
+    The worker pool starts with ``numthreads`` threads. If ``target_wait`` is
+    specified, the pool is scaled between ``numthreads`` and ``maxthreads`` so that
+    accepted connections wait about ``target_wait`` seconds at most before a worker
+    takes them, changing at most once every ``cooldown`` seconds. If
+    ``park_connections`` is true, connections waiting for a request are parked on
+    a :class:`ConnectionSelector` rather than occupying a worker.
+    """
+
     def __init__(self, address, bundles, numthreads=10, timeout=10,
-        post_bind_callback=None):
+        post_bind_callback=None, maxthreads=-1, target_wait=None, cooldown=10,
+        park_connections=False):
 
         if isinstance(address, basestring):
             hostname, port = address.split(':')
@@ -2370,7 +2831,11 @@ class WsgiServer(CherryPyWSGIServer):
             pass
 
         super(WsgiServer, self).__init__(address, application, numthreads=numthreads,
-            timeout=timeout, post_bind_callback=post_bind_callback)
+            max=maxthreads, timeout=timeout, post_bind_callback=post_bind_callback)
+
+        self.park_connections = park_connections
+        self.requests.target_wait = target_wait
+        self.requests.cooldown = cooldown
 
     def dump_threads(self, *args):
         try:
@@ -2392,6 +2857,14 @@ class WsgiServer(CherryPyWSGIServer):
         finally:
             openfile.close()
 
+    def tick(self):
+        try:
+            super(WsgiServer, self).tick()
+        finally:
+            scale = getattr(self.requests, 'scale', None)
+            if scale is not None:
+                scale()
+
     def serve(self):
         try: 
             self.start()
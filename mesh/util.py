@@ -98,9 +98,41 @@ class LogHelper(object):
 
     def __call__(self, level, message, *args):
         if level == 'exception':
+            if args:
+                args = self._render_args(args)
             self.logger.exception(message, *args)
-        else:
-            self.logger.log(self.LEVELS[level], message, *args)
+            return
+
+        level = self.LEVELS[level]
+        if self.logger.isEnabledFor(level):
+            if args:
+                args = self._render_args(args)
+            self.logger.log(level, message, *args)
+
+    def enabled(self, level):
+        """Indicates whether messages at ``level`` would currently be emitted."""
+
+        if level == 'exception':
+            level = 'error'
+        return self.logger.isEnabledFor(self.LEVELS[level])
+
+    def _render_args(self, args):
+        return tuple((arg.render() if isinstance(arg, deferred) else arg) for arg in args)
+
+class deferred(object):
+    """A log argument which is only rendered, by calling ``function`` with the
+    specified arguments, if the message it accompanies is actually emitted."""
+
+    def __init__(self, function, *args, **params):
+        self.args = args
+        self.function = function
+        self.params = params
+
+    def __repr__(self):
+        return 'deferred(%r)' % self.function
+
+    def render(self):
+        return self.function(*self.args, **self.params)
 
 def minimize_string(value):
     return re.sub(r'\s+', ' ', value).strip(' ')
@@ -100,3 +100,14 @@ class TestBundle(TestCase):
         )
         
         self.assertEqual(bundle.ordering, [(1, 0), (1, 1), (2, 0), (2, 1)])
+
+class TestSpecification(TestCase):
+    def test_find(self):
+        specification = Bundle('bundle', mount(self.Example, self.ExampleController)).specify()
+
+        resource = specification.find('bundle/2.0/example')
+        self.assertEqual(resource['name'], 'example')
+        self.assertIs(specification.find('bundle/2.0/example'), resource)
+        self.assertIs(specification.find(('bundle', (2, 0), 'example')), resource)
+        self.assertIs(specification.cache['bundle/2.0/example'], resource)
+        self.assertRaises(KeyError, lambda: specification.find('bundle/3.0/example'))
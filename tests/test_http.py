@@ -1,17 +1,27 @@
+import errno
 import os
+import socket
 import sys
 import time
+from collections import deque
+from StringIO import StringIO
 from threading import Thread
 from unittest2 import TestCase
-from wsgiref.simple_server import make_server
+from wsgiref.simple_server import WSGIRequestHandler, make_server
 
 try:
     import json
 except ImportError:
     import simplejson as json
 
+from scheme.fields import INCOMING
+
 from mesh.standard import *
 from mesh.transport.http import *
+from mesh.transport.base import STANDARD_FORMATS, NdJson
+from mesh.exceptions import ConnectionFailed, ConnectionTimedOut, ServerError
+from mesh.transport.http import (Connection, ConnectionPool, EndpointGroup, Path,
+    StreamingResponse)
 from fixtures import *
 
 server = HttpServer([primary_bundle, secondary_bundle])
@@ -39,6 +49,26 @@ class TestHttpServer(TestCase):
             response = http(GET, path=attempt)
             self.assertEqual(response.status, NOT_FOUND)
 
+    def test_mediator_attributes(self):
+        class AnnotatingMediator(Mediator):
+            def before_validation(self, definition, request, response):
+                request.principal = request.headers.get('HTTP_AUTHORIZATION')
+                response.annotated = True
+
+        annotated = HttpServer([primary_bundle], mediators=[AnnotatingMediator()])
+        response = annotated.dispatch(GET, '/primary/1.0/example', URLENCODED, {},
+            {'HTTP_AUTHORIZATION': 'token'}, None)
+        self.assertEqual(response.status, OK)
+        self.assertTrue(response.annotated)
+
+    def test_accept_header(self):
+        headers = {'HTTP_ACCEPT': '%s; indent=2' % JSON}
+        request = HttpRequest(GET, headers=headers)
+        self.assertEqual(request.accept, (JSON, {'indent': '2'}))
+
+        request.accept[1]['indent'] = '4'
+        self.assertEqual(HttpRequest(GET, headers=headers).accept, (JSON, {'indent': '2'}))
+
     def test_json_request(self):
         data = {'required_field': 'text'}
         response = http(POST, json.dumps(data))
@@ -82,6 +112,513 @@ class TestHttpServer(TestCase):
         response = http(GET, resource='example/%d' % id)
         self.assertEqual(response.status, GONE)
 
+    def test_batch_requests(self):
+        batch = {'operations': [
+            {'method': POST, 'path': '/primary/1.0/example', 'data': {'required_field': 'text'}},
+            {'method': POST, 'path': '/primary/1.0/example', 'data': {}},
+            {'method': GET, 'path': '/primary/1.0/example/1'},
+            {'method': GET, 'path': '/secondary/1.0/secondary'},
+            {'method': PUT, 'path': '/primary/1.0/example/1/custom'},
+        ]}
+
+        response = http(POST, json.dumps(batch), path='/primary/_batch')
+        self.assertEqual(response.status, OK)
+
+        results = json.loads(response.content[0])
+        self.assertEqual([result['status'] for result in results], [200, 406, 200, 404, 405])
+        self.assertEqual(results[0]['content'], {'id': 1})
+        self.assertEqual(results[2]['content'], {'id': 1, 'required_field': 'text',
+            'default_field': 1})
+
+        response = http(GET, path='/primary/_batch')
+        self.assertEqual(response.status, METHOD_NOT_ALLOWED)
+
+        response = http(POST, json.dumps([]), path='/primary/_batch')
+        self.assertEqual(response.status, BAD_REQUEST)
+
+    def test_batch_pool_creation(self):
+        batching = HttpServer([primary_bundle], batch_workers=2)
+        self.assertIs(batching.batch_pool, None)
+
+        pools = []
+        threads = [Thread(target=lambda: pools.append(batching._acquire_batch_pool()))
+            for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(pools), 8)
+        self.assertTrue(all(pool is batching.batch_pool for pool in pools))
+        batching.batch_pool.close()
+
+class StreamingExampleController(ExampleController):
+    failure = None
+
+    def query(self, request, response, subject, data):
+        content = super(StreamingExampleController, self).query(request, response, subject, data)
+        if 'resources' in content:
+            resources = content['resources']
+            if self.failure is not None:
+                resources = resources[:self.failure] + [{'id': 'invalid'}]
+            content['resources'] = iter(resources)
+        return content
+
+class TestStreamedResponses(TestCase):
+    def setUp(self):
+        storage.reset()
+        self.server = HttpServer([Bundle('streaming', mount(Example, StreamingExampleController))],
+            available_formats=STANDARD_FORMATS + (NdJson,))
+        self.server.stream_chunksize = 16
+
+        for i in range(3):
+            response = self.dispatch(POST, json.dumps({'required_field': 'text%d' % i}), JSON)
+            self.assertEqual(response.status, OK)
+
+    def dispatch(self, method, data, mimetype=None, path='/streaming/1.0/example'):
+        response = self.server.dispatch(method, path, mimetype, {}, {}, data)
+        response.apply_standard_headers()
+        return response
+
+    def test_json(self):
+        response = self.dispatch(GET, 'sort=[required_field-]')
+        self.assertEqual(response.status, OK)
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertNotIsInstance(response.content, list)
+
+        chunks = list(response.content)
+        self.assertGreater(len(chunks), 1)
+
+        content = json.loads(''.join(chunks))
+        self.assertEqual(content['total'], 3)
+        self.assertEqual([r['required_field'] for r in content['resources']],
+            ['text2', 'text1', 'text0'])
+
+        response = self.dispatch(GET, 'total=true')
+        self.assertEqual(json.loads(response.content[0]), {'total': 3})
+
+    def test_ndjson(self):
+        response = self.dispatch(GET, 'limit=2', path='/streaming/1.0/example!ndjson')
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.mimetype, NdJson.mimetype)
+
+        body = ''.join(response.content)
+        self.assertEqual(json.loads(body.splitlines()[0]), {'total': 3, '_stream': 'resources'})
+
+        content = NdJson.unserialize(body)
+        self.assertEqual(content['total'], 3)
+        self.assertEqual([r['required_field'] for r in content['resources']], ['text0', 'text1'])
+
+        schema = Example.requests['query'].responses[OK].schema
+        self.assertEqual(schema.process(content, INCOMING, True), content)
+
+    def test_failed_items(self):
+        StreamingExampleController.failure = 1
+        try:
+            response = self.dispatch(GET, 'limit=2', path='/streaming/1.0/example!ndjson')
+            self.assertEqual(response.status, OK)
+            body = ''.join(response.content)
+            self.assertEqual(json.loads(body.splitlines()[-1]), {'_error': SERVER_ERROR})
+            self.assertRaises(ServerError, lambda: NdJson.unserialize(body))
+
+            self.server.stream_chunksize = 65536
+            response = self.dispatch(GET, 'limit=2')
+            self.assertEqual(response.status, SERVER_ERROR)
+            self.assertIs(response.content, None)
+        finally:
+            StreamingExampleController.failure = None
+
+    def test_batch(self):
+        batch = {'operations': [{'method': GET, 'path': '/streaming/1.0/example'}]}
+        response = self.dispatch(POST, json.dumps(batch), JSON, '/streaming/_batch')
+
+        results = json.loads(response.content[0])
+        self.assertEqual(results[0]['status'], 200)
+        self.assertEqual(len(results[0]['content']['resources']), 3)
+
+class AttachmentServer(WsgiServer):
+    def dispatch(self, method, path, mimetype, context, headers, data):
+        attachment = data.files['file']
+        self.filename = attachment.filename
+
+        def stream():
+            openfile = attachment.open()
+            try:
+                yield openfile.read()
+            finally:
+                openfile.close()
+        return HttpResponse(OK, stream(), 'text/plain')
+
+class TestMultipartRequests(TestCase):
+    def test_attachment_lifetime(self):
+        body = ('--boundary\r\nContent-Disposition: inline\r\n'
+            'Content-Type: application/json\r\n\r\n{}\r\n'
+            '--boundary\r\nContent-Disposition: attachment; name="file"\r\n\r\n'
+            '%s\r\n--boundary--\r\n' % ('a' * 1000))
+
+        server = AttachmentServer(spool_threshold=100)
+        environ = {'REQUEST_METHOD': POST, 'PATH_INFO': '/',
+            'CONTENT_TYPE': 'multipart/mixed; boundary=boundary',
+            'wsgi.input': StringIO(body)}
+
+        statuses = []
+        content = server(environ, lambda status, headers: statuses.append(status))
+        self.assertEqual(statuses, ['200 OK'])
+        self.assertTrue(os.path.exists(server.filename))
+
+        self.assertEqual(''.join(content), 'a' * 1000)
+        self.assertTrue(os.path.exists(server.filename))
+
+        content.close()
+        self.assertFalse(os.path.exists(server.filename))
+
+class VersionedController(HarnessController):
+    resource = Example
+    version = (1, 0)
+
+class VersionedController(VersionedController):
+    resource = Example
+    version = (1, 1)
+
+versioned_bundle = Bundle('versioned',
+    mount(Example, VersionedController)
+)
+
+class DenyingMediator(Mediator):
+    denied = False
+
+    def before_validation(self, definition, request, response):
+        if self.denied:
+            response(FORBIDDEN)
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        storage.reset()
+        self.mediator = DenyingMediator()
+        self.server = HttpServer([primary_bundle, versioned_bundle], mediators=[self.mediator],
+            cache=ResponseCache(maxsize=2, identity_headers='HTTP_AUTHORIZATION'))
+
+    def dispatch(self, method, path, data=None, **headers):
+        mimetype = JSON if data else URLENCODED
+        return self.server.dispatch(method, path, mimetype, {}, headers, data)
+
+    def test_conditional_requests(self):
+        response = self.dispatch(POST, '/primary/1.0/example', json.dumps({'required_field': 'text'}))
+        id = json.loads(response.content[0])['id']
+        path = '/primary/1.0/example/%d' % id
+
+        response = self.dispatch(GET, path)
+        self.assertEqual(response.status, OK)
+        etag = response.headers['ETag']
+
+        response = self.dispatch(GET, path)
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.server.cache.stats['hits'], 1)
+
+        response = self.dispatch(GET, path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status, NOT_MODIFIED)
+        self.assertIs(response.content, None)
+
+        response = self.dispatch(POST, path, json.dumps({'required_field': 'changed'}))
+        self.assertEqual(response.status, OK)
+
+        response = self.dispatch(GET, path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status, OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_eviction(self):
+        for query in ('limit=1', 'limit=2', 'limit=3'):
+            self.dispatch(GET, '/primary/1.0/example', query)
+
+        cache = self.server.cache
+        self.assertEqual(len(cache.entries), 2)
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_interleaved_invalidation(self):
+        cache = self.server.cache
+        put = cache.put
+
+        def interleaved(key, tag, response, generation=None):
+            cache.invalidate(tag)
+            return put(key, tag, response, generation)
+
+        cache.put = interleaved
+        response = self.dispatch(GET, '/primary/1.0/example')
+        self.assertEqual(response.status, OK)
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(len(cache.entries), 0)
+
+        del cache.put
+        response = self.dispatch(GET, '/primary/1.0/example')
+        self.assertIn('ETag', response.headers)
+        self.assertEqual(len(cache.entries), 1)
+
+    def test_identity(self):
+        response = self.dispatch(POST, '/primary/1.0/example', json.dumps({'required_field': 'text'}))
+        path = '/primary/1.0/example/%d' % json.loads(response.content[0])['id']
+
+        for authorization in ('first', 'second', 'first'):
+            response = self.dispatch(GET, path, HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.status, OK)
+        stats = self.server.cache.stats
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+        server = HttpServer([primary_bundle], cache=ResponseCache())
+        response = server.dispatch(GET, path, URLENCODED, {}, {}, None)
+        self.assertEqual(response.status, OK)
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(len(server.cache.entries), 0)
+
+    def test_mediated_hits(self):
+        response = self.dispatch(GET, '/primary/1.0/example')
+        self.assertEqual(response.status, OK)
+
+        self.mediator.denied = True
+        response = self.dispatch(GET, '/primary/1.0/example')
+        self.assertEqual(response.status, FORBIDDEN)
+        self.assertIs(response.content, None)
+        self.assertEqual(self.server.cache.stats['hits'], 1)
+
+    def test_versioned_invalidation(self):
+        response = self.dispatch(POST, '/versioned/1.0/example', json.dumps({'required_field': 'text'}))
+        path = '/versioned/%%s/example/%d' % json.loads(response.content[0])['id']
+
+        response = self.dispatch(GET, path % '1.1')
+        self.assertEqual(json.loads(response.content[0])['required_field'], 'text')
+
+        response = self.dispatch(POST, path % '1.0', json.dumps({'required_field': 'changed'}))
+        self.assertEqual(response.status, OK)
+
+        response = self.dispatch(GET, path % '1.1')
+        self.assertEqual(json.loads(response.content[0])['required_field'], 'changed')
+
+class TestPreparedRequest(TestCase):
+    def test_preparation(self):
+        client = HttpClient('localhost:8888', primary_bundle.specify())
+        prepared = client.prepare_request('primary/1.0/example', 'update')
+        self.assertIs(client.prepare_request('primary/1.0/example', 'update'), prepared)
+        self.assertEqual(prepared.method, POST)
+
+        method, path, mimetype, data, headers = prepared.prepare(1, {'integer_field': 2})
+        self.assertEqual((method, path, mimetype), (POST, '/primary/1.0/example/1!json', JSON))
+        self.assertEqual(json.loads(data), {'integer_field': 2})
+        self.assertEqual(headers['Content-Type'], JSON)
+
+class TestRouteTable(TestCase):
+    def test_resolution_matches_path(self):
+        for candidate in ('/primary/1.0/example', '/primary/1.0/example/1/',
+                '/primary/1.0/example/1/custom', '/primary/1.0/example!json',
+                '/primary/1.0/example/1!json', '/secondary/1.0/secondary'):
+            path, groups = server.routes.resolve(candidate)
+            expected = Path(server, candidate)
+            self.assertEqual(path, expected)
+            self.assertIs(groups, server.groups[expected.signature])
+
+    def test_introspection(self):
+        path, groups = server.routes.resolve('/primary/_specification')
+        self.assertEqual(path.type, 'introspection')
+        self.assertEqual(path.bundle, 'primary')
+        self.assertEqual(path.request, 'specification')
+        self.assertIs(groups, None)
+
+    def test_unresolved_paths(self):
+        for candidate in ('/primary/1.0/wrong', '/primary/10.0/example', '/wrong/1.0/example',
+                '/primary/1.0/example/a b', '/primary/1.0/example!wrong', 'primary/1.0/example'):
+            self.assertIs(server.routes.resolve(candidate), None)
+
+class FakeConnection(object):
+    def __init__(self, host, timeout=None):
+        self.closed = False
+        self.host = host
+
+    def close(self):
+        self.closed = True
+
+class TestConnectionPool(TestCase):
+    def test_reuse(self):
+        pool = ConnectionPool(FakeConnection, 'localhost')
+        connection, reused = pool.acquire()
+        self.assertFalse(reused)
+
+        pool.release(connection)
+        self.assertEqual(pool.acquire(), (connection, True))
+        self.assertEqual(pool.stats['hits'], 1)
+        self.assertEqual(pool.stats['misses'], 1)
+
+    def test_maxsize(self):
+        pool = ConnectionPool(FakeConnection, 'localhost', maxsize=1)
+        first, second = pool.acquire()[0], pool.acquire()[0]
+
+        pool.release(first)
+        pool.release(second)
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.stats['evictions'], 1)
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(FakeConnection, 'localhost', idle_timeout=0)
+        connection = pool.acquire()[0]
+        pool.release(connection)
+
+        time.sleep(0.01)
+        candidate, reused = pool.acquire()
+        self.assertFalse(reused)
+        self.assertIsNot(candidate, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats['evictions'], 1)
+
+class FakeResponse(object):
+    reason = 'OK'
+    status = 200
+    will_close = False
+
+    def __init__(self, content, headers):
+        self.content = content
+        self.headers = headers
+
+    def getheaders(self):
+        return self.headers
+
+    def read(self, amount):
+        chunk, self.content = self.content[:amount], self.content[amount:]
+        return chunk
+
+class TestStreamingResponse(TestCase):
+    def test_streaming(self):
+        pool = ConnectionPool(FakeConnection, 'localhost')
+        connection = pool.acquire()[0]
+
+        response = StreamingResponse(connection, FakeResponse('x' * 10,
+            [('content-length', '10'), ('transfer-encoding', 'chunked')]), pool, 4)
+        self.assertEqual(response.status_line, '200 OK')
+        self.assertEqual(response.headers, [('Content-Length', '10')])
+        self.assertEqual(list(response), ['xxxx', 'xxxx', 'xx'])
+
+        response.close()
+        self.assertFalse(connection.closed)
+        self.assertEqual(pool.acquire(), (connection, True))
+
+    def test_incomplete_response_closes_connection(self):
+        connection = FakeConnection('localhost')
+        response = StreamingResponse(connection, FakeResponse('x' * 10, []), None, 4)
+
+        iter(response).next()
+        response.close()
+        self.assertTrue(connection.closed)
+
+class ScriptedResponse(object):
+    status = 200
+    will_close = False
+
+    def getheader(self, name, default=None):
+        return default
+
+    def getheaders(self):
+        return []
+
+    def read(self):
+        return ''
+
+class ScriptedConnection(FakeConnection):
+    attempts = []
+    script = deque()
+
+    def __init__(self, host, timeout=None):
+        FakeConnection.__init__(self, host, timeout)
+        self.failure = None
+        self.sock = None
+
+    def request(self, method, url, body, headers):
+        self.attempts.append(method)
+        self.failure = self.script.popleft() if self.script else None
+        if self.failure == 'send':
+            raise socket.error(errno.EPIPE, 'broken pipe')
+
+    def getresponse(self):
+        if self.failure == 'reset':
+            raise socket.error(errno.ECONNRESET, 'connection reset')
+        elif self.failure == 'timeout':
+            raise socket.timeout('timed out')
+        return ScriptedResponse()
+
+class TestConnectionRetries(TestCase):
+    def request(self, method, *failures):
+        connection = Connection('http://localhost')
+        connection.pool = ConnectionPool(ScriptedConnection, 'localhost')
+        connection.pool.release(connection.pool.create())
+
+        ScriptedConnection.attempts = []
+        ScriptedConnection.script = deque(failures)
+        try:
+            return connection.request(method, '/')
+        finally:
+            self.retries = connection.pool.stats['retries']
+
+    def test_retry_unsent_request(self):
+        self.assertEqual(self.request(POST, 'send').status, OK)
+        self.assertEqual(ScriptedConnection.attempts, [POST, POST])
+        self.assertEqual(self.retries, 1)
+
+    def test_retry_idempotent_request(self):
+        self.assertEqual(self.request(GET, 'reset').status, OK)
+        self.assertEqual(ScriptedConnection.attempts, [GET, GET])
+
+    def test_no_retry_after_send(self):
+        self.assertRaises(ConnectionFailed, lambda: self.request(POST, 'reset'))
+        self.assertEqual(ScriptedConnection.attempts, [POST])
+        self.assertEqual(self.retries, 0)
+
+    def test_no_retry_on_timeout(self):
+        for method in (GET, POST):
+            self.assertRaises(ConnectionTimedOut, lambda: self.request(method, 'timeout'))
+            self.assertEqual(ScriptedConnection.attempts, [method])
+            self.assertEqual(self.retries, 0)
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class TestConcurrentHttpClient(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server('localhost', 0, HttpServer([primary_bundle]),
+            handler_class=QuietRequestHandler)
+        cls.thread = Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+
+    def setUp(self):
+        storage.reset()
+        self.client = HttpClient('localhost:%d' % self.server.server_port,
+            primary_bundle.specify(), concurrency=4)
+
+    def test_gather(self):
+        ids = []
+        for text in ('a', 'b', 'c'):
+            response = self.client.execute('primary/1.0/example', 'create',
+                data={'required_field': text})
+            ids.append(response.content['id'])
+
+        responses = self.client.gather([('primary/1.0/example', 'get', id) for id in ids],
+            timeout=5)
+        self.assertEqual([r.content['required_field'] for r in responses], ['a', 'b', 'c'])
+
+    def test_gather_exceptions(self):
+        response = self.client.execute('primary/1.0/example', 'create',
+            data={'required_field': 'text'})
+        id = response.content['id']
+
+        operations = [('primary/1.0/example', 'get', id), ('primary/1.0/example', 'get', id + 1)]
+        responses = self.client.gather(operations, return_exceptions=True)
+        self.assertTrue(responses[0].ok)
+        self.assertIsInstance(responses[1], RequestError)
+        self.assertRaises(RequestError, lambda: self.client.gather(operations))
+
 class _TestHttpClient(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -114,3 +651,43 @@ class _TestHttpClient(TestCase):
 
         response = client.execute('example', 'create', data={'required_field': 'text'})
         print response
+
+class TestEndpointGroup(TestCase):
+    def construct_group(self, *filters):
+        group = EndpointGroup(((), 'example'), POST, Example, ExampleController, None)
+        for i, filter in enumerate(filters):
+            group.attach(Request(name='request%d' % i, endpoint=(POST, 'example'),
+                filter=filter))
+        return group
+
+    def claimed(self, group, data):
+        request = group.claim(data)
+        if request:
+            return request.name
+
+    def test_claiming(self):
+        group = self.construct_group({'task': 'a'}, {'task': 'b'}, {'task': 'c', 'mode': 1},
+            [{'task': 'a'}], {'task': 'd', 'tags': ['x']})
+
+        self.assertEqual(self.claimed(group, {'task': 'a', 'other': 1}), 'request0')
+        self.assertEqual(self.claimed(group, {'task': 'b'}), 'request1')
+        self.assertEqual(self.claimed(group, {'task': 'c', 'mode': 1}), 'request2')
+        self.assertEqual(self.claimed(group, [{'task': 'a'}, {'task': 'b'}]), 'request3')
+        self.assertEqual(self.claimed(group, {'task': 'd', 'tags': ['x']}), 'request4')
+
+        for data in (None, 'task', {}, {'task': 'c'}, {'task': ['a']}, {'task': 'd'}, [],
+                [{'task': 'b'}]):
+            self.assertIs(group.claim(data), None)
+
+        group = self.construct_group({}, [])
+        self.assertEqual(self.claimed(group, {'task': 'a'}), 'request0')
+        self.assertEqual(self.claimed(group, [1]), 'request1')
+        self.assertIs(group.claim('text'), None)
+
+    def test_ambiguous_filters(self):
+        for filters in (({'task': 'a'}, {'task': 'a'}), ({'task': 'a'}, {'mode': 1}),
+                ({'task': 'a'}, {'task': 'a', 'mode': 1}), ({}, {'task': 'a'}),
+                ([{'task': 'a'}], [])):
+            self.assertRaises(SpecificationError, lambda: self.construct_group(*filters))
+
+        self.construct_group({'task': 'a'}, {'task': 'b', 'mode': 1}, [{'task': 'a'}])
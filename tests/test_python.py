@@ -81,3 +81,52 @@ class TestPythonInterface(TestCase):
         self.assertEqual(
                 example.extract_dict(attrs={'required_field': 'new_field'}), 
                 {'new_field': 'text'})
+
+    def test_query_pages(self):
+        for i in range(7):
+            Example.create(required_field='text%d' % i, integer_field=i % 3)
+
+        query = Example.query().sort('integer_field-')
+        pages = list(query.pages(3))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([page.total for page in pages], [7, 7, 7])
+        self.assertIs(pages[-1].cursor, None)
+        self.assertEqual([example.id for page in pages for example in page],
+            [3, 6, 2, 5, 1, 4, 7])
+
+        page = query.limit(2).all()
+        self.assertEqual([example.id for example in page], [3, 6])
+        self.assertEqual([example.id for example in query.cursor(page.cursor).limit(2).all()],
+            [2, 5])
+
+        self.assertRaises(InvalidError, lambda: query.cursor('invalid').all())
+        self.assertRaises(InvalidError, lambda: query.cursor(page.cursor).offset(1).all())
+
+    def test_query_iteration(self):
+        for i in range(7):
+            Example.create(required_field='text%d' % i)
+
+        for prefetch in (False, True):
+            results = Example.query().iterate(3, prefetch)
+            self.assertEqual(results.total, 7)
+            self.assertEqual([example.id for example in results], range(1, 8))
+
+        results = Example.query().offset(1).limit(5).iterate(2, True)
+        self.assertEqual([example.id for example in results], [2, 3, 4, 5, 6])
+        self.assertEqual([example.id for example in Example.query().limit(4)], [1, 2, 3, 4])
+
+    def test_default_projection(self):
+        class ProjectedExample(Example):
+            default_projection = {'fields': ['required_field']}
+
+        id = Example.create(required_field='text', integer_field=2).id
+
+        example = ProjectedExample.get(id)
+        self.assertEqual(example.required_field, 'text')
+        self.assertIs(example.integer_field, None)
+
+        example = ProjectedExample.get(id, exclude=['required_field'])
+        self.assertEqual(example.integer_field, 2)
+
+        examples = ProjectedExample.query().all()
+        self.assertEqual([(e.required_field, e.integer_field) for e in examples], [('text', None)])
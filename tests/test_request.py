@@ -3,9 +3,12 @@ from unittest2 import TestCase
 from mesh.constants import *
 from mesh.exceptions import *
 from mesh.request import *
+from mesh.request import ProcessingPlan
 from mesh.transport.base import ServerRequest
 from mesh.transport.internal import *
 from scheme import *
+from scheme.exceptions import StructuralError
+from scheme.fields import INCOMING, OUTGOING
 
 def construct_example_request(resource, name='test', specific=False, endpoint=(GET, 'resource'),
     auto_constructed=True, schema=None, ok=None, filter=None, batch=False, validators=None,
@@ -338,3 +341,74 @@ class TestRequest(TestCase):
         request.process(controller, req, resp)
         self.assertEqual(resp.status, INVALID)
         self.assertEqual(resp.content, ([{'token': 'general'}], {'id': [{'token': '2'}, {'token': '3'}]}))
+
+class TestProcessingPlan(TestCase):
+    def test_compilation(self):
+        self.assertIs(ProcessingPlan.compile(Integer()), None)
+
+        plan = ProcessingPlan.compile(Structure({'id': Integer(), 'name': Text(required=True)}))
+        self.assertIsInstance(plan, ProcessingPlan)
+        self.assertEqual(set(plan.processors.keys()), set(['id', 'name']))
+        self.assertEqual(plan.required, ['name'])
+
+    def test_processing(self):
+        schema = Structure({
+            'id': Integer(),
+            'items': Sequence(Structure({'flag': Boolean(), 'name': Text()})),
+        })
+
+        plan = ProcessingPlan.compile(schema)
+        value = {'id': 1, 'items': [{'flag': True, 'name': 'a'}, {'name': 'b'}]}
+        for phase in (INCOMING, OUTGOING):
+            self.assertEqual(plan.process(value, phase), schema.process(value, phase))
+
+    def test_fallback(self):
+        plan = ProcessingPlan.compile(Structure({'id': Integer(maximum=1),
+            'default': Integer(default=2)}))
+
+        self.assertEqual(plan.process({'id': 1}, INCOMING), {'id': 1, 'default': 2})
+        self.assertRaises(StructuralError, lambda: plan.process({'id': 2, 'default': 2}, INCOMING))
+        self.assertRaises(StructuralError, lambda: plan.process({'unknown': 1, 'default': 2}, INCOMING))
+
+    def test_ignored_nulls(self):
+        from mesh.standard import Resource
+
+        class Identified(Resource):
+            name = 'identified'
+            version = 1
+            requests = 'create'
+
+            class schema:
+                id = Integer(oncreate=True)
+                name = Text()
+
+        received = []
+        def callback(definition, request, response, subject, data):
+            received.append(data)
+            response(OK, {'id': 1})
+
+        request = Identified.requests['create']
+        controller = construct_controller_harness(callback=callback)
+        response = ServerResponse()
+        request.process(controller, ServerRequest(None, data={'id': None, 'name': 'a'}), response)
+
+        self.assertEqual(response.status, OK)
+        self.assertEqual(received, [{'name': 'a'}])
+        self.assertIsInstance(request.plans[None], ProcessingPlan)
+        self.assertIn('id', request.plans[None].ignored)
+
+        plan = ProcessingPlan.compile(Structure({'id': Integer(ignore_null=True, required=True)}))
+        self.assertRaises(StructuralError, lambda: plan.process({'id': None}, INCOMING))
+
+    def test_generic_switch(self):
+        request = construct_example_request(object())
+        controller = construct_controller_harness(None, None, OK, {'id': 1})
+
+        request.compiled = False
+        try:
+            response = ServerResponse()
+            request.process(controller, ServerRequest(None), response)
+            self.assertEqual(response.content, {'id': 1})
+            self.assertIs(request.plans, None)
+        finally:
+            del request.compiled
@@ -1,3 +1,4 @@
+from threading import Thread
 from unittest2 import TestCase
 
 from mesh.constants import *
@@ -152,6 +153,41 @@ class TestResource(TestCase):
         self.assertIsInstance(ExampleController.requests, dict)
         self.assertEqual(ExampleController.requests['test'], ExampleController.test)
 
+    def test_controller_reuse(self):
+        Example = self.example_resource()
+
+        class ExampleController(Controller):
+            configuration = self.configuration
+            resource = Example
+            version = (1, 0)
+
+        self.assertIsNot(ExampleController.instantiate(), ExampleController.instantiate())
+
+        class SingletonController(ExampleController):
+            resource = Example
+            reusable = 'singleton'
+            version = (1, 1)
+
+        instance = SingletonController.instantiate()
+        self.assertIsInstance(instance, SingletonController)
+        self.assertIs(SingletonController.instantiate(), instance)
+
+        class ThreadController(SingletonController):
+            resource = Example
+            reusable = 'thread'
+            version = (1, 2)
+
+        instance = ThreadController.instantiate()
+        self.assertIsInstance(instance, ThreadController)
+        self.assertIs(ThreadController.instantiate(), instance)
+
+        instances = []
+        thread = Thread(target=lambda: instances.append(ThreadController.instantiate()))
+        thread.start()
+        thread.join()
+        self.assertIsInstance(instances[0], ThreadController)
+        self.assertIsNot(instances[0], instance)
+
     def test_controller_inheritance(self):
         Example = self.example_resource()
 
@@ -1,7 +1,12 @@
+import os
+from cStringIO import StringIO
 from datetime import date, time
+from tempfile import mkstemp
+from threading import Thread
 from unittest2 import TestCase
 
 from mesh.standard import *
+from mesh.standard.mock import MockStorage, json, mock_bundle
 from mesh.transport.internal import *
 
 from fixtures import *
@@ -111,3 +116,230 @@ class TestStandardResources(TestCase):
         response = server.dispatch(endpoint('get'), {}, id, {'exclude': ['default_field']})
         self.assertEqual(response.status, OK)
         self.assertEqual(response.content, {'id': id, 'required_field': 'text'})
+
+        response = server.dispatch(endpoint('get'), {}, id, {'fields': ['required_field']})
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.content, {'id': id, 'required_field': 'text'})
+
+        response = server.dispatch(endpoint('query'), {}, None, {'fields': ['default_field'],
+            'include': ['deferred_field']})
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.content['resources'], [{'id': id, 'default_field': 1,
+            'deferred_field': 'deferred'}])
+
+class TestProjection(TestCase):
+    def test_projection(self):
+        projection = Projection(Example)
+        self.assertIn('id', projection)
+        self.assertIn('required_field', projection)
+        self.assertNotIn('deferred_field', projection)
+
+        projection = Projection.construct(Example, {'include': ['deferred_field'],
+            'exclude': ['required_field']})
+        self.assertIn('deferred_field', projection)
+        self.assertNotIn('required_field', projection)
+
+        projection = Projection.construct(Example, {'fields': ['text_field']})
+        self.assertEqual(projection.fields, frozenset(['id', 'text_field']))
+        self.assertEqual(projection.apply({'id': 1, 'text_field': 'a', 'integer_field': 2}),
+            {'id': 1, 'text_field': 'a'})
+
+    def test_unprojected_dispatch(self):
+        class UnprojectedController(HarnessController):
+            resource = Example
+            version = (1, 0)
+
+            def dispatch(self, definition, request, response, subject, data):
+                return Controller.dispatch(self, definition, request, response, subject, data)
+
+        storage.reset()
+        id = storage.save(Example, {'required_field': 'text', 'deferred_field': 'text'})
+
+        response = ServerResponse()
+        Example.requests['get'].process(UnprojectedController, ServerRequest(subject=id),
+            response)
+        self.assertEqual(response.status, OK)
+        self.assertNotIn('deferred_field', response.content)
+
+        response = ServerResponse()
+        Example.requests['query'].process(UnprojectedController,
+            ServerRequest(data={'include': ['deferred_field']}), response)
+        self.assertEqual(response.status, OK)
+        self.assertEqual(response.content['resources'][0]['deferred_field'], 'text')
+
+class TestIndexedStorage(TestCase):
+    def setUp(self):
+        storage.reset()
+        self.storage = MockStorage(':memory:', indexed=True)
+        self.server = InternalServer([mock_bundle(primary_bundle, self.storage)])
+
+    def test_indexed_query(self):
+        for i in range(12):
+            data = {'required_field': 'text%d' % (i % 5), 'integer_field': i % 4}
+            if i % 3:
+                data.pop('integer_field')
+            for target in (server, self.server):
+                target.dispatch(endpoint('create'), {}, None, data)
+
+        self.assertEqual(self.storage.columns['example'], ('integer_field', 'required_field'))
+
+        queries = [
+            {},
+            {'total': True, 'query': {'integer_field__gte': 1}},
+            {'query': {'integer_field__lt': 2}, 'sort': ['required_field-']},
+            {'query': {'integer_field__in': [0, 3]}, 'sort': ['integer_field']},
+            {'query': {'integer_field__gt': 0, 'integer_field__lte': 3},
+                'sort': ['required_field', 'integer_field-'], 'offset': 2, 'limit': 4},
+            {'sort': ['integer_field-'], 'offset': 1},
+        ]
+
+        for query in queries:
+            expected = server.dispatch(endpoint('query'), {}, None, dict(query))
+            response = self.server.dispatch(endpoint('query'), {}, None, dict(query))
+            self.assertEqual(response.status, OK)
+            self.assertEqual(response.content, expected.content)
+
+        query = {'sort': ['integer_field-'], 'limit': 5}
+        response = self.server.dispatch(endpoint('query'), {}, None, dict(query))
+        ids = [resource['id'] for resource in response.content['resources']]
+
+        query['cursor'] = response.content['next_cursor']
+        response = self.server.dispatch(endpoint('query'), {}, None, query)
+        ids += [resource['id'] for resource in response.content['resources']]
+
+        expected = server.dispatch(endpoint('query'), {}, None, {'sort': ['integer_field-'],
+            'limit': 10})
+        self.assertEqual(ids, [resource['id'] for resource in expected.content['resources']])
+        self.assertEqual((storage.indexes, self.storage.indexes), ({}, {}))
+
+class TestMockStorage(TestCase):
+    def test_batched_writes(self):
+        storage = MockStorage(':memory:', indexed=True)
+        ids = storage.save_many(Example, [{'required_field': 'text%d' % i} for i in range(5)])
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+        self.assertEqual(storage.save_many(Example, [{'id': 10, 'required_field': 'created'}],
+            creating=True), [10])
+        self.assertRaises(Exception, lambda: storage.save_many(Example,
+            [{'id': 12, 'required_field': 'text'}, {'id': 2, 'required_field': 'text'}],
+            creating=True))
+        self.assertIs(storage.get('example', 12), None)
+
+        self.assertEqual(storage.save_many(Example, [{'id': 2, 'required_field': 'changed'},
+            {'required_field': 'text5'}]), [2, 11])
+        self.assertEqual(storage.get('example', 2)['required_field'], 'changed')
+        self.assertEqual(storage.count('example', {'required_field__in': ['changed']}), 1)
+
+        storage.delete_many('example', [1, 3, 10])
+        self.assertEqual([r['id'] for r in storage.query('example')], [2, 4, 5, 11])
+
+    def test_streamed_fixtures(self):
+        handle, filename = mkstemp()
+        try:
+            os.write(handle, json.encode([{'resource': 'example', 'id': i,
+                'required_field': 'text%d' % i} for i in range(1, 2501)]))
+            os.close(handle)
+
+            storage = MockStorage(':memory:')
+            openfile = open(filename, 'rb')
+            try:
+                storage.load(openfile, True)
+            finally:
+                openfile.close()
+
+            self.assertEqual(storage.count('example'), 2500)
+            self.assertEqual(storage.get('example', 2500)['required_field'], 'text2500')
+
+            fixtures = StringIO('[{"resource": "example", "id": 2500}, {"resource": "example", ')
+            self.assertRaises(ValueError, lambda: storage.load(fixtures, True))
+            self.assertEqual(storage.count('example'), 2500)
+        finally:
+            os.unlink(filename)
+
+    def test_concurrent_access(self):
+        handle, filename = mkstemp()
+        os.close(handle)
+
+        try:
+            for path in (':memory:', filename):
+                storage = MockStorage(path, fresh=True, indexed=True)
+                errors = []
+
+                def work(n):
+                    try:
+                        for i in range(100):
+                            id = storage.save(Example, {'required_field': 'text%d' % n,
+                                'integer_field': i})
+                            self.assertEqual(storage.get('example', id)['integer_field'], i)
+                            storage.select('example', {'integer_field__gt': 50},
+                                ['required_field'], limit=5)
+                            storage.count('example')
+                            if i % 10 == 0:
+                                storage.delete('example', id)
+                    except Exception, exception:
+                        errors.append(exception)
+
+                threads = [Thread(target=work, args=(n,)) for n in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                self.assertEqual(errors, [])
+                self.assertEqual(storage.count('example'), 720)
+                if path != ':memory:':
+                    self.assertEqual(len(storage.connections), 1)
+                storage.reset()
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(filename + suffix):
+                    os.unlink(filename + suffix)
+
+    def test_write_revisions(self):
+        storage = MockStorage(':memory:')
+        revision = storage.revision
+
+        storage.save(Example, {'required_field': 'text'})
+        self.assertEqual(storage.revision, revision + 1)
+        self.assertRaises(Exception, lambda: storage.save_many(Example,
+            [{'id': 1, 'required_field': 'text'}], creating=True))
+        self.assertEqual(storage.revision, revision + 2)
+        storage.delete('example', 1)
+        self.assertEqual(storage.revision, revision + 3)
+
+class TestMockController(TestCase):
+    def test_query_filters(self):
+        controller = ExampleController()
+        resources = [{'id': i, 'text_field': ('Text%d' % i) if i % 4 else None,
+            'integer_field': i % 3} for i in range(1, 13)]
+
+        def evaluate(query):
+            predicate = controller._compile_query(query)
+            return [r['id'] for r in resources if predicate(r)]
+
+        self.assertEqual(evaluate({'integer_field': 1}), [1, 4, 7, 10])
+        self.assertEqual(evaluate({'integer_field__not': 1, 'text_field__null': False}),
+            [2, 3, 5, 6, 9, 11])
+        self.assertEqual(evaluate({'text_field__iprefix': 'text1', 'text_field__null': False,
+            'integer_field__in': [0, 2]}), [11])
+        self.assertEqual(evaluate({'integer_field__gte': 2, 'integer_field__notin': [0]}),
+            [2, 5, 8, 11])
+        self.assertEqual(evaluate({'text_field__contains': '1', 'text_field__null': False,
+            'integer_field__lt': 2}), [1, 10])
+
+    def test_sort_resources(self):
+        controller = ExampleController()
+        resources = [{'id': i, 'text_field': 'text%d' % (i % 2),
+            'integer_field': (i % 3) or None} for i in range(1, 9)]
+
+        def sort(sorting):
+            ordered = controller._sort_resources(resources, sorting)
+            fields, key = controller._construct_sort_key(sorting)
+            keys = [key([r.get(f) for f in fields]) for r in ordered]
+            self.assertEqual(keys, sorted(keys))
+            return [r['id'] for r in ordered]
+
+        self.assertEqual(sort(['integer_field']), [3, 6, 1, 4, 7, 2, 5, 8])
+        self.assertEqual(sort(['integer_field-']), [2, 5, 8, 1, 4, 7, 3, 6])
+        self.assertEqual(sort(['text_field-', 'integer_field']), [3, 1, 7, 5, 6, 4, 2, 8])
+        self.assertEqual(sort(['text_field', 'id-']), [8, 6, 4, 2, 7, 5, 3, 1])
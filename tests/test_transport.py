@@ -1,14 +1,28 @@
+import os
+import signal
+import time
+
 try:
     import json
 except ImportError:
     import simplejson as json
 
+from httplib import HTTPConnection
+from Queue import Queue
+from tempfile import mkstemp
+from threading import Thread
+
+from scheme.formats import Json
 from unittest2 import TestCase
 
 from mesh.bundle import *
 from mesh.constants import *
 from mesh.exceptions import *
 from mesh.transport.base import *
+from mesh.transport.multipart import (BufferedStream, MultipartEncoder, MultipartPayload,
+    parse_multipart_mixed)
+from mesh.transport.wsgiserver import (CherryPyWSGIServer, PreforkSupervisor, ThreadPool,
+    WorkerThread)
 
 from fixtures import *
 
@@ -40,3 +54,340 @@ class TestClient(TestCase):
 
         client.unregister()
         self.assertIs(Client.get_client(specification), None)
+
+class TrickleStream(object):
+    def __init__(self, data, size):
+        self.data = data
+        self.offset = 0
+        self.size = size
+
+    def read(self, size):
+        chunk = self.data[self.offset:self.offset + min(size, self.size)]
+        self.offset += len(chunk)
+        return chunk
+
+    def readline(self):
+        end = self.data.find('\n', self.offset)
+        if end < 0:
+            end = len(self.data) - 1
+        line = self.data[self.offset:end + 1]
+        self.offset = end + 1
+        return line
+
+class TestBufferedStream(TestCase):
+    def test_read_to_boundary(self):
+        stream = BufferedStream(TrickleStream('first\r\n--boundary\r\nsecond', 3))
+        chunks = []
+        while True:
+            chunk = stream.read(4, '\r\n--boundary')
+            if chunk:
+                chunks.append(chunk)
+            else:
+                break
+
+        self.assertEqual(''.join(chunks), 'first')
+        stream.chomp(2)
+        self.assertEqual(stream.readline(), '--boundary\r\n')
+        self.assertEqual(stream.read(64), 'second')
+        self.assertRaises(ValueError, lambda: stream.chomp(1))
+
+    def test_pipe(self):
+        data = ''.join(chr(i % 256) for i in range(5000))
+        stream = BufferedStream(TrickleStream(data + '\r\n--boundary--\r\n', 7))
+
+        chunks = []
+        stream.pipe(lambda view: chunks.append(view.tobytes()), 64, '\r\n--boundary')
+        self.assertEqual(''.join(chunks), data)
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+        self.assertEqual(stream.readline(), '\r\n')
+        self.assertEqual(stream.readline(), '--boundary--\r\n')
+
+class TestMultipart(TestCase):
+    def test_parse_multipart_mixed(self):
+        attachment = ''.join(chr(i % 256) for i in range(3000)) + '\r\n--boundar'
+        body = ('--boundary\r\nContent-Disposition: inline\r\n'
+            'Content-Type: application/json\r\n\r\n{"a": 1}\r\n'
+            '--boundary\r\nContent-Disposition: attachment; name="file"\r\n\r\n'
+            '%s\r\n--boundary--\r\n' % attachment)
+
+        for size in (1, 5, 100, 4096):
+            payload = parse_multipart_mixed(TrickleStream(body, size),
+                'multipart/mixed; boundary=boundary', 16, 0)
+            self.assertEqual(payload.mimetype, 'application/json')
+            self.assertEqual(payload.payload, '{"a": 1}')
+
+            filename = payload.files['file'].filename
+            try:
+                with open(filename, 'rb') as openfile:
+                    self.assertEqual(openfile.read(), attachment)
+            finally:
+                os.unlink(filename)
+
+    def test_spooling(self):
+        body = ('--boundary\r\nContent-Disposition: inline\r\n'
+            'Content-Type: application/json\r\n\r\n{}\r\n'
+            '--boundary\r\nContent-Disposition: attachment; name="small"\r\n\r\n'
+            '%s\r\n--boundary\r\nContent-Disposition: attachment; name="large"\r\n\r\n'
+            '%s\r\n--boundary--\r\n' % ('s' * 100, 'l' * 1000))
+
+        payload = parse_multipart_mixed(TrickleStream(body, 64),
+            'multipart/mixed; boundary=boundary', 64, 500)
+        small, large = payload.files['small'], payload.files['large']
+
+        self.assertEqual(small.content, 's' * 100)
+        self.assertEqual(small.size, 100)
+        self.assertEqual(small.open().read(), 's' * 100)
+
+        self.assertIs(large.content, None)
+        self.assertEqual(large.size, 1000)
+        self.assertEqual(large.open().read(), 'l' * 1000)
+
+        filename = small.filename
+        with open(filename, 'rb') as openfile:
+            self.assertEqual(openfile.read(), 's' * 100)
+
+        spooled = [filename, large.filename]
+        payload.cleanup()
+        for filename in spooled:
+            self.assertFalse(os.path.exists(filename))
+
+        truncated = body[:body.index('l' * 1000) + 900]
+        self.assertRaises(ValueError, lambda: parse_multipart_mixed(TrickleStream(truncated, 64),
+            'multipart/mixed; boundary=boundary', 64, 500))
+
+    def test_encoder(self):
+        payload = MultipartPayload({'a': 1}, Json.mimetype)
+        for i in range(200):
+            handle, filename = mkstemp()
+            os.write(handle, chr(i) * (i * 50))
+            os.close(handle)
+            payload.attach('file%d' % i, filename)
+
+        try:
+            encoder = MultipartEncoder(payload, Json)
+            body = []
+            for chunk in encoder.iterate(1024):
+                if isinstance(chunk, memoryview):
+                    chunk = chunk.tobytes()
+                body.append(chunk)
+
+            body = ''.join(body)
+            self.assertEqual(len(body), int(encoder.headers['Content-Length']))
+
+            parsed = parse_multipart_mixed(TrickleStream(body, 4096),
+                encoder.headers['Content-Type'])
+            self.assertEqual(parsed.payload, Json.serialize({'a': 1}))
+            self.assertEqual(sorted(parsed.files), sorted(payload.files))
+
+            for name, multipart_file in parsed.files.iteritems():
+                with open(multipart_file.filename, 'rb') as openfile:
+                    self.assertEqual(openfile.read(), chr(int(name[4:])) * (int(name[4:]) * 50))
+                os.unlink(multipart_file.filename)
+        finally:
+            for multipart_file in payload.files.itervalues():
+                os.unlink(multipart_file.filename)
+
+class SleepingConnection(object):
+    parked = False
+    requests_seen = 0
+
+    class rfile(object):
+        bytes_read = 0
+
+    class wfile(object):
+        bytes_written = 0
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def communicate(self):
+        time.sleep(self.delay)
+
+    def close(self):
+        pass
+
+class PoolHarness(object):
+    def __init__(self, **params):
+        self.stats = {'Enabled': False, 'Worker Threads': {}}
+        self.requests = ThreadPool(self, **params)
+
+class TestThreadPool(TestCase):
+    def test_scaling(self):
+        pool = PoolHarness(min=2, max=6, target_wait=0.01, cooldown=0).requests
+        pool.start()
+        try:
+            for i in range(20):
+                pool.put(SleepingConnection(0.05))
+
+            time.sleep(0.02)
+            pool.scale()
+            self.assertEqual(len(pool._threads), 6)
+            wait_for(lambda: pool.busy == 6)
+
+            wait_for(lambda: pool.wait_count == 20)
+            self.assertTrue(pool.wait_time > 0)
+
+            def shrunk():
+                pool.scale()
+                return len([t for t in pool._threads if t.isAlive()]) == 2
+            wait_for(shrunk)
+        finally:
+            pool.stop(1)
+
+    def test_legacy_pool(self):
+        class LegacyPool(object):
+            def __init__(self, server):
+                self.queue = Queue()
+                self.get, self.put = self.queue.get, self.queue.put
+
+        server = PoolHarness()
+        server.requests = LegacyPool(server)
+
+        worker = WorkerThread(server)
+        worker.start()
+        try:
+            for i in range(3):
+                server.requests.put(SleepingConnection(0))
+            wait_for(lambda: server.requests.queue.empty() and worker.conn is None)
+            self.assertTrue(worker.isAlive())
+        finally:
+            server.requests.put(None)
+            worker.join(5)
+
+    def test_fixed_pool(self):
+        pool = PoolHarness(min=2).requests
+        pool.start()
+        try:
+            for i in range(4):
+                pool.put(SleepingConnection(0.05))
+            time.sleep(0.02)
+            pool.scale()
+            self.assertEqual(len(pool._threads), 2)
+        finally:
+            pool.stop(1)
+
+def wait_for(condition, timeout=10, interval=0.05):
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+        elif time.time() > deadline:
+            raise AssertionError('condition not met within %s seconds' % timeout)
+        time.sleep(interval)
+
+def hello_application(environ, start_response):
+    body = 'hello %s' % environ['PATH_INFO']
+    start_response('200 OK', [('Content-Length', str(len(body))), ('Content-Type', 'text/plain')])
+    return [body]
+
+class TestConnectionParking(TestCase):
+    def test_keepalive_parking(self):
+        server = CherryPyWSGIServer(('127.0.0.1', 0), hello_application, numthreads=2,
+            timeout=1)
+        server.park_connections = True
+
+        thread = Thread(target=server.start)
+        thread.setDaemon(True)
+        thread.start()
+        wait_for(lambda: server.ready)
+
+        try:
+            port = server.socket.getsockname()[1]
+            connections = []
+            for i in range(8):
+                connection = HTTPConnection('127.0.0.1', port, timeout=5)
+                for j in range(2):
+                    connection.request('GET', '/%d/%d' % (i, j))
+                    self.assertEqual(connection.getresponse().read(), 'hello /%d/%d' % (i, j))
+                connections.append(connection)
+
+            wait_for(lambda: server.selector.parked == 8 and server.requests.idle == 2)
+
+            connections[0].request('GET', '/again')
+            self.assertEqual(connections[0].getresponse().read(), 'hello /again')
+
+            wait_for(lambda: server.selector.parked == 0)
+        finally:
+            server.stop()
+
+def pid_application(environ, start_response):
+    body = str(os.getpid())
+    start_response('200 OK', [('Content-Length', str(len(body))), ('Content-Type', 'text/plain')])
+    return [body]
+
+class ReportingSupervisor(PreforkSupervisor):
+    """A supervisor which publishes its worker table to ``filename``, as the pids of
+    its current workers and of those it is retiring."""
+
+    def __init__(self, filename, *args, **params):
+        super(ReportingSupervisor, self).__init__(*args, **params)
+        self.filename = filename
+
+    def _reap(self):
+        super(ReportingSupervisor, self)._reap()
+        workers = sorted(set(self.children) - self.retiring)
+        with open(self.filename + '.tmp', 'w') as openfile:
+            openfile.write(json.dumps([workers, sorted(self.retiring)]))
+        os.rename(self.filename + '.tmp', self.filename)
+
+class TestPreforkSupervisor(TestCase):
+    def read_workers(self, filename):
+        try:
+            with open(filename) as openfile:
+                workers, retiring = json.loads(openfile.read())
+        except (IOError, ValueError):
+            return None
+        return set(workers), set(retiring)
+
+    def wait_for_workers(self, filename, excluded=frozenset()):
+        def settled():
+            table = self.read_workers(filename)
+            if table and len(table[0]) == 2 and not table[1] and not (table[0] & excluded):
+                return table[0]
+        return wait_for(settled)
+
+    def request_pid(self, port):
+        connection = HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', '/', headers={'Connection': 'close'})
+            return int(connection.getresponse().read())
+        finally:
+            connection.close()
+
+    def test_supervision(self):
+        server = CherryPyWSGIServer(('127.0.0.1', 0), pid_application, numthreads=1,
+            timeout=1)
+        server.listen()
+        port = server.socket.getsockname()[1]
+
+        handle, filename = mkstemp()
+        os.close(handle)
+        os.unlink(filename)
+
+        supervisor = os.fork()
+        if not supervisor:
+            try:
+                ReportingSupervisor(filename, server, 2, restart_delay=0.1).serve()
+            finally:
+                os._exit(0)
+
+        server.socket.close()
+        server.socket = None
+        try:
+            workers = self.wait_for_workers(filename)
+            self.assertIn(self.request_pid(port), workers)
+
+            crashed = workers.pop()
+            os.kill(crashed, signal.SIGKILL)
+            workers = self.wait_for_workers(filename, set([crashed]))
+            self.assertIn(self.request_pid(port), workers)
+
+            os.kill(supervisor, signal.SIGHUP)
+            replacements = self.wait_for_workers(filename, workers)
+            self.assertIn(self.request_pid(port), replacements)
+        finally:
+            os.kill(supervisor, signal.SIGTERM)
+            os.waitpid(supervisor, 0)
+            if os.path.exists(filename):
+                os.unlink(filename)